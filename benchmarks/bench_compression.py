@@ -0,0 +1,141 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from compression import DeflateCodec, DEFAULT_DICTIONARY, train_dictionary
+from protocol import FRAME_HEADER
+
+TAG_SIZE = 16
+
+GREETINGS = ["oi", "olá", "bom dia", "boa tarde", "boa noite", "e aí", "fala"]
+NAMES = ["Ana", "Bia", "Luana", "Carlos", "João", "Marina", "Pedro", "Rafa"]
+REPLIES = [
+    "tudo bem? tudo ótimo e você?", "beleza, combinado então.", "pode deixar que eu resolvo.",
+    "não consegui ver ainda, vou olhar depois.", "foi mal, tava sem sinal.", "que horas você chega?",
+    "estou saindo agora, chego em {n} minutos.", "manda o endereço por favor.", "ok, valeu!",
+    "você viu a mensagem que eu mandei?", "te mando o arquivo daqui a pouco.", "estou em reunião.",
+    "vamos almoçar hoje?", "kkkkkk verdade, também acho.", "sim, pode ser.", "obrigado pela ajuda!",
+]
+PLACES = ["no escritório", "em casa", "na padaria", "no metrô", "na academia", "no mercado"]
+
+
+def chat_message(rng):
+    # Conversas curtas: saudação, nome, resposta comum e às vezes um complemento
+    parts = []
+    if rng.random() < 0.4:
+        parts.append(f"{rng.choice(GREETINGS)} {rng.choice(NAMES)},")
+    parts.append(rng.choice(REPLIES).format(n=rng.randint(2, 40)))
+    if rng.random() < 0.3:
+        parts.append(f"estou {rng.choice(PLACES)}.")
+    if rng.random() < 0.1:
+        parts.append(rng.choice(REPLIES).format(n=rng.randint(2, 40)))
+    return " ".join(parts).encode("utf-8")
+
+
+def notification_message(rng):
+    # Mensagens de sistema/bots: JSON com campos fixos e valores variáveis
+    kind = rng.choice(["pedido", "pagamento", "entrega", "alerta"])
+    body = {
+        "tipo": kind,
+        "id": f"{rng.getrandbits(48):012x}",
+        "status": rng.choice(["confirmado", "enviado", "pendente", "concluído"]),
+        "valor": round(rng.uniform(5, 500), 2),
+        "texto": {
+            "pedido": "o pedido foi enviado e chega em dois dias úteis.",
+            "pagamento": "pagamento confirmado.",
+            "entrega": "sua entrega saiu para entrega.",
+            "alerta": "alerta: uso de CPU acima do limite no servidor",
+        }[kind],
+        "timestamp": 1_700_000_000 + rng.randint(0, 10_000_000),
+    }
+    return json.dumps(body, ensure_ascii=False).encode("utf-8")
+
+
+def build_corpus(count, seed):
+    rng = random.Random(seed)
+    return [
+        notification_message(rng) if rng.random() < 0.25 else chat_message(rng)
+        for _ in range(count)
+    ]
+
+
+def measure(codec, corpus, rounds):
+    packed = [codec.pack(message) for message in corpus]
+    # A comparação confirma a ida e volta antes de medir
+    for message, data in zip(corpus, packed):
+        assert codec.unpack(data) == message
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for message in corpus:
+            codec.pack(message)
+    pack_time = (time.perf_counter() - start) / (rounds * len(corpus))
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for data in packed:
+            codec.unpack(data)
+    unpack_time = (time.perf_counter() - start) / (rounds * len(corpus))
+
+    return sum(len(data) for data in packed), pack_time, unpack_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Razão e custo da compressão por mensagem")
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--threshold", type=int, default=32)
+    parser.add_argument("--level", type=int, default=6)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    # O dicionário é treinado num corpus e medido em outro, gerado com outra semente
+    training = build_corpus(args.messages, args.seed)
+    corpus = build_corpus(args.messages, args.seed + 1)
+    trained = train_dictionary(training)
+
+    raw_bytes = sum(len(message) for message in corpus)
+    # Bytes por frame no fio: cabeçalho + texto cifrado + tag
+    overhead = FRAME_HEADER.size + TAG_SIZE
+    print(
+        f"{len(corpus)} mensagens, média {raw_bytes / len(corpus):.0f} B; "
+        f"dicionário treinado: {len(trained)} B"
+    )
+    print(
+        f"{'codec':>19} {'razão':>7} {'B/msg':>7} {'B/frame':>8} "
+        f"{'µs pack':>8} {'µs unpack':>10}"
+    )
+    print(
+        f"{'sem compressão':>19} {1.0:>7.3f} {raw_bytes / len(corpus):>7.1f} "
+        f"{raw_bytes / len(corpus) + overhead:>8.1f} {0.0:>8.2f} {0.0:>10.2f}"
+    )
+
+    cases = [
+        ("sem dicionário", b''),
+        ("dicionário padrão", DEFAULT_DICTIONARY),
+        ("dicionário treinado", trained),
+    ]
+    for label, dictionary in cases:
+        codec = DeflateCodec(dictionary, level=args.level, threshold=args.threshold)
+        total, pack_time, unpack_time = measure(codec, corpus, args.rounds)
+        per_message = total / len(corpus)
+        print(
+            f"{label:>19} {total / raw_bytes:>7.3f} {per_message:>7.1f} {per_message + overhead:>8.1f} "
+            f"{pack_time * 1e6:>8.2f} {unpack_time * 1e6:>10.2f}"
+        )
+
+    # Dados já comprimidos/aleatórios: o codec deve cair no envio cru (1 byte a mais)
+    codec = DeflateCodec(DEFAULT_DICTIONARY, level=args.level, threshold=args.threshold)
+    noise = [os.urandom(256) for _ in range(1000)]
+    total, pack_time, _ = measure(codec, noise, args.rounds)
+    print(f"{'aleatório 256 B':>19} {total / (256 * len(noise)):>7.3f} {total / len(noise):>7.1f} "
+          f"{total / len(noise) + overhead:>8.1f} {pack_time * 1e6:>8.2f} {'-':>10}")
+
+
+if __name__ == "__main__":
+    main()
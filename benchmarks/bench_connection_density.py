@@ -0,0 +1,140 @@
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from loadgen import raise_fd_limit, read_rss, run_server
+
+def run_clients(worker, port, cert_path, counts, concurrency, step, done):
+    # Abre as conexões em degraus e espera o coordenador medir cada um
+    logging.disable(logging.CRITICAL)
+    raise_fd_limit()
+    from client import SecureMessagingClient
+
+    async def hold():
+        clients = []
+        semaphore = asyncio.Semaphore(concurrency)
+        failures = 0
+
+        async def connect(index):
+            nonlocal failures
+            client = SecureMessagingClient(f"idle{worker}-{index}", server_port=port, server_cert_path=cert_path)
+            async with semaphore:
+                if await client.connect():
+                    clients.append(client)
+                else:
+                    failures += 1
+
+        opened = 0
+        for count in counts:
+            await asyncio.gather(*(connect(i) for i in range(opened, count)))
+            opened = count
+            # Deixa os últimos frames de handshake assentarem no servidor
+            await asyncio.sleep(1.0)
+            done.put((len(clients), failures))
+            await asyncio.get_running_loop().run_in_executor(None, step.wait)
+            step.clear()
+
+        for client in clients:
+            client.writer.close()
+
+    asyncio.run(hold())
+
+def measure(engine, wire_format, total, steps, workers, concurrency, cert_dir):
+    ctx = multiprocessing.get_context("spawn")
+    ready, done = ctx.Queue(), ctx.Queue()
+    stop = ctx.Event()
+    options = {
+        "transport_engine": engine,
+        # Conexões ociosas de propósito: sem heartbeat nem encerramento por ociosidade
+        "idle_timeout": 0,
+        "heartbeat_interval": 0,
+        "wire_formats": (wire_format,),
+    }
+    server = ctx.Process(target=run_server, args=(options, cert_dir, ready, stop))
+    server.start()
+
+    rows = []
+    try:
+        port = ready.get(timeout=60)
+        time.sleep(0.5)
+        rss_base, _ = read_rss(server.pid)
+
+        per_worker = [int(total * (i + 1) / steps / workers) for i in range(steps)]
+        step_events = [ctx.Event() for _ in range(workers)]
+        loaders = [
+            ctx.Process(
+                target=run_clients,
+                args=(w, port, os.path.join(cert_dir, "server.crt"), per_worker, concurrency, step_events[w], done)
+            )
+            for w in range(workers)
+        ]
+        for p in loaders:
+            p.start()
+
+        for _ in range(steps):
+            reports = [done.get(timeout=3600) for _ in loaders]
+            connections = sum(r[0] for r in reports)
+            rss, _ = read_rss(server.pid)
+            per_connection = (rss - rss_base) * 1024 / connections if connections else 0.0
+            rows.append((connections, rss, per_connection, sum(r[1] for r in reports)))
+            for event in step_events:
+                event.set()
+
+        for p in loaders:
+            p.join()
+    finally:
+        stop.set()
+        server.join(timeout=10)
+        if server.is_alive():
+            server.terminate()
+    return rss_base, rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Memória do servidor por conexão autenticada ociosa")
+    parser.add_argument("--connections", type=int, default=8000)
+    parser.add_argument("--steps", type=int, default=4, help="degraus de medição até --connections")
+    parser.add_argument("--engines", nargs="+", default=["protocol", "streams"])
+    parser.add_argument("--wire-format", type=int, default=1)
+    parser.add_argument("--load-procs", type=int, default=1)
+    parser.add_argument("--connect-concurrency", type=int, default=64)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    with tempfile.TemporaryDirectory() as cert_dir:
+        # Gera o par RSA uma vez para todos os cenários
+        from server import SecureMessagingServer
+        SecureMessagingServer(
+            cert_path=os.path.join(cert_dir, "server.crt"),
+            key_path=os.path.join(cert_dir, "server.key"),
+            handshake_executor="inline"
+        )
+
+        print(f"{'engine':>9} {'conexões':>9} {'RSS MiB':>9} {'bytes/conexão':>14} {'falhas':>7}")
+        projections = []
+        for engine in args.engines:
+            rss_base, rows = measure(
+                engine, args.wire_format, args.connections, args.steps,
+                args.load_procs, args.connect_concurrency, cert_dir
+            )
+            print(f"{engine:>9} {0:>9} {rss_base / 1024:>9.1f} {'-':>14} {'-':>7}")
+            for connections, rss, per_connection, failures in rows:
+                print(f"{engine:>9} {connections:>9} {rss / 1024:>9.1f} {per_connection:>14.0f} {failures:>7}")
+            # Custo marginal do último degrau: dilui o que é fixo no processo
+            (first, first_rss, _, _), (last, last_rss, _, _) = rows[0], rows[-1]
+            marginal = (last_rss - first_rss) * 1024 / (last - first) if last > first else rows[-1][2]
+            projections.append((engine, marginal, rss_base * 1024 + marginal * 100_000))
+
+        print(f"\n{'engine':>9} {'bytes/conexão (marginal)':>25} {'RSS p/ 100k sessões':>20}")
+        for engine, marginal, projected in projections:
+            print(f"{engine:>9} {marginal:>25.0f} {projected / 2**20:>16.0f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from protocol import MessageCrypto, FRAME_HEADER
+from crypto import AESGCMCipher
+from crypto_pool import CryptoPool
+
+TAG_SIZE = 16
+MiB = 1024 * 1024
+
+
+def mixed_sizes(count, large_share, large_size, small_size, seed):
+    rng = random.Random(seed)
+    return [large_size if rng.random() < large_share else small_size for _ in range(count)]
+
+
+async def pool_throughput(workers, sizes, threshold):
+    # Só a cifra: workers = 0 cifra tudo no event loop
+    cipher = AESGCMCipher(os.urandom(16))
+    payloads = {size: os.urandom(size) for size in set(sizes)}
+    sender_id, recipient_id = os.urandom(16), os.urandom(16)
+    pool = CryptoPool(workers, threshold) if workers > 0 else None
+
+    start = time.perf_counter()
+    pending = []
+    for seq_no, size in enumerate(sizes):
+        args = (cipher, sender_id, recipient_id, seq_no, payloads[size])
+        if pool is not None and pool.offload(size):
+            pending.append(pool.submit(MessageCrypto.encrypt_message, *args))
+            # Até 2 frames por thread em voo, como várias sessões ao mesmo tempo
+            if len(pending) >= 2 * workers:
+                await pending.pop(0)
+        else:
+            MessageCrypto.encrypt_message(*args)
+    for future in pending:
+        await future
+    elapsed = time.perf_counter() - start
+
+    if pool is not None:
+        pool.shutdown()
+    return elapsed
+
+
+def run_server(cert_dir, crypto_workers, threshold, ready, stop):
+    logging.disable(logging.CRITICAL)
+    from server import SecureMessagingServer
+
+    async def serve():
+        server = SecureMessagingServer(
+            cert_path=os.path.join(cert_dir, "server.crt"),
+            key_path=os.path.join(cert_dir, "server.key"),
+            handshake_executor="inline",
+            overflow_policy="backpressure",
+            crypto_workers=crypto_workers,
+            crypto_offload_threshold=threshold
+        )
+        listener = await asyncio.start_server(server.handle_client, "127.0.0.1", 0)
+        ready.put(listener.sockets[0].getsockname()[1])
+
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, stop.wait)
+        listener.close()
+        await server.shutdown()
+
+    asyncio.run(serve())
+
+
+async def run_load(port, cert_path, pairs, sizes):
+    from client import SecureMessagingClient
+
+    senders, receivers = [], []
+    for i in range(pairs):
+        for group in (senders, receivers):
+            client = SecureMessagingClient(f"c{i}", server_port=port, server_cert_path=cert_path)
+            if not await client.connect():
+                raise RuntimeError("Falha ao conectar")
+            group.append(client)
+
+    # Frames cifrados de antemão e receptores que só contam bytes: a carga mede o servidor
+    payloads = {size: os.urandom(size) for size in set(sizes)}
+    streams = []
+    for sender, receiver in zip(senders, receivers):
+        parts = []
+        for seq_no, size in enumerate(sizes):
+            frame = MessageCrypto.encrypt_message(
+                sender.cipher_c2s, sender.client_id, receiver.client_id, seq_no, payloads[size]
+            )
+            parts.extend(frame.to_wire_parts())
+        streams.append(b''.join(parts))
+
+    expected = sum(FRAME_HEADER.size + size + TAG_SIZE for size in sizes)
+
+    async def consume(receiver):
+        remaining = expected
+        while remaining > 0:
+            data = await receiver.reader.read(1024 * 1024)
+            if not data:
+                raise RuntimeError("Conexão encerrada antes do fim")
+            remaining -= len(data)
+
+    async def blast(sender, data):
+        for offset in range(0, len(data), 1024 * 1024):
+            sender.writer.write(data[offset:offset + 1024 * 1024])
+            await sender.writer.drain()
+
+    start = time.perf_counter()
+    await asyncio.gather(
+        *(consume(r) for r in receivers),
+        *(blast(s, d) for s, d in zip(senders, streams))
+    )
+    elapsed = time.perf_counter() - start
+
+    for client in senders + receivers:
+        client.writer.close()
+    return elapsed
+
+
+def run_case(crypto_workers, threshold, pairs, sizes, cert_dir):
+    ctx = multiprocessing.get_context("spawn")
+    ready, stop = ctx.Queue(), ctx.Event()
+    server = ctx.Process(target=run_server, args=(cert_dir, crypto_workers, threshold, ready, stop))
+    server.start()
+    try:
+        port = ready.get(timeout=60)
+        return asyncio.run(run_load(port, os.path.join(cert_dir, "server.crt"), pairs, sizes))
+    finally:
+        stop.set()
+        server.join(timeout=10)
+        if server.is_alive():
+            server.terminate()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vazão com o pool de criptografia por número de threads")
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, 1, 2, 4, 8])
+    parser.add_argument("--messages", type=int, default=2000, help="mensagens por par (ou total no teste do pool)")
+    parser.add_argument("--pairs", type=int, default=4)
+    parser.add_argument("--large", type=int, default=256 * 1024, help="tamanho dos payloads grandes")
+    parser.add_argument("--small", type=int, default=256, help="tamanho dos payloads pequenos")
+    parser.add_argument("--large-share", type=float, default=0.2)
+    parser.add_argument("--threshold", type=int, default=64 * 1024)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    print(f"{os.cpu_count()} núcleos; {args.large_share:.0%} dos payloads com {args.large} B, o resto com {args.small} B")
+
+    sizes = mixed_sizes(args.messages, args.large_share, args.large, args.small, seed=1)
+    volume = sum(sizes)
+
+    print("\nSó a cifra (CryptoPool)")
+    print(f"{'threads':>8} {'msg/s':>10} {'MiB/s':>8}")
+    for workers in args.workers:
+        elapsed = asyncio.run(pool_throughput(workers, sizes, args.threshold))
+        print(f"{workers:>8} {len(sizes) / elapsed:>10.0f} {volume / MiB / elapsed:>8.1f}")
+
+    print(f"\nServidor ponta a ponta ({args.pairs} pares)")
+    print(f"{'threads':>8} {'msg/s':>10} {'MiB/s':>8}")
+    with tempfile.TemporaryDirectory() as cert_dir:
+        for workers in args.workers:
+            elapsed = run_case(workers, args.threshold, args.pairs, sizes, cert_dir)
+            total = args.pairs * len(sizes)
+            print(f"{workers:>8} {total / elapsed:>10.0f} {args.pairs * volume / MiB / elapsed:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+import argparse
+import asyncio
+import os
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from protocol import MessageFrame
+from framing import FrameDecoder, StreamFrameReader
+
+
+PAYLOAD_SIZES = [64, 1024, 16 * 1024]
+CHUNK_SIZE = 64 * 1024
+
+
+@dataclass
+class LegacyFrame:
+    nonce: bytes
+    sender_id: bytes
+    recipient_id: bytes
+    seq_no: int
+    ciphertext_with_tag: bytes
+
+
+def legacy_parse(data):
+    # Caminho antigo: _parse_frame_with_size sobre header + tamanho + corpo concatenados
+    return LegacyFrame(
+        nonce=data[0:12],
+        sender_id=data[12:28],
+        recipient_id=data[28:44],
+        seq_no=int.from_bytes(data[44:52], 'big'),
+        ciphertext_with_tag=data[56:]
+    )
+
+
+async def legacy_read(reader, count, copied):
+    for _ in range(count):
+        header = await reader.readexactly(52)
+        size_data = await reader.readexactly(4)
+        size = int.from_bytes(size_data, 'big')
+        body = await reader.readexactly(size)
+        frame_data = header + size_data + body
+        legacy_parse(frame_data)
+        # readexactly x3, concatenação e fatias (12+16+16+8 + corpo)
+        copied[0] += 56 + size + len(frame_data) + 52 + size
+
+
+async def decoder_read(reader, count, copied):
+    source = StreamFrameReader(reader)
+    decoder = source.decoder
+    received = 0
+    while received < count:
+        frames = await source.read_frames()
+        received += len(frames)
+    # Cópia do StreamReader para o bloco lido + cópias do decoder + ids do cabeçalho
+    copied[0] += decoder.bytes_received + decoder.bytes_copied + 44 * received
+
+
+def build_stream(payload_size, count):
+    frame = MessageFrame(
+        os.urandom(12), os.urandom(16), os.urandom(16), 0, os.urandom(payload_size)
+    )
+    return b''.join(frame.to_wire_parts()) * count
+
+
+def run_stream(read, blob, count):
+    async def run():
+        reader = asyncio.StreamReader(limit=2 ** 30)
+        for offset in range(0, len(blob), CHUNK_SIZE):
+            reader.feed_data(blob[offset:offset + CHUNK_SIZE])
+        reader.feed_eof()
+        copied = [0]
+        start = time.perf_counter()
+        await read(reader, count, copied)
+        return count / (time.perf_counter() - start), copied[0] / count
+
+    return asyncio.run(run())
+
+
+def retained_per_frame(parse_all, blob, count):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    frames = parse_all(blob)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    assert len(frames) == count
+    stats = after.compare_to(before, "filename")
+    size = sum(s.size_diff for s in stats)
+    blocks = sum(s.count_diff for s in stats)
+    return size / count, blocks / count
+
+
+def legacy_parse_all(blob):
+    frames = []
+    offset = 0
+    while offset < len(blob):
+        size = int.from_bytes(blob[offset + 52:offset + 56], 'big')
+        end = offset + 56 + size
+        frames.append(legacy_parse(blob[offset:end]))
+        offset = end
+    return frames
+
+
+def decoder_parse_all(blob):
+    # Buffer do tamanho exato: mede os frames, não a folga de crescimento
+    return FrameDecoder(buffer_size=len(blob)).feed(blob)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parsing de frames: readexactly + concatenação vs. FrameDecoder")
+    parser.add_argument("--frames", type=int, default=100000)
+    args = parser.parse_args()
+
+    print(f"{'payload':>8} {'caminho':>10} {'frames/s':>10} {'bytes copiados/frame':>21} "
+          f"{'bytes retidos/frame':>20} {'alocações/frame':>16}")
+    for size in PAYLOAD_SIZES:
+        count = max(1000, args.frames * 64 // max(size, 64))
+        blob = build_stream(size, count)
+        for label, read, parse_all in (
+            ("antigo", legacy_read, legacy_parse_all),
+            ("decoder", decoder_read, decoder_parse_all),
+        ):
+            rate, copied = run_stream(read, blob, count)
+            retained, blocks = retained_per_frame(parse_all, blob, count)
+            print(f"{size:>8} {label:>10} {rate:>10.0f} {copied:>21.0f} {retained:>20.0f} {blocks:>16.2f}")
+
+
+if __name__ == "__main__":
+    main()
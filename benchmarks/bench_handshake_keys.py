@@ -0,0 +1,103 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from cryptography.hazmat.primitives import serialization
+
+from crypto import RSASignature, PublicKeyMaterial, ServerTrust
+from protocol import ClientHandshake, ServerHandshake, HandshakeResponse
+
+
+def measure(fn, duration):
+    count = 0
+    start = time.perf_counter()
+    deadline = start + duration
+    while time.perf_counter() < deadline:
+        fn()
+        count += 1
+    return (time.perf_counter() - start) / count
+
+
+def key_costs(duration, cert_path):
+    rsa = RSASignature()
+    with open(cert_path, 'wb') as f:
+        f.write(rsa.get_public_key_pem())
+    pem = rsa.get_public_key_pem()
+    data = os.urandom(113)
+    signature = rsa.sign(data)
+    material = PublicKeyMaterial.from_file(cert_path)
+    pinned = ServerTrust(pins=[material.fingerprint])
+
+    def read_and_verify():
+        # Como era: certificado lido do disco e PEM carregado a cada conexão
+        with open(cert_path, 'rb') as f:
+            assert RSASignature.verify(f.read(), signature, data)
+
+    def serialize_certificate():
+        # Como era no servidor: public_bytes a cada resposta de handshake
+        rsa.public_key.public_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PublicFormat.SubjectPublicKeyInfo
+        )
+
+    return [
+        ("cliente: lê arquivo + carrega PEM + verifica", measure(read_and_verify, duration)),
+        ("cliente: carrega PEM + verifica", measure(lambda: RSASignature.verify(pem, signature, data), duration)),
+        ("cliente: PublicKeyMaterial.verify", measure(lambda: material.verify(signature, data), duration)),
+        ("cliente: fixação (ServerTrust em cache)", measure(lambda: pinned.key_for(pem).verify(signature, data), duration)),
+        ("servidor: serializa certificado", measure(serialize_certificate, duration)),
+        ("servidor: key_material.pem", measure(lambda: rsa.key_material.pem, duration)),
+    ]
+
+
+def handshake_costs(duration, cert_path):
+    # Handshake completo em processo (RSA-PSS + ECDHE + HKDF nos dois lados)
+    server = ServerHandshake(RSASignature())
+    with open(cert_path, 'wb') as f:
+        f.write(server.rsa.get_public_key_pem())
+    trust = ServerTrust(PublicKeyMaterial.from_file(cert_path))
+    client_id = os.urandom(16)
+
+    def roundtrip(server_key):
+        client = ClientHandshake(client_id)
+        pk = client.get_initial_message()[16:]
+        ecdhe = server.new_key_exchange()
+        response = server.generate_handshake_response(client_id, pk, ecdhe)
+        server.derive_session_secrets(pk, response.salt, ecdhe)
+        client.process_handshake_response(HandshakeResponse.from_bytes(response.to_bytes()), server_key())
+
+    def from_file():
+        with open(cert_path, 'rb') as f:
+            return f.read()
+
+    return (
+        measure(lambda: roundtrip(from_file), duration),
+        measure(lambda: roundtrip(lambda: trust), duration),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Custo do material de chave no handshake")
+    parser.add_argument("--duration", type=float, default=2.0, help="segundos por medição")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as cert_dir:
+        cert_path = os.path.join(cert_dir, "server.crt")
+
+        print(f"{'operação':>46} {'µs':>9}")
+        for label, cost in key_costs(args.duration, cert_path):
+            print(f"{label:>46} {cost * 1e6:>9.2f}")
+
+        before, after = handshake_costs(args.duration, cert_path)
+        print(f"\n{'handshake completo (CPU)':>46} {'µs':>9}")
+        print(f"{'certificado do disco a cada conexão':>46} {before * 1e6:>9.1f}")
+        print(f"{'ServerTrust carregado uma vez':>46} {after * 1e6:>9.1f}")
+        print(f"{'economia':>46} {(before - after) / before:>9.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from protocol import ClientHandshake, HandshakeResponse, MessageCrypto, MessageFrame
+
+
+def run_server(port_queue, cert_dir, executor_kind, workers):
+    logging.disable(logging.CRITICAL)
+    from server import SecureMessagingServer
+
+    async def serve():
+        server = SecureMessagingServer(
+            cert_path=os.path.join(cert_dir, "server.crt"),
+            key_path=os.path.join(cert_dir, "server.key"),
+            handshake_executor=executor_kind,
+            handshake_workers=workers
+        )
+        listener = await asyncio.start_server(server.handle_client, "127.0.0.1", 0)
+        port_queue.put(listener.sockets[0].getsockname()[1])
+
+        # SIGTERM encerra o pool de handshake junto com o servidor
+        stop = asyncio.Event()
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+        await stop.wait()
+        listener.close()
+        server.handshake_engine.shutdown()
+
+    asyncio.run(serve())
+
+
+async def full_handshake(port, certificate_pem):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    try:
+        handshake = ClientHandshake(os.urandom(16))
+        writer.write(handshake.get_initial_message())
+        await writer.drain()
+        size = int.from_bytes(await reader.readexactly(4), 'big')
+        response = HandshakeResponse.from_bytes(await reader.readexactly(size))
+        handshake.process_handshake_response(response, certificate_pem)
+    finally:
+        writer.close()
+
+
+def run_flood(port, cert_path, concurrency, duration, result_queue):
+    logging.disable(logging.CRITICAL)
+    with open(cert_path, 'rb') as f:
+        certificate_pem = f.read()
+
+    async def flood():
+        done = 0
+        errors = 0
+        deadline = time.perf_counter() + duration
+
+        async def worker():
+            nonlocal done, errors
+            while time.perf_counter() < deadline:
+                try:
+                    await full_handshake(port, certificate_pem)
+                    done += 1
+                except Exception:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        result_queue.put((done, errors, time.perf_counter() - start))
+
+    asyncio.run(flood())
+
+
+async def probe_routing_latency(port, cert_path, duration, interval):
+    from client import SecureMessagingClient
+
+    alice = SecureMessagingClient("alice", server_port=port, server_cert_path=cert_path)
+    bob = SecureMessagingClient("bob", server_port=port, server_cert_path=cert_path)
+    if not (await alice.connect() and await bob.connect()):
+        raise RuntimeError("Probe não conseguiu conectar")
+
+    latencies = []
+
+    async def receiver():
+        while True:
+            header = await bob.reader.readexactly(56)
+            body = await bob.reader.readexactly(int.from_bytes(header[52:56], 'big'))
+            frame = MessageFrame(
+                header[0:12], header[12:28], header[28:44],
+                int.from_bytes(header[44:52], 'big'), body
+            )
+            plaintext = MessageCrypto.decrypt_message(bob.cipher_s2c, frame)
+            sent_at = float(plaintext.decode())
+            latencies.append(time.perf_counter() - sent_at)
+
+    receive_task = asyncio.create_task(receiver())
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        await alice.send_message("bob", bob.client_id, repr(time.perf_counter()))
+        await asyncio.sleep(interval)
+    await asyncio.sleep(0.5)
+    receive_task.cancel()
+    return latencies
+
+
+def percentile(values, fraction):
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run_case(cert_dir, executor_kind, workers, concurrency, duration, interval):
+    ctx = multiprocessing.get_context("spawn")
+    port_queue = ctx.Queue()
+    server = ctx.Process(
+        target=run_server, args=(port_queue, cert_dir, executor_kind, workers)
+    )
+    server.start()
+    port = port_queue.get(timeout=30)
+    cert_path = os.path.join(cert_dir, "server.crt")
+
+    try:
+        baseline = asyncio.run(probe_routing_latency(port, cert_path, min(duration, 2.0), interval))
+
+        result_queue = ctx.Queue()
+        flood = ctx.Process(
+            target=run_flood, args=(port, cert_path, concurrency, duration, result_queue), daemon=True
+        )
+        flood.start()
+        under_load = asyncio.run(probe_routing_latency(port, cert_path, duration, interval))
+        done, errors, elapsed = result_queue.get(timeout=duration + 60)
+        flood.join()
+    finally:
+        server.terminate()
+        server.join()
+
+    return {
+        "executor": executor_kind,
+        "handshakes_per_sec": done / elapsed,
+        "handshake_errors": errors,
+        "idle_p50_ms": percentile(baseline, 0.50) * 1000,
+        "idle_p99_ms": percentile(baseline, 0.99) * 1000,
+        "storm_p50_ms": percentile(under_load, 0.50) * 1000,
+        "storm_p99_ms": percentile(under_load, 0.99) * 1000,
+        "storm_mean_ms": statistics.fmean(under_load) * 1000 if under_load else float("nan"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Handshakes/s e latência p99 de roteamento durante uma tempestade de handshakes")
+    parser.add_argument("--executor", nargs="+", default=["inline", "thread", "process"])
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--concurrency", type=int, default=64, help="handshakes simultâneos do gerador")
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--interval", type=float, default=0.005, help="intervalo entre mensagens da sonda")
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    with tempfile.TemporaryDirectory() as cert_dir:
+        # Gera o par RSA uma vez para todos os cenários
+        from server import SecureMessagingServer
+        SecureMessagingServer(
+            cert_path=os.path.join(cert_dir, "server.crt"),
+            key_path=os.path.join(cert_dir, "server.key"),
+            handshake_executor="inline"
+        )
+
+        print(f"{'executor':>8} {'hs/s':>8} {'erros':>6} {'p99 ocioso':>11} {'p50 storm':>10} {'p99 storm':>10}")
+        for kind in args.executor:
+            r = run_case(cert_dir, kind, args.workers, args.concurrency, args.duration, args.interval)
+            print(
+                f"{r['executor']:>8} {r['handshakes_per_sec']:>8.0f} {r['handshake_errors']:>6} "
+                f"{r['idle_p99_ms']:>9.2f}ms {r['storm_p50_ms']:>8.2f}ms {r['storm_p99_ms']:>8.2f}ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
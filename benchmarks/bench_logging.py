@@ -0,0 +1,167 @@
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from protocol import MessageCrypto, FRAME_HEADER
+
+TAG_SIZE = 16
+
+# modo: (amostragem, texto claro no log, escritor em thread)
+MODES = {
+    "completo": (1, True, False),
+    "síncrono": (1, False, False),
+    "assíncrono": (1, False, True),
+    "amostrado": (100, False, True),
+}
+
+
+def process_cpu_seconds(pid):
+    # utime + stime do processo do servidor (Linux)
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def run_server(mode, cert_dir, log_path, ready, stop):
+    from server import SecureMessagingServer
+    from eventlog import start_async_logging, stop_async_logging
+
+    sample_every, log_plaintext, asynchronous = MODES[mode]
+    logging.basicConfig(
+        level=logging.INFO,
+        filename=log_path,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        force=True
+    )
+    if asynchronous:
+        start_async_logging()
+
+    async def serve():
+        server = SecureMessagingServer(
+            cert_path=os.path.join(cert_dir, "server.crt"),
+            key_path=os.path.join(cert_dir, "server.key"),
+            handshake_executor="inline",
+            # Sem descarte na fila de saída: os receptores esperam todos os frames
+            overflow_policy="backpressure",
+            enable_metrics=False,
+            log_sample_every=sample_every,
+            log_plaintext=log_plaintext
+        )
+        listener = await asyncio.start_server(server.handle_client, "127.0.0.1", 0)
+        ready.put(listener.sockets[0].getsockname()[1])
+
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, stop.wait)
+        listener.close()
+        await server.shutdown()
+
+    asyncio.run(serve())
+    stop_async_logging()
+
+
+async def run_load(server_pid, port, cert_path, pairs, frames_per_pair, payload_size):
+    from client import SecureMessagingClient
+
+    senders, receivers = [], []
+    for i in range(pairs):
+        for group in (senders, receivers):
+            client = SecureMessagingClient(f"c{i}", server_port=port, server_cert_path=cert_path)
+            if not await client.connect():
+                raise RuntimeError("Falha ao conectar")
+            group.append(client)
+
+    # Frames cifrados de antemão e receptores que só contam bytes: a carga mede o servidor
+    payload = os.urandom(payload_size)
+    streams = []
+    for sender, receiver in zip(senders, receivers):
+        parts = []
+        for seq in range(frames_per_pair):
+            frame = MessageCrypto.encrypt_message(
+                sender.cipher_c2s, sender.client_id, receiver.client_id, seq, payload
+            )
+            parts.extend(frame.to_wire_parts())
+        streams.append(b''.join(parts))
+
+    expected = frames_per_pair * (FRAME_HEADER.size + payload_size + TAG_SIZE)
+
+    async def consume(receiver):
+        remaining = expected
+        while remaining > 0:
+            data = await receiver.reader.read(256 * 1024)
+            if not data:
+                raise RuntimeError("Conexão encerrada antes do fim")
+            remaining -= len(data)
+
+    async def blast(sender, data):
+        for offset in range(0, len(data), 256 * 1024):
+            sender.writer.write(data[offset:offset + 256 * 1024])
+            await sender.writer.drain()
+
+    cpu_start = process_cpu_seconds(server_pid)
+    start = time.perf_counter()
+    await asyncio.gather(
+        *(consume(r) for r in receivers),
+        *(blast(s, d) for s, d in zip(senders, streams))
+    )
+    wall = time.perf_counter() - start
+    cpu = process_cpu_seconds(server_pid) - cpu_start
+
+    for client in senders + receivers:
+        client.writer.close()
+    return wall, cpu
+
+
+def run_case(mode, pairs, frames_per_pair, payload_size, cert_dir):
+    log_path = os.path.join(cert_dir, "server.log")
+    ctx = multiprocessing.get_context("spawn")
+    ready, stop = ctx.Queue(), ctx.Event()
+    server = ctx.Process(target=run_server, args=(mode, cert_dir, log_path, ready, stop))
+    server.start()
+    try:
+        port = ready.get(timeout=60)
+        wall, cpu = asyncio.run(run_load(
+            server.pid, port, os.path.join(cert_dir, "server.crt"),
+            pairs, frames_per_pair, payload_size
+        ))
+    finally:
+        stop.set()
+        server.join(timeout=10)
+        if server.is_alive():
+            server.terminate()
+
+    log_bytes = os.path.getsize(log_path)
+    os.remove(log_path)
+    return wall, cpu, log_bytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vazão do servidor com log completo, assíncrono e amostrado")
+    parser.add_argument("--pairs", type=int, default=4)
+    parser.add_argument("--frames", type=int, default=25000, help="frames por par remetente/destinatário")
+    parser.add_argument("--payload", type=int, default=64)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    total = args.pairs * args.frames
+
+    with tempfile.TemporaryDirectory() as cert_dir:
+        print(f"{'modo':>11} {'msg/s':>10} {'µs CPU/msg':>11} {'log (MiB)':>10}")
+        for mode in MODES:
+            runs = [run_case(mode, args.pairs, args.frames, args.payload, cert_dir) for _ in range(args.repeat)]
+            wall = statistics.median(r[0] for r in runs)
+            cpu = statistics.median(r[1] for r in runs)
+            log_bytes = statistics.median(r[2] for r in runs)
+            print(f"{mode:>11} {total / wall:>10.0f} {cpu / total * 1e6:>11.2f} {log_bytes / 2 ** 20:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from protocol import MessageCrypto, MessageFrame
+from crypto import generate_nonce, int_to_bytes
+
+
+PAYLOAD_SIZES = [64, 1024, 64 * 1024]
+
+
+def legacy_encrypt_message(key, sender_id, recipient_id, seq_no, plaintext):
+    # Caminho antigo: um AESGCM novo (key schedule) por chamada
+    nonce = generate_nonce()
+    aad = sender_id + recipient_id + int_to_bytes(seq_no, 8)
+    ciphertext_with_tag = AESGCM(key).encrypt(nonce, plaintext, aad)
+    return MessageFrame(nonce, sender_id, recipient_id, seq_no, ciphertext_with_tag)
+
+
+def legacy_decrypt_message(key, frame):
+    aad = frame.sender_id + frame.recipient_id + int_to_bytes(frame.seq_no, 8)
+    return AESGCM(key).decrypt(frame.nonce, frame.ciphertext_with_tag, aad)
+
+
+def run_roundtrip(encrypt, decrypt, enc_key, dec_key, payload, duration):
+    sender_id = os.urandom(16)
+    recipient_id = os.urandom(16)
+    seq = 0
+    start = time.perf_counter()
+    deadline = start + duration
+    while True:
+        for _ in range(64):
+            frame = encrypt(enc_key, sender_id, recipient_id, seq, payload)
+            decrypt(dec_key, frame)
+            seq += 1
+        if time.perf_counter() >= deadline:
+            break
+    return seq / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mensagens/s de MessageCrypto (cifra por mensagem vs. contexto cacheado)")
+    parser.add_argument("--duration", type=float, default=1.0, help="segundos por medição")
+    args = parser.parse_args()
+
+    key = os.urandom(16)
+    cipher, _ = MessageCrypto.session_ciphers(key, os.urandom(16))
+
+    print(f"{'payload':>10} {'antes (msg/s)':>15} {'depois (msg/s)':>15} {'ganho':>8}")
+    for size in PAYLOAD_SIZES:
+        payload = os.urandom(size)
+        before = run_roundtrip(
+            legacy_encrypt_message, legacy_decrypt_message, key, key, payload, args.duration
+        )
+        after = run_roundtrip(
+            MessageCrypto.encrypt_message, MessageCrypto.decrypt_message, cipher, cipher, payload, args.duration
+        )
+        print(f"{size:>10} {before:>15.0f} {after:>15.0f} {after / before:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from protocol import MessageCrypto, FRAME_HEADER
+from metrics import Histogram
+
+TAG_SIZE = 16
+
+
+def process_cpu_seconds(pid):
+    # utime + stime do processo do servidor (Linux)
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def run_server(enable_metrics, cert_dir, ready, stop):
+    logging.disable(logging.CRITICAL)
+    from server import SecureMessagingServer
+
+    async def serve():
+        server = SecureMessagingServer(
+            cert_path=os.path.join(cert_dir, "server.crt"),
+            key_path=os.path.join(cert_dir, "server.key"),
+            handshake_executor="inline",
+            # Sem descarte na fila de saída: os receptores esperam todos os frames
+            overflow_policy="backpressure",
+            enable_metrics=enable_metrics
+        )
+        listener = await asyncio.start_server(server.handle_client, "127.0.0.1", 0)
+        ready.put(listener.sockets[0].getsockname()[1])
+
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, stop.wait)
+        listener.close()
+        await server.shutdown()
+
+    asyncio.run(serve())
+
+
+async def run_load(server_pid, port, cert_path, pairs, frames_per_pair, payload_size):
+    from client import SecureMessagingClient
+
+    senders, receivers = [], []
+    for i in range(pairs):
+        for group in (senders, receivers):
+            client = SecureMessagingClient(f"c{i}", server_port=port, server_cert_path=cert_path)
+            if not await client.connect():
+                raise RuntimeError("Falha ao conectar")
+            group.append(client)
+
+    # Frames cifrados de antemão e receptores que só contam bytes: a carga mede o servidor
+    payload = os.urandom(payload_size)
+    streams = []
+    for sender, receiver in zip(senders, receivers):
+        parts = []
+        for seq in range(frames_per_pair):
+            frame = MessageCrypto.encrypt_message(
+                sender.cipher_c2s, sender.client_id, receiver.client_id, seq, payload
+            )
+            parts.extend(frame.to_wire_parts())
+        streams.append(b''.join(parts))
+
+    expected = frames_per_pair * (FRAME_HEADER.size + payload_size + TAG_SIZE)
+
+    async def consume(receiver):
+        remaining = expected
+        while remaining > 0:
+            data = await receiver.reader.read(256 * 1024)
+            if not data:
+                raise RuntimeError("Conexão encerrada antes do fim")
+            remaining -= len(data)
+
+    async def blast(sender, data):
+        for offset in range(0, len(data), 256 * 1024):
+            sender.writer.write(data[offset:offset + 256 * 1024])
+            await sender.writer.drain()
+
+    cpu_start = process_cpu_seconds(server_pid)
+    start = time.perf_counter()
+    await asyncio.gather(
+        *(consume(r) for r in receivers),
+        *(blast(s, d) for s, d in zip(senders, streams))
+    )
+    wall = time.perf_counter() - start
+    cpu = process_cpu_seconds(server_pid) - cpu_start
+
+    for client in senders + receivers:
+        client.writer.close()
+    return wall, cpu
+
+
+def run_case(enable_metrics, pairs, frames_per_pair, payload_size, cert_dir):
+    ctx = multiprocessing.get_context("spawn")
+    ready, stop = ctx.Queue(), ctx.Event()
+    server = ctx.Process(target=run_server, args=(enable_metrics, cert_dir, ready, stop))
+    server.start()
+    try:
+        port = ready.get(timeout=60)
+        return asyncio.run(run_load(
+            server.pid, port, os.path.join(cert_dir, "server.crt"),
+            pairs, frames_per_pair, payload_size
+        ))
+    finally:
+        stop.set()
+        server.join(timeout=10)
+        if server.is_alive():
+            server.terminate()
+
+
+def observe_cost(iterations):
+    histogram = Histogram()
+    clock = time.perf_counter
+    start = clock()
+    for _ in range(iterations):
+        started = clock()
+        histogram.observe(clock() - started)
+    return (clock() - start) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Custo da coleta de métricas no caminho de mensagens")
+    parser.add_argument("--pairs", type=int, default=4)
+    parser.add_argument("--frames", type=int, default=25000, help="frames por par remetente/destinatário")
+    parser.add_argument("--payload", type=int, nargs="+", default=[64, 1024])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    print(f"perf_counter + observe: {observe_cost(1_000_000) * 1e9:.0f} ns por medição")
+
+    with tempfile.TemporaryDirectory() as cert_dir:
+        print(f"{'payload':>8} {'métricas':>9} {'msg/s':>10} {'µs CPU/msg':>11}")
+        for size in args.payload:
+            # Execuções alternadas (sem, com, sem, ...) e mediana: o ruído de
+            # escalonamento afeta os dois lados igualmente
+            runs = {False: [], True: []}
+            for _ in range(args.repeat):
+                for enable_metrics in (False, True):
+                    runs[enable_metrics].append(
+                        run_case(enable_metrics, args.pairs, args.frames, size, cert_dir)
+                    )
+
+            total = args.pairs * args.frames
+            per_message = {}
+            for enable_metrics in (False, True):
+                wall = statistics.median(w for w, _ in runs[enable_metrics])
+                cpu = statistics.median(c for _, c in runs[enable_metrics])
+                per_message[enable_metrics] = cpu / total
+                label = "sim" if enable_metrics else "não"
+                print(f"{size:>8} {label:>9} {total / wall:>10.0f} {cpu / total * 1e6:>11.2f}")
+
+            overhead = per_message[True] / per_message[False] - 1
+            print(f"{size:>8} {'overhead':>9} {overhead * 100:>+21.1f}%")
+
+if __name__ == "__main__":
+    main()
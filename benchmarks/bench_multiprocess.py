@@ -0,0 +1,148 @@
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import socket
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from protocol import MessageCrypto, MessageFrame
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def run_supervisor(workers, port, cert_dir):
+    logging.disable(logging.CRITICAL)
+    from supervisor import Supervisor
+
+    Supervisor(
+        workers=workers,
+        host="127.0.0.1",
+        port=port,
+        cert_path=os.path.join(cert_dir, "server.crt"),
+        key_path=os.path.join(cert_dir, "server.key"),
+        heartbeat_interval=0.5,
+        server_options={"handshake_executor": "inline"}
+    ).run()
+
+
+async def wait_for_port(port, timeout=30.0):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.1)
+    raise RuntimeError("Servidor não subiu")
+
+
+async def count_frames(client, counter):
+    try:
+        while True:
+            header = await client.reader.readexactly(56)
+            body = await client.reader.readexactly(int.from_bytes(header[52:56], 'big'))
+            frame = MessageFrame(
+                header[0:12], header[12:28], header[28:44],
+                int.from_bytes(header[44:52], 'big'), body
+            )
+            if MessageCrypto.decrypt_message(client.cipher_s2c, frame) is not None:
+                counter[0] += 1
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+
+
+def run_load(port, cert_path, pairs, duration, payload_size, result_queue):
+    logging.disable(logging.CRITICAL)
+    from client import SecureMessagingClient
+
+    async def load():
+        senders, receivers = [], []
+        for i in range(pairs):
+            sender = SecureMessagingClient(f"s{i}", server_port=port, server_cert_path=cert_path)
+            receiver = SecureMessagingClient(f"r{i}", server_port=port, server_cert_path=cert_path)
+            if not (await sender.connect() and await receiver.connect()):
+                raise RuntimeError("Falha ao conectar")
+            senders.append(sender)
+            receivers.append(receiver)
+
+        received = [0]
+        readers = [asyncio.create_task(count_frames(r, received)) for r in receivers]
+        message = "x" * payload_size
+        deadline = time.perf_counter() + duration
+
+        async def pump(sender, receiver):
+            while time.perf_counter() < deadline:
+                await sender.send_message("r", receiver.client_id, message)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(pump(s, r) for s, r in zip(senders, receivers)))
+        await asyncio.sleep(0.5)
+        elapsed = time.perf_counter() - start
+        for task in readers:
+            task.cancel()
+        result_queue.put((received[0], elapsed))
+
+    asyncio.run(load())
+
+
+def run_case(workers, load_procs, pairs, duration, payload_size, cert_dir):
+    ctx = multiprocessing.get_context("spawn")
+    port = free_port()
+    supervisor = ctx.Process(target=run_supervisor, args=(workers, port, cert_dir))
+    supervisor.start()
+    try:
+        asyncio.run(wait_for_port(port))
+        # Dá tempo para todos os workers entrarem no SO_REUSEPORT
+        time.sleep(1.0)
+
+        results = ctx.Queue()
+        cert_path = os.path.join(cert_dir, "server.crt")
+        loaders = [
+            ctx.Process(target=run_load, args=(port, cert_path, pairs, duration, payload_size, results))
+            for _ in range(load_procs)
+        ]
+        for p in loaders:
+            p.start()
+        totals = [results.get(timeout=duration + 120) for _ in loaders]
+        for p in loaders:
+            p.join()
+    finally:
+        supervisor.terminate()
+        supervisor.join()
+
+    received = sum(r for r, _ in totals)
+    elapsed = max(e for _, e in totals)
+    return received / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vazão (msg/s) do supervisor de 1 a N workers")
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--load-procs", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument("--pairs", type=int, default=16, help="pares remetente/destinatário por processo de carga")
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--payload", type=int, default=64)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    with tempfile.TemporaryDirectory() as cert_dir:
+        baseline = None
+        print(f"{'workers':>8} {'msg/s':>10} {'escala':>8}")
+        for workers in range(1, args.max_workers + 1):
+            rate = run_case(workers, args.load_procs, args.pairs, args.duration, args.payload, cert_dir)
+            baseline = baseline or rate
+            print(f"{workers:>8} {rate:>10.0f} {rate / baseline:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from offline_store import OfflineStore
+from protocol import MessageCrypto
+
+
+def drain(store, recipient_id, cipher, batch):
+    # Mesmo trabalho do servidor no connect: tira do log e recifra com key_s2c
+    seq = 0
+    while True:
+        messages, last_seq = store.take(recipient_id, batch)
+        if not last_seq:
+            return seq
+        for _, sender_id, plaintext, _ in messages:
+            MessageCrypto.encrypt_message(cipher, sender_id, recipient_id, seq, plaintext)
+            seq += 1
+        store.ack(recipient_id, last_seq, len(messages))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Armazenamento offline: append, recuperação e entrega no connect")
+    parser.add_argument("--messages", type=int, default=2_000_000)
+    parser.add_argument("--recipients", type=int, default=10_000)
+    parser.add_argument("--payload", type=int, default=64)
+    parser.add_argument("--heavy", type=int, default=200_000, help="mensagens de um único destinatário")
+    parser.add_argument("--batch", type=int, default=1024)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    payload = os.urandom(args.payload)
+    sender_id = os.urandom(16)
+    recipients = [os.urandom(16) for _ in range(args.recipients)]
+    heavy = os.urandom(16)
+    cipher, _ = MessageCrypto.session_ciphers(os.urandom(16), os.urandom(16))
+
+    with tempfile.TemporaryDirectory() as path:
+        store = OfflineStore(path, max_bytes=2 ** 40, flush_interval=0)
+
+        start = time.perf_counter()
+        for i in range(args.messages):
+            store.append(recipients[i % args.recipients], sender_id, payload)
+        store.flush()
+        elapsed = time.perf_counter() - start
+        print(f"append: {args.messages} msgs em {elapsed:.2f}s ({args.messages / elapsed:,.0f} msg/s, "
+              f"{store.total_bytes / elapsed / 2 ** 20:.1f} MiB/s, {store.stats()['segments']} segmentos)")
+
+        for _ in range(args.heavy):
+            store.append(heavy, sender_id, payload)
+        asyncio.run(store.close())
+
+        start = time.perf_counter()
+        store = OfflineStore(path, max_bytes=2 ** 40, flush_interval=0)
+        elapsed = time.perf_counter() - start
+        print(f"recuperação: {store.pending_messages} msgs indexadas em {elapsed:.2f}s")
+
+        start = time.perf_counter()
+        count = drain(store, heavy, cipher, args.batch)
+        elapsed = time.perf_counter() - start
+        print(f"connect com {count} pendentes: {elapsed:.2f}s ({count / elapsed:,.0f} msg/s)")
+
+        start = time.perf_counter()
+        total = sum(drain(store, r, cipher, args.batch) for r in recipients)
+        elapsed = time.perf_counter() - start
+        print(f"connect de {args.recipients} destinatários ({total} msgs): "
+              f"{elapsed / args.recipients * 1e3:.2f} ms por connect ({total / elapsed:,.0f} msg/s)")
+        print(f"após entrega: {store.stats()}")
+        asyncio.run(store.close())
+
+
+if __name__ == "__main__":
+    main()
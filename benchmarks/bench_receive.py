@@ -0,0 +1,125 @@
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from framing import TRANSPORT_ENGINES
+
+
+def run_server(cert_dir, ready, stop):
+    logging.disable(logging.CRITICAL)
+    from server import SecureMessagingServer
+
+    async def serve():
+        server = SecureMessagingServer(
+            cert_path=os.path.join(cert_dir, "server.crt"),
+            key_path=os.path.join(cert_dir, "server.key"),
+            handshake_executor="inline",
+            # Sem descarte na fila de saída: o receptor espera todas as mensagens
+            overflow_policy="backpressure"
+        )
+        listener = await asyncio.start_server(server.handle_client, "127.0.0.1", 0)
+        ready.put(listener.sockets[0].getsockname()[1])
+
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, stop.wait)
+        listener.close()
+        await server.shutdown()
+
+    asyncio.run(serve())
+
+
+def run_sender(port, cert_path, recipient_id, count, payload_size, go):
+    logging.disable(logging.CRITICAL)
+    from client import SecureMessagingClient
+
+    async def send():
+        sender = SecureMessagingClient("remetente", server_port=port, server_cert_path=cert_path)
+        if not await sender.connect():
+            raise RuntimeError("Falha ao conectar")
+        payload = os.urandom(payload_size)
+        go.wait()
+        await sender.send_many((recipient_id, payload) for _ in range(count))
+        await asyncio.sleep(1)
+        sender.writer.close()
+
+    asyncio.run(send())
+
+
+async def receive(port, cert_path, count, payload_size, engine, raw, max_buffered, ctx):
+    from client import SecureMessagingClient
+
+    receiver = SecureMessagingClient(
+        "destinatario", server_port=port, server_cert_path=cert_path, transport_engine=engine
+    )
+    if not await receiver.connect():
+        raise RuntimeError("Falha ao conectar")
+
+    # Remetente em outro processo: o laço mede só o lado que recebe
+    go = ctx.Event()
+    sender = ctx.Process(
+        target=run_sender, args=(port, cert_path, receiver.client_id, count, payload_size, go)
+    )
+    sender.start()
+
+    received = 0
+    payload_bytes = 0
+    messages = receiver.messages(raw=raw, max_buffered=max_buffered)
+    go.set()
+    async for message in messages:
+        if received == 0:
+            start = time.perf_counter()
+            cpu_start = time.process_time()
+        received += 1
+        payload_bytes += len(message.payload)
+        if received == count:
+            break
+    wall = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+    await messages.aclose()
+
+    receiver.writer.close()
+    sender.join(timeout=30)
+    return received / wall, received / cpu
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vazão da recepção com o iterador messages() do cliente")
+    parser.add_argument("--messages", type=int, default=200_000)
+    parser.add_argument("--payload", type=int, nargs="+", default=[64, 1024])
+    parser.add_argument("--max-buffered", type=int, default=1024)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    with tempfile.TemporaryDirectory() as cert_dir:
+        ctx = multiprocessing.get_context("spawn")
+        ready, stop = ctx.Queue(), ctx.Event()
+        server = ctx.Process(target=run_server, args=(cert_dir, ready, stop))
+        server.start()
+        try:
+            port = ready.get(timeout=60)
+            cert_path = os.path.join(cert_dir, "server.crt")
+            print(f"{'payload':>8} {'motor':>10} {'entrega':>8} {'msg/s':>10} {'msg/s/núcleo':>13}")
+            for size in args.payload:
+                for engine in TRANSPORT_ENGINES:
+                    for raw in (False, True):
+                        wall_rate, cpu_rate = asyncio.run(receive(
+                            port, cert_path, args.messages, size, engine, raw, args.max_buffered, ctx
+                        ))
+                        label = "bytes" if raw else "str"
+                        print(f"{size:>8} {engine:>10} {label:>8} {wall_rate:>10.0f} {cpu_rate:>13.0f}")
+        finally:
+            stop.set()
+            server.join(timeout=10)
+            if server.is_alive():
+                server.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from crypto import AESGCMCipher, RSASignature
+from protocol import ClientHandshake, ServerHandshake, HandshakeResponse, MessageCrypto, SEQ_MASK
+from rekey import KeyRatchet
+from replay import ReplayWindow
+
+
+def measure(fn, duration):
+    count = 0
+    start = time.perf_counter()
+    deadline = start + duration
+    while time.perf_counter() < deadline:
+        fn()
+        count += 1
+    return (time.perf_counter() - start) / count
+
+
+def rekey_costs(duration):
+    # Uma troca completa nos dois lados: quem envia deriva a chave e cifra o
+    # REKEY; quem recebe decifra, valida a época e deriva a mesma chave
+    sender, receiver = KeyRatchet(), KeyRatchet()
+    cipher_send = cipher_receive = AESGCMCipher(os.urandom(16))
+    seq = 0
+
+    def roundtrip():
+        nonlocal cipher_send, cipher_receive, seq
+        payload, next_cipher = sender.ratchet_send(cipher_send)
+        frame = MessageCrypto.encrypt_control(cipher_send, seq, payload)
+        cipher_send = next_cipher
+        opened = MessageCrypto.decrypt_message(cipher_receive, frame)
+        cipher_receive = receiver.ratchet_receive(cipher_receive, opened, seq)
+        seq += 1
+
+    server = ServerHandshake(RSASignature())
+    certificate = server.rsa.get_public_key_pem()
+    client_id = os.urandom(16)
+
+    def full_handshake():
+        client = ClientHandshake(client_id)
+        pk = client.get_initial_message()[16:]
+        ecdhe = server.new_key_exchange()
+        response = server.generate_handshake_response(client_id, pk, ecdhe)
+        server.derive_session_secrets(pk, response.salt, ecdhe)
+        client.process_handshake_response(HandshakeResponse.from_bytes(response.to_bytes()), certificate)
+
+    return measure(roundtrip, duration), measure(full_handshake, duration)
+
+
+def throughput(count, size, every):
+    # Cifra + decifra `count` mensagens com troca a cada `every` (0 = nunca),
+    # escolhendo a chave de recepção pelo seq como o servidor faz
+    payload = os.urandom(size)
+    sender, receiver = KeyRatchet(every, 0), KeyRatchet(every, 0)
+    cipher_send = cipher_receive = AESGCMCipher(os.urandom(16))
+    replay = ReplayWindow()
+    sender_id, recipient_id = os.urandom(16), os.urandom(16)
+    seq = 0
+
+    start = time.perf_counter()
+    for _ in range(count):
+        frame = MessageCrypto.encrypt_message(cipher_send, sender_id, recipient_id, seq, payload)
+        seq += 1
+        frames = [frame]
+        if sender.count(size):
+            rekey_payload, next_cipher = sender.ratchet_send(cipher_send)
+            frames.append(MessageCrypto.encrypt_control(cipher_send, seq, rekey_payload))
+            seq += 1
+            cipher_send = next_cipher
+        for received in frames:
+            seq_no = received.seq_no & SEQ_MASK
+            opened = MessageCrypto.decrypt_message(receiver.receive_cipher(cipher_receive, seq_no, replay), received)
+            replay.accept(seq_no)
+            if received is not frame:
+                cipher_receive = receiver.ratchet_receive(cipher_receive, opened, seq_no)
+            elif opened is None:
+                raise RuntimeError("Falha ao decifrar")
+    elapsed = time.perf_counter() - start
+    return count / elapsed, sender.rekeys_sent
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Troca de chaves em banda x handshake completo")
+    parser.add_argument("--duration", type=float, default=2.0, help="segundos por medição de custo")
+    parser.add_argument("--messages", type=int, default=200_000)
+    parser.add_argument("--size", type=int, default=256)
+    parser.add_argument("--every", type=int, nargs="+", default=[0, 100_000, 10_000, 1_000, 100])
+    args = parser.parse_args()
+
+    rekey, handshake = rekey_costs(args.duration)
+    print(f"{'operação':>28} {'µs':>10}")
+    print(f"{'troca de chaves (2 lados)':>28} {rekey * 1e6:>10.1f}")
+    print(f"{'handshake completo (CPU)':>28} {handshake * 1e6:>10.1f}")
+    print(f"{'razão':>28} {handshake / rekey:>9.0f}x")
+
+    print(f"\n{args.messages} mensagens de {args.size} bytes (cifra + decifra)")
+    print(f"{'troca a cada':>13} {'trocas':>7} {'msg/s':>10} {'custo':>8}")
+    # Aquecimento: a primeira passada paga alocações e caches
+    throughput(min(args.messages, 20_000), args.size, 0)
+    baseline = None
+    for every in args.every:
+        rate, rekeys = throughput(args.messages, args.size, every)
+        baseline = baseline or rate
+        label = "nunca" if every == 0 else str(every)
+        print(f"{label:>13} {rekeys:>7} {rate:>10.0f} {(baseline / rate - 1):>8.1%}")
+
+
+if __name__ == "__main__":
+    main()
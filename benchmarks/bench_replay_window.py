@@ -0,0 +1,80 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from replay import ReplayWindow
+
+
+def in_order(count, rng):
+    return list(range(count))
+
+
+def reordered(count, rng, block=32):
+    # Embaralha blocos de `block` números: chegada fora de ordem dentro da janela
+    sequence = []
+    for start in range(0, count, block):
+        chunk = list(range(start, min(start + block, count)))
+        rng.shuffle(chunk)
+        sequence.extend(chunk)
+    return sequence
+
+
+def with_replays(count, rng):
+    # Metade dos frames é repetição de um dos últimos 64
+    sequence = []
+    for seq_no in range(count // 2):
+        sequence.append(seq_no)
+        sequence.append(max(0, seq_no - rng.randrange(64)))
+    return sequence
+
+
+PATTERNS = (("em ordem", in_order), ("fora de ordem", reordered), ("50% replays", with_replays))
+
+
+def time_window(size, sequence):
+    window = ReplayWindow(size)
+    check, accept = window.check, window.accept
+    start = time.perf_counter()
+    for seq_no in sequence:
+        # Como no servidor: consulta antes de decifrar, marca depois
+        if check(seq_no):
+            accept(seq_no)
+    return (time.perf_counter() - start) / len(sequence)
+
+
+def time_high_water(sequence):
+    # Checagem antiga: um único seq_recv, só aceita em ordem estrita
+    seq_recv = -1
+    start = time.perf_counter()
+    for seq_no in sequence:
+        if seq_no > seq_recv:
+            seq_recv = seq_no
+    return (time.perf_counter() - start) / len(sequence)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Custo da janela anti-replay por frame")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[64, 1024, 8192])
+    parser.add_argument("--frames", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    sequences = [(label, build(args.frames, rng)) for label, build in PATTERNS]
+
+    print(f"{'janela':>8} {'padrão':>14} {'ns/frame':>9} {'frames/s':>12}")
+    for label, sequence in sequences:
+        cost = time_high_water(sequence)
+        print(f"{'seq_recv':>8} {label:>14} {cost * 1e9:>9.0f} {1 / cost:>12.0f}")
+    for size in args.sizes:
+        for label, sequence in sequences:
+            cost = time_window(size, sequence)
+            print(f"{size:>8} {label:>14} {cost * 1e9:>9.0f} {1 / cost:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from crypto import RSASignature
+from protocol import (
+    ClientHandshake, ServerHandshake, SessionTicketKeys,
+    HandshakeResponse, ResumeResponse
+)
+
+
+def measure(fn, duration):
+    count = 0
+    start = time.perf_counter()
+    deadline = start + duration
+    while time.perf_counter() < deadline:
+        fn()
+        count += 1
+    return (time.perf_counter() - start) / count
+
+
+def cpu_cost(duration):
+    server = ServerHandshake(RSASignature(), SessionTicketKeys())
+    certificate = server.rsa.get_public_key_pem()
+    client_id = os.urandom(16)
+
+    def full_server():
+        client = ClientHandshake(client_id)
+        pk = client.get_initial_message()[16:]
+        ecdhe = server.new_key_exchange()
+        response = server.generate_handshake_response(client_id, pk, ecdhe)
+        _, _, secret = server.derive_session_secrets(pk, response.salt, ecdhe)
+        # Como o servidor responde a quem oferece EXT_SESSION_TICKET
+        response.extended = True
+        server.attach_ticket(response, client_id, secret)
+
+    def full_roundtrip():
+        client = ClientHandshake(client_id)
+        pk = client.get_initial_message()[16:]
+        ecdhe = server.new_key_exchange()
+        response = server.generate_handshake_response(client_id, pk, ecdhe)
+        _, _, secret = server.derive_session_secrets(pk, response.salt, ecdhe)
+        # Como o servidor responde a quem oferece EXT_SESSION_TICKET
+        response.extended = True
+        server.attach_ticket(response, client_id, secret)
+        client.process_handshake_response(HandshakeResponse.from_bytes(response.to_bytes()), certificate)
+
+    seed_pk = ClientHandshake(client_id).get_initial_message()[16:]
+    seed_ecdhe = server.new_key_exchange()
+    seed_response = server.generate_handshake_response(client_id, seed_pk, seed_ecdhe)
+    _, _, seed_secret = server.derive_session_secrets(seed_pk, seed_response.salt, seed_ecdhe)
+    ticket = server.ticket_keys.issue(client_id, seed_secret)
+
+    def resumed_server():
+        server.resume_session(client_id, os.urandom(32), ticket)
+
+    def resumed_roundtrip():
+        client = ClientHandshake(client_id)
+        client.get_resume_message(ticket)
+        response, _, _ = server.resume_session(client_id, client.client_nonce, ticket)
+        client.process_resume_response(ResumeResponse.from_bytes(response.to_bytes()), seed_secret)
+
+    return {
+        "servidor completo": measure(full_server, duration),
+        "servidor retomado": measure(resumed_server, duration),
+        "ida-e-volta completo": measure(full_roundtrip, duration),
+        "ida-e-volta retomado": measure(resumed_roundtrip, duration),
+    }
+
+
+async def loopback_connects(count):
+    from server import SecureMessagingServer
+    from client import SecureMessagingClient
+
+    with tempfile.TemporaryDirectory() as cert_dir:
+        cert_path = os.path.join(cert_dir, "server.crt")
+        server = SecureMessagingServer(
+            cert_path=cert_path,
+            key_path=os.path.join(cert_dir, "server.key"),
+            handshake_executor="inline"
+        )
+        listener = await asyncio.start_server(server.handle_client, "127.0.0.1", 0)
+        port = listener.sockets[0].getsockname()[1]
+
+        client = SecureMessagingClient("bench", server_port=port, server_cert_path=cert_path, session_tickets=True)
+        results = {}
+        for label, keep_ticket in (("conexão completa", False), ("conexão retomada", True)):
+            await client.connect()
+            client.writer.close()
+            start = time.perf_counter()
+            for _ in range(count):
+                if not keep_ticket:
+                    client.session_ticket = None
+                if not await client.connect():
+                    raise RuntimeError("Falha ao conectar")
+                client.writer.close()
+            results[label] = (time.perf_counter() - start) / count
+
+        listener.close()
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Custo de handshake completo vs. retomada por ticket")
+    parser.add_argument("--duration", type=float, default=1.0, help="segundos por medição de CPU")
+    parser.add_argument("--connects", type=int, default=200, help="conexões por cenário no loopback")
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+
+    for label, seconds in cpu_cost(args.duration).items():
+        print(f"{label:>22}: {seconds * 1e6:9.1f} µs  ({1 / seconds:8.0f}/s)")
+
+    for label, seconds in asyncio.run(loopback_connects(args.connects)).items():
+        print(f"{label:>22}: {seconds * 1e6:9.1f} µs  ({1 / seconds:8.0f}/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from protocol import FRAME_HEADER
+
+TAG_SIZE = 16
+
+
+def run_server(cert_dir, ready, stop):
+    logging.disable(logging.CRITICAL)
+    from server import SecureMessagingServer
+
+    async def serve():
+        server = SecureMessagingServer(
+            cert_path=os.path.join(cert_dir, "server.crt"),
+            key_path=os.path.join(cert_dir, "server.key"),
+            handshake_executor="inline",
+            # Sem descarte na fila de saída: o receptor espera todas as mensagens
+            overflow_policy="backpressure"
+        )
+        listener = await asyncio.start_server(server.handle_client, "127.0.0.1", 0)
+        ready.put(listener.sockets[0].getsockname()[1])
+
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, stop.wait)
+        listener.close()
+        await server.shutdown()
+
+    asyncio.run(serve())
+
+
+async def run_case(mode, port, cert_path, count, payload_size, window_bytes):
+    from client import SecureMessagingClient
+
+    sender = SecureMessagingClient("remetente", server_port=port, server_cert_path=cert_path)
+    receiver = SecureMessagingClient("destinatario", server_port=port, server_cert_path=cert_path)
+    if not (await sender.connect() and await receiver.connect()):
+        raise RuntimeError("Falha ao conectar")
+
+    payload = os.urandom(payload_size)
+    expected = count * (FRAME_HEADER.size + payload_size + TAG_SIZE)
+
+    async def consume():
+        remaining = expected
+        while remaining > 0:
+            data = await receiver.reader.read(256 * 1024)
+            if not data:
+                raise RuntimeError("Conexão encerrada antes do fim")
+            remaining -= len(data)
+
+    async def produce():
+        for _ in range(count):
+            yield receiver.client_id, payload
+
+    consumer = asyncio.create_task(consume())
+    start = time.perf_counter()
+    if mode == "send_message":
+        text = payload.hex()[:payload_size]
+        for _ in range(count):
+            if not await sender.send_message("destinatario", receiver.client_id, text):
+                raise RuntimeError("Falha no envio")
+    elif mode == "send_many":
+        results = await sender.send_many(
+            ((receiver.client_id, payload) for _ in range(count)), window_bytes=window_bytes
+        )
+        if not all(results):
+            raise RuntimeError("Falha no envio")
+    else:
+        results = await sender.send_many(produce(), window_bytes=window_bytes)
+        if not all(results):
+            raise RuntimeError("Falha no envio")
+    sent = time.perf_counter() - start
+    await consumer
+    delivered = time.perf_counter() - start
+
+    for client in (sender, receiver):
+        client.writer.close()
+    return count / sent, count / delivered
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Envio de uma conexão: send_message em laço vs. send_many")
+    parser.add_argument("--messages", type=int, default=100_000)
+    parser.add_argument("--payload", type=int, nargs="+", default=[64, 1024])
+    parser.add_argument("--window", type=int, default=256 * 1024, help="bytes por drain no send_many")
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    with tempfile.TemporaryDirectory() as cert_dir:
+        ctx = multiprocessing.get_context("spawn")
+        ready, stop = ctx.Queue(), ctx.Event()
+        server = ctx.Process(target=run_server, args=(cert_dir, ready, stop))
+        server.start()
+        try:
+            port = ready.get(timeout=60)
+            cert_path = os.path.join(cert_dir, "server.crt")
+            print(f"{'payload':>8} {'modo':>18} {'enviadas/s':>11} {'entregues/s':>12}")
+            for size in args.payload:
+                for mode in ("send_message", "send_many", "send_many (async)"):
+                    send_rate, delivery_rate = asyncio.run(
+                        run_case(mode, port, cert_path, args.messages, size, args.window)
+                    )
+                    print(f"{size:>8} {mode:>18} {send_rate:>11.0f} {delivery_rate:>12.0f}")
+        finally:
+            stop.set()
+            server.join(timeout=10)
+            if server.is_alive():
+                server.terminate()
+
+
+if __name__ == "__main__":
+    main()
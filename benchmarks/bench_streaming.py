@@ -0,0 +1,138 @@
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from protocol import MessageCrypto, FRAME_HEADER, CHUNK_HEADER
+
+TAG_SIZE = 16
+MiB = 1024 * 1024
+
+
+def process_memory(pid):
+    # (RSS atual, pico de RSS) em bytes (Linux)
+    values = {}
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            key, _, rest = line.partition(":")
+            if key in ("VmRSS", "VmHWM"):
+                values[key] = int(rest.split()[0]) * 1024
+    return values["VmRSS"], values["VmHWM"]
+
+
+def run_server(cert_dir, max_frame_size, ready, stop):
+    logging.disable(logging.CRITICAL)
+    from server import SecureMessagingServer
+
+    async def serve():
+        server = SecureMessagingServer(
+            cert_path=os.path.join(cert_dir, "server.crt"),
+            key_path=os.path.join(cert_dir, "server.key"),
+            handshake_executor="inline",
+            overflow_policy="backpressure",
+            max_frame_size=max_frame_size
+        )
+        listener = await asyncio.start_server(server.handle_client, "127.0.0.1", 0)
+        ready.put(listener.sockets[0].getsockname()[1])
+
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, stop.wait)
+        listener.close()
+        await server.shutdown()
+
+    asyncio.run(serve())
+
+
+async def run_transfer(mode, server_pid, port, cert_path, size, chunk_size):
+    from client import SecureMessagingClient
+
+    sender = SecureMessagingClient("remetente", server_port=port, server_cert_path=cert_path)
+    receiver = SecureMessagingClient("destinatario", server_port=port, server_cert_path=cert_path)
+    if not (await sender.connect() and await receiver.connect()):
+        raise RuntimeError("Falha ao conectar")
+
+    payload = os.urandom(size)
+    if mode == "stream":
+        chunks = -(-size // chunk_size)
+        expected = chunks * (FRAME_HEADER.size + CHUNK_HEADER.size + TAG_SIZE) + size
+    else:
+        expected = FRAME_HEADER.size + size + TAG_SIZE
+
+    # O receptor só conta bytes: a medida é a memória do servidor
+    async def consume():
+        remaining = expected
+        while remaining > 0:
+            data = await receiver.reader.read(256 * 1024)
+            if not data:
+                raise RuntimeError("Conexão encerrada antes do fim")
+            remaining -= len(data)
+
+    async def produce():
+        if mode == "stream":
+            if not await sender.send_stream(receiver.client_id, payload, chunk_size):
+                raise RuntimeError("Falha ao enviar stream")
+            return
+        frame = MessageCrypto.encrypt_message(
+            sender.cipher_c2s, sender.client_id, receiver.client_id, sender.seq_send, payload
+        )
+        sender.writer.writelines(frame.to_wire_parts())
+        await sender.writer.drain()
+
+    rss_before, _ = process_memory(server_pid)
+    start = time.perf_counter()
+    await asyncio.gather(consume(), produce())
+    elapsed = time.perf_counter() - start
+    _, peak = process_memory(server_pid)
+
+    sender.writer.close()
+    receiver.writer.close()
+    return elapsed, peak - rss_before
+
+
+def run_case(mode, size, chunk_size, cert_dir):
+    # Servidor novo por caso: o pico de RSS (VmHWM) não herda casos anteriores
+    max_frame_size = chunk_size * 2 if mode == "stream" else size + MiB
+    ctx = multiprocessing.get_context("spawn")
+    ready, stop = ctx.Queue(), ctx.Event()
+    server = ctx.Process(target=run_server, args=(cert_dir, max_frame_size, ready, stop))
+    server.start()
+    try:
+        port = ready.get(timeout=60)
+        return asyncio.run(run_transfer(
+            mode, server.pid, port, os.path.join(cert_dir, "server.crt"), size, chunk_size
+        ))
+    finally:
+        stop.set()
+        server.join(timeout=10)
+        if server.is_alive():
+            server.terminate()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memória do servidor ao repassar payloads grandes")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[16, 64, 256], help="tamanhos em MiB")
+    parser.add_argument("--single-max", type=int, default=64, help="maior tamanho (MiB) enviado num único frame")
+    parser.add_argument("--chunk", type=int, default=64 * 1024)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+
+    with tempfile.TemporaryDirectory() as cert_dir:
+        print(f"{'modo':>12} {'MiB':>6} {'MiB/s':>8} {'pico RSS servidor':>18}")
+        for size_mib in args.sizes:
+            modes = ["stream"]
+            if size_mib <= args.single_max:
+                modes.append("frame único")
+            for mode in modes:
+                elapsed, growth = run_case(mode, size_mib * MiB, args.chunk, cert_dir)
+                print(f"{mode:>12} {size_mib:>6} {size_mib / elapsed:>8.1f} {growth / MiB:>14.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from timer_wheel import TimerWheel
+
+
+def noop():
+    pass
+
+
+def traced_bytes(build):
+    # Memória retida pelo que `build` devolve, medida à parte para o tracemalloc
+    # não pesar nos tempos
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = build()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    for item in kept:
+        item.cancel()
+    return size
+
+
+class IdleSession:
+    # Como ClientSession para o timer: só last_activity e o timer atual
+    __slots__ = ('last_activity', 'timer')
+
+    def __init__(self, last_activity):
+        self.last_activity = last_activity
+        self.timer = None
+
+
+def wheel_costs(count, tick, slots, idle_timeout, active_share, duration, seed):
+    rng = random.Random(seed)
+    clock = [0.0]
+    wheel = TimerWheel(tick, slots)
+    wheel._clock = lambda: clock[0]
+    wheel.advance(0.0)
+
+    def check(session):
+        # Mesmo padrão do servidor: confere a ociosidade e se reagenda
+        idle = clock[0] - session.last_activity
+        if idle >= idle_timeout:
+            session.last_activity = clock[0]
+        session.timer = wheel.schedule(session.last_activity + idle_timeout - clock[0], check, session)
+
+    sessions = [IdleSession(-rng.random() * idle_timeout) for _ in range(count)]
+
+    memory = traced_bytes(lambda: [
+        wheel.schedule(session.last_activity + idle_timeout, check, session) for session in sessions
+    ]) / count
+    start = time.perf_counter()
+    for session in sessions:
+        session.timer = wheel.schedule(session.last_activity + idle_timeout, check, session)
+    schedule_cost = (time.perf_counter() - start) / count
+
+    # Avança a roda tick a tick; uma fração das sessões tem atividade a cada tick
+    active = max(1, int(count * active_share))
+    costs = []
+    for _ in range(int(duration / tick)):
+        clock[0] += tick
+        for session in rng.sample(sessions, active):
+            session.last_activity = clock[0]
+        started = time.perf_counter()
+        wheel.advance()
+        costs.append(time.perf_counter() - started)
+
+    start = time.perf_counter()
+    for session in sessions:
+        session.timer.cancel()
+    cancel_cost = (time.perf_counter() - start) / count
+    return schedule_cost, cancel_cost, sum(costs) / len(costs), max(costs), memory
+
+
+async def asyncio_costs(count, idle_timeout, seed):
+    # Um TimerHandle por conexão (call_later): heap do event loop, O(log n) por agendamento
+    rng = random.Random(seed)
+    loop = asyncio.get_running_loop()
+    delays = [idle_timeout * (1 + rng.random()) for _ in range(count)]
+
+    memory = traced_bytes(lambda: [loop.call_later(delay, noop) for delay in delays]) / count
+    start = time.perf_counter()
+    handles = [loop.call_later(delay, noop) for delay in delays]
+    schedule_cost = (time.perf_counter() - start) / count
+
+    # Reagendar a cada atividade: cancelar + call_later de novo
+    start = time.perf_counter()
+    for i, handle in enumerate(handles):
+        handle.cancel()
+        handles[i] = loop.call_later(delays[i], noop)
+    rearm_cost = (time.perf_counter() - start) / count
+
+    start = time.perf_counter()
+    for handle in handles:
+        handle.cancel()
+    cancel_cost = (time.perf_counter() - start) / count
+    # Handles cancelados saem do heap aos poucos, nas próximas voltas do loop
+    await asyncio.sleep(0)
+    return schedule_cost, cancel_cost, rearm_cost, memory
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Roda de timers x um call_later por conexão")
+    parser.add_argument("--connections", type=int, nargs="+", default=[1_000, 10_000, 100_000, 300_000])
+    parser.add_argument("--tick", type=float, default=0.25)
+    parser.add_argument("--slots", type=int, default=512, help="posições por nível (o servidor usa o suficiente para cobrir o idle_timeout)")
+    parser.add_argument("--idle-timeout", type=float, default=120.0)
+    parser.add_argument("--active-share", type=float, default=0.01, help="fração das sessões com atividade por tick")
+    parser.add_argument("--duration", type=float, default=240.0, help="segundos simulados de avanço da roda")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"Roda: tick {args.tick} s, {args.slots} slots, timeout {args.idle_timeout} s, {args.active_share:.0%} das sessões ativas por tick")
+    print(f"{'conexões':>9} {'agendar ns':>11} {'cancelar ns':>12} {'tick médio µs':>14} {'tick máx µs':>12} {'bytes/timer':>12}")
+    for count in args.connections:
+        schedule_cost, cancel_cost, tick_mean, tick_max, memory = wheel_costs(
+            count, args.tick, args.slots, args.idle_timeout, args.active_share, args.duration, args.seed
+        )
+        print(
+            f"{count:>9} {schedule_cost * 1e9:>11.0f} {cancel_cost * 1e9:>12.0f} "
+            f"{tick_mean * 1e6:>14.1f} {tick_max * 1e6:>12.1f} {memory:>12.0f}"
+        )
+
+    print("\nasyncio call_later (um handle por conexão)")
+    print(f"{'conexões':>9} {'agendar ns':>11} {'cancelar ns':>12} {'reagendar ns':>13} {'bytes/timer':>12}")
+    for count in args.connections:
+        schedule_cost, cancel_cost, rearm_cost, memory = asyncio.run(
+            asyncio_costs(count, args.idle_timeout, args.seed)
+        )
+        print(
+            f"{count:>9} {schedule_cost * 1e9:>11.0f} {cancel_cost * 1e9:>12.0f} "
+            f"{rearm_cost * 1e9:>13.0f} {memory:>12.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from protocol import MessageCrypto
+from framing import TRANSPORT_ENGINES
+
+
+class CountingRouter:
+    # Destinatário inexistente: cada frame decifrado termina em forward()
+
+    def __init__(self, total, done):
+        self.total = total
+        self.done = done
+        self.count = 0
+        self.started = None
+
+    def session_opened(self, client_id):
+        pass
+
+    def session_closed(self, client_id):
+        pass
+
+    async def forward(self, sender_id, recipient_id, plaintext, chunk_header=b'', compress=False):
+        self.count += 1
+        if self.count == 1:
+            self.started = (time.perf_counter(), time.process_time())
+        if self.count == self.total:
+            self.done.set()
+        return True
+
+
+def run_server(engine, cert_dir, total, ready, results):
+    logging.disable(logging.CRITICAL)
+    from server import SecureMessagingServer
+
+    async def serve():
+        server = SecureMessagingServer(
+            cert_path=os.path.join(cert_dir, "server.crt"),
+            key_path=os.path.join(cert_dir, "server.key"),
+            handshake_executor="inline",
+            transport_engine=engine
+        )
+        done = asyncio.Event()
+        router = CountingRouter(total, done)
+        server.router = router
+        listener = await asyncio.start_server(server.handle_client, "127.0.0.1", 0)
+        ready.put(listener.sockets[0].getsockname()[1])
+
+        await done.wait()
+        wall = time.perf_counter() - router.started[0]
+        cpu = time.process_time() - router.started[1]
+        results.put((total / wall, total / cpu))
+        listener.close()
+        await server.shutdown()
+
+    asyncio.run(serve())
+
+
+def run_load(port, cert_path, connections, frames_per_connection, payload_size):
+    logging.disable(logging.CRITICAL)
+    from client import SecureMessagingClient
+
+    async def load():
+        clients = []
+        for i in range(connections):
+            client = SecureMessagingClient(f"c{i}", server_port=port, server_cert_path=cert_path)
+            if not await client.connect():
+                raise RuntimeError("Falha ao conectar")
+            clients.append(client)
+
+        # Frames cifrados de antemão: a carga mede só o servidor
+        payload = os.urandom(payload_size)
+        nobody = os.urandom(16)
+        streams = []
+        for client in clients:
+            parts = []
+            for seq in range(frames_per_connection):
+                frame = MessageCrypto.encrypt_message(client.cipher_c2s, client.client_id, nobody, seq, payload)
+                parts.extend(frame.to_wire_parts())
+            streams.append(b''.join(parts))
+
+        async def blast(client, data):
+            for offset in range(0, len(data), 256 * 1024):
+                client.writer.write(data[offset:offset + 256 * 1024])
+                await client.writer.drain()
+
+        await asyncio.gather(*(blast(c, d) for c, d in zip(clients, streams)))
+        return clients
+
+    return asyncio.run(load())
+
+
+def run_case(engine, connections, frames_per_connection, payload_size, cert_dir):
+    ctx = multiprocessing.get_context("spawn")
+    ready, results = ctx.Queue(), ctx.Queue()
+    total = connections * frames_per_connection
+    server = ctx.Process(target=run_server, args=(engine, cert_dir, total, ready, results))
+    server.start()
+    try:
+        port = ready.get(timeout=60)
+        run_load(port, os.path.join(cert_dir, "server.crt"), connections, frames_per_connection, payload_size)
+        return results.get(timeout=300)
+    finally:
+        server.join(timeout=10)
+        if server.is_alive():
+            server.terminate()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Frames/s por núcleo: motor streams vs. BufferedProtocol")
+    parser.add_argument("--connections", type=int, default=8)
+    parser.add_argument("--frames", type=int, default=25000, help="frames por conexão")
+    parser.add_argument("--payload", type=int, nargs="+", default=[64, 1024, 16 * 1024])
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    with tempfile.TemporaryDirectory() as cert_dir:
+        print(f"{'payload':>8} {'motor':>10} {'frames/s':>10} {'frames/s/núcleo':>16}")
+        for size in args.payload:
+            frames = args.frames if size <= 1024 else max(1000, args.frames * 1024 // size)
+            for engine in TRANSPORT_ENGINES:
+                wall_rate, cpu_rate = run_case(engine, args.connections, frames, size, cert_dir)
+                print(f"{size:>8} {engine:>10} {wall_rate:>10.0f} {cpu_rate:>16.0f}")
+
+
+if __name__ == "__main__":
+    main()
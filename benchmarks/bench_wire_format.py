@@ -0,0 +1,122 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from protocol import MessageCrypto, MessageFrame, counter_nonce
+from crypto import AESGCMCipher, generate_nonce
+from framing import FrameDecoder
+from wire import CompactFrameEncoder, CompactFrameDecoder
+
+
+PAYLOAD_SIZES = [16, 64, 256, 1024]
+
+
+def build_frames(payload_size, count, cipher, sender_id, recipient_id):
+    payload = os.urandom(payload_size)
+    return [
+        MessageCrypto.encrypt_message(cipher, sender_id, recipient_id, seq_no, payload)
+        for seq_no in range(count)
+    ]
+
+
+def per_frame(fn, frames):
+    start = time.perf_counter()
+    fn(frames)
+    return (time.perf_counter() - start) / len(frames)
+
+
+def v1_to_bytes(frames):
+    for frame in frames:
+        frame.to_bytes()
+
+
+def v1_wire_parts(frames):
+    for frame in frames:
+        frame.to_wire_parts()
+
+
+def v2_encode(encoder):
+    def run(frames):
+        encode = encoder.encode
+        for frame in frames:
+            encode(frame)
+    return run
+
+
+def v1_from_bytes(blobs):
+    for blob in blobs:
+        MessageFrame.from_bytes(blob)
+
+
+def decode_stream(decoder, stream):
+    def run(_):
+        decoder.feed(stream)
+    return run
+
+
+def wire_size(parts):
+    return sum(len(part) for part in parts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Formato de frame v1 x v2: bytes por mensagem e custo de codificação")
+    parser.add_argument("--frames", type=int, default=100_000)
+    args = parser.parse_args()
+
+    cipher = AESGCMCipher(os.urandom(16))
+    sender_id, recipient_id = os.urandom(16), os.urandom(16)
+
+    # Servidor -> cliente: o primeiro frame de um remetente liga o handle (id completo)
+    print(f"{'payload':>8} {'v1 B/msg':>9} {'v2 B/msg':>9} {'v2 1º frame':>12} {'economia':>9}")
+    for size in PAYLOAD_SIZES:
+        first, second = build_frames(size, 2, cipher, sender_id, recipient_id)
+        encoder = CompactFrameEncoder(server_side=True)
+        v1 = wire_size(second.to_wire_parts())
+        v2_first = wire_size(encoder.encode(first))
+        v2 = wire_size(encoder.encode(second))
+        print(f"{size:>8} {v1:>9} {v2:>9} {v2_first:>12} {1 - v2 / v1:>8.0%}")
+
+    print(f"\nCusto por frame ({args.frames} frames)")
+    print(f"{'payload':>8} {'operação':>28} {'ns/frame':>9}")
+    for size in PAYLOAD_SIZES:
+        frames = build_frames(size, args.frames, cipher, sender_id, recipient_id)
+        blobs = [frame.to_bytes() for frame in frames]
+
+        encoder = CompactFrameEncoder(server_side=True)
+        encoder.encode(frames[0])
+        v1_stream = b''.join(part for frame in frames for part in frame.to_wire_parts())
+        v2_stream = b''.join(part for frame in frames for part in encoder.encode(frame))
+
+        v1_decoder = FrameDecoder(buffer_size=len(v1_stream))
+        v2_decoder = CompactFrameDecoder(
+            recipient_id, {1: sender_id}, server_side=False, buffer_size=len(v2_stream)
+        )
+        cases = (
+            ("v1 to_bytes", v1_to_bytes, frames),
+            ("v1 to_wire_parts", v1_wire_parts, frames),
+            ("v2 encode", v2_encode(encoder), frames),
+            ("v1 from_bytes", v1_from_bytes, blobs),
+            ("v1 FrameDecoder", decode_stream(v1_decoder, v1_stream), frames),
+            ("v2 CompactFrameDecoder", decode_stream(v2_decoder, v2_stream), frames),
+        )
+        for label, fn, items in cases:
+            print(f"{size:>8} {label:>28} {per_frame(fn, items) * 1e9:>9.0f}")
+
+    print("\nNonce por mensagem")
+    for label, make in (("generate_nonce (urandom)", generate_nonce), ("counter_nonce (seq)", counter_nonce)):
+        start = time.perf_counter()
+        if make is generate_nonce:
+            for _ in range(args.frames):
+                make()
+        else:
+            for seq_no in range(args.frames):
+                make(seq_no)
+        cost = (time.perf_counter() - start) / args.frames
+        print(f"{label:>28} {cost * 1e9:>9.0f} ns")
+
+
+if __name__ == "__main__":
+    main()
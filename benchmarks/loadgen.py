@@ -0,0 +1,415 @@
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+from array import array
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from protocol import MessageCrypto
+from framing import frame_reader
+
+
+TOPOLOGIES = ("pairs", "fan-in", "fan-out", "random")
+TIMESTAMP = struct.Struct('>d')
+
+# Cenários de --suite: sobrescrevem os parâmetros da linha de comando
+SUITE = {
+    "pares": {"topology": "pairs"},
+    "fan-in": {"topology": "fan-in", "fan": 8},
+    "fan-out": {"topology": "fan-out", "fan": 8},
+    "churn": {"topology": "pairs", "churn": 50.0},
+}
+
+
+def raise_fd_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def read_rss(pid):
+    # (RSS atual, pico) em KiB; só Linux
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            fields = dict(line.split(":", 1) for line in f if ":" in line)
+        return int(fields["VmRSS"].split()[0]), int(fields["VmHWM"].split()[0])
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+
+def percentile(samples, q):
+    if not samples:
+        return None
+    return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+def run_server(options, cert_dir, ready, stop):
+    logging.disable(logging.CRITICAL)
+    raise_fd_limit()
+    from server import SecureMessagingServer
+
+    async def serve():
+        server = SecureMessagingServer(
+            cert_path=os.path.join(cert_dir, "server.crt"),
+            key_path=os.path.join(cert_dir, "server.key"),
+            **options
+        )
+        listener = await asyncio.start_server(server.handle_client, "127.0.0.1", 0, backlog=4096)
+        ready.put(listener.sockets[0].getsockname()[1])
+        await asyncio.get_running_loop().run_in_executor(None, stop.wait)
+        listener.close()
+        await server.shutdown()
+
+    asyncio.run(serve())
+
+
+class Peer:
+
+    def __init__(self, index, port, cert_path):
+        from client import SecureMessagingClient
+
+        self.client = SecureMessagingClient(f"peer{index}", server_port=port, server_cert_path=cert_path)
+        self.connected = False
+        self._receiver = None
+
+    @property
+    def client_id(self):
+        return self.client.client_id
+
+    async def connect(self, stats) -> bool:
+        self.connected = await self.client.connect()
+        if self.connected:
+            self._receiver = asyncio.create_task(self._receive(stats))
+        return self.connected
+
+    async def disconnect(self):
+        self.connected = False
+        if self._receiver is not None:
+            self._receiver.cancel()
+        self.client.writer.close()
+
+    async def send(self, recipient_id, payload):
+        client = self.client
+        frame = MessageCrypto.encrypt_message(
+            client.cipher_c2s, client.client_id, recipient_id, client.seq_send, payload
+        )
+        client.seq_send += 1
+        client.writer.writelines(frame.to_wire_parts())
+        await client.writer.drain()
+
+    async def _receive(self, stats):
+        client = self.client
+        source = await frame_reader("streams", client.reader, client.writer)
+        try:
+            while True:
+                for frame in await source.read_frames():
+                    plaintext = MessageCrypto.decrypt_message(client.cipher_s2c, frame)
+                    if plaintext is None:
+                        stats["errors"] += 1
+                        continue
+                    if stats["measuring"]:
+                        stats["latencies"].append(time.perf_counter() - TIMESTAMP.unpack_from(plaintext)[0])
+                    stats["received"] += 1
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+
+
+def targets_for(index, peers, topology, fan):
+    count = len(peers)
+    if topology == "pairs":
+        return [peers[index ^ 1 if (index ^ 1) < count else 0].client_id]
+    if topology == "fan-in":
+        # Os `fan` primeiros recebem de todos os outros
+        return [peers[index % fan].client_id] if index >= fan else []
+    if topology == "fan-out":
+        return [peers[(index + k) % count].client_id for k in range(1, fan + 1)]
+    return None
+
+
+async def send_loop(index, peer, peers, config, deadline, stats):
+    topology = config["topology"]
+    targets = targets_for(index, peers, topology, config["fan"])
+    if targets == []:
+        return
+
+    padding = os.urandom(max(0, config["message_size"] - TIMESTAMP.size))
+    interval = 1.0 / config["rate"] if config["rate"] > 0 else 0.0
+    # Espalha o início dos remetentes ao longo de um intervalo
+    next_at = time.perf_counter() + random.random() * interval
+
+    while True:
+        if interval:
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            next_at += interval
+        if time.perf_counter() >= deadline:
+            return
+        if not peer.connected:
+            await asyncio.sleep(0.01)
+            continue
+
+        payload = TIMESTAMP.pack(time.perf_counter()) + padding
+        recipients = targets if targets is not None else [random.choice(peers).client_id]
+        try:
+            for recipient_id in recipients:
+                await peer.send(recipient_id, payload)
+                stats["sent"] += 1
+        except (ConnectionError, RuntimeError, AttributeError):
+            stats["errors"] += 1
+        if not interval:
+            await asyncio.sleep(0)
+
+
+async def churn_loop(peers, churn, deadline, stats):
+    # `churn` reconexões por segundo (com ticket de retomada, como um cliente real)
+    while True:
+        await asyncio.sleep(random.expovariate(churn))
+        if time.perf_counter() >= deadline:
+            return
+        peer = random.choice(peers)
+        if not peer.connected:
+            continue
+        await peer.disconnect()
+        start = time.perf_counter()
+        if await peer.connect(stats):
+            stats["reconnects"] += 1
+            stats["reconnect_latencies"].append(time.perf_counter() - start)
+        else:
+            stats["errors"] += 1
+
+
+def run_load(worker, port, cert_path, config, barrier, results):
+    logging.disable(logging.CRITICAL)
+    raise_fd_limit()
+    random.seed(worker)
+
+    async def load():
+        stats = {
+            "sent": 0, "received": 0, "errors": 0, "reconnects": 0, "measuring": False,
+            "latencies": array('d'), "reconnect_latencies": array('d'),
+        }
+        peers = [Peer(worker * config["clients"] + i, port, cert_path) for i in range(config["clients"])]
+
+        semaphore = asyncio.Semaphore(config["connect_concurrency"])
+
+        async def connect(peer):
+            async with semaphore:
+                if not await peer.connect(stats):
+                    stats["errors"] += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(connect(p) for p in peers))
+        ramp = time.perf_counter() - start
+
+        await asyncio.get_running_loop().run_in_executor(None, barrier.wait)
+
+        stats["measuring"] = True
+        started = time.perf_counter()
+        deadline = started + config["duration"]
+        tasks = [send_loop(i, p, peers, config, deadline, stats) for i, p in enumerate(peers)]
+        if config["churn"] > 0:
+            tasks.append(churn_loop(peers, config["churn"], deadline, stats))
+        await asyncio.gather(*tasks)
+        sent_window = time.perf_counter() - started
+
+        # Tempo para as últimas mensagens chegarem
+        await asyncio.sleep(config["grace"])
+        stats["measuring"] = False
+        for peer in peers:
+            if peer.connected:
+                await peer.disconnect()
+
+        results.put({
+            "ramp_seconds": ramp,
+            "window_seconds": sent_window,
+            "sent": stats["sent"],
+            "received": stats["received"],
+            "errors": stats["errors"],
+            "reconnects": stats["reconnects"],
+            "latencies": stats["latencies"].tobytes(),
+            "reconnect_latencies": stats["reconnect_latencies"].tobytes(),
+        })
+
+    asyncio.run(load())
+
+
+def run_scenario(config, cert_dir):
+    ctx = multiprocessing.get_context("spawn")
+    ready, results = ctx.Queue(), ctx.Queue()
+    stop = ctx.Event()
+    server_options = {
+        "handshake_executor": config["handshake_executor"],
+        "transport_engine": config["engine"],
+        "outbound_queue_size": config["queue_size"],
+    }
+    server = ctx.Process(target=run_server, args=(server_options, cert_dir, ready, stop))
+    server.start()
+
+    try:
+        port = ready.get(timeout=60)
+        rss_idle, _ = read_rss(server.pid)
+
+        # Um participante extra na barreira: o coordenador mede o RSS após as conexões
+        barrier = ctx.Barrier(config["load_procs"] + 1)
+        cert_path = os.path.join(cert_dir, "server.crt")
+        loaders = [
+            ctx.Process(target=run_load, args=(w, port, cert_path, config, barrier, results))
+            for w in range(config["load_procs"])
+        ]
+        for p in loaders:
+            p.start()
+        barrier.wait(timeout=600)
+        rss_connected, _ = read_rss(server.pid)
+
+        parts = [results.get(timeout=config["duration"] + 600) for _ in loaders]
+        rss_end, rss_peak = read_rss(server.pid)
+        for p in loaders:
+            p.join()
+    finally:
+        stop.set()
+        server.join(timeout=10)
+        if server.is_alive():
+            server.terminate()
+
+    latencies = array('d')
+    reconnect_latencies = array('d')
+    for part in parts:
+        latencies.frombytes(part["latencies"])
+        reconnect_latencies.frombytes(part["reconnect_latencies"])
+    latencies = sorted(latencies)
+    reconnect_latencies = sorted(reconnect_latencies)
+
+    connections = config["clients"] * config["load_procs"]
+    ramp = max(p["ramp_seconds"] for p in parts)
+    window = max(p["window_seconds"] for p in parts)
+    received = sum(p["received"] for p in parts)
+
+    def ms(value):
+        return None if value is None else round(value * 1e3, 3)
+
+    return {
+        "connections": connections,
+        "handshakes_per_sec": round(connections / ramp, 1),
+        "churn_reconnects_per_sec": round(sum(p["reconnects"] for p in parts) / window, 1),
+        "reconnect_latency_ms": {
+            "p50": ms(percentile(reconnect_latencies, 0.50)),
+            "p99": ms(percentile(reconnect_latencies, 0.99)),
+        },
+        "sent": sum(p["sent"] for p in parts),
+        "received": received,
+        "errors": sum(p["errors"] for p in parts),
+        "routed_per_sec": round(received / window, 1),
+        "latency_ms": {
+            "p50": ms(percentile(latencies, 0.50)),
+            "p99": ms(percentile(latencies, 0.99)),
+            "p999": ms(percentile(latencies, 0.999)),
+            "max": ms(latencies[-1] if latencies else None),
+        },
+        "server_rss_kib": {
+            "idle": rss_idle,
+            "connected": rss_connected,
+            "end": rss_end,
+            "peak": rss_peak,
+            "per_connection": (
+                round((rss_connected - rss_idle) / connections, 2)
+                if rss_idle is not None and rss_connected is not None else None
+            ),
+        },
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_summary(name, result):
+    latency = result["latency_ms"]
+    rss = result["server_rss_kib"]
+    print(
+        f"{name}: {result['connections']} conexões, {result['handshakes_per_sec']} handshakes/s, "
+        f"{result['routed_per_sec']} msg/s roteadas, latência p50/p99/p999 = "
+        f"{latency['p50']}/{latency['p99']}/{latency['p999']} ms, "
+        f"RSS {rss['connected']} KiB ({rss['per_connection']} KiB/conexão)"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gerador de carga ponta a ponta para o SecureMessagingServer")
+    parser.add_argument("--clients", type=int, default=1000, help="clientes por processo de carga")
+    parser.add_argument("--load-procs", type=int, default=1)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--rate", type=float, default=5.0, help="mensagens/s por remetente (0 = sem limite)")
+    parser.add_argument("--message-size", type=int, default=64)
+    parser.add_argument("--topology", choices=TOPOLOGIES, default="pairs")
+    parser.add_argument("--fan", type=int, default=8, help="destinatários (fan-out) ou receptores (fan-in)")
+    parser.add_argument("--churn", type=float, default=0.0, help="reconexões por segundo em cada processo de carga")
+    parser.add_argument("--connect-concurrency", type=int, default=64)
+    parser.add_argument("--grace", type=float, default=1.0, help="espera (s) pelas últimas mensagens")
+    parser.add_argument("--engine", default="streams")
+    parser.add_argument("--handshake-executor", default="thread")
+    parser.add_argument("--queue-size", type=int, default=1024)
+    parser.add_argument("--suite", action="store_true", help="roda os cenários pré-definidos")
+    parser.add_argument("--output", help="arquivo JSON de resultados")
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    raise_fd_limit()
+    base = {
+        "clients": args.clients,
+        "load_procs": args.load_procs,
+        "duration": args.duration,
+        "rate": args.rate,
+        "message_size": args.message_size,
+        "topology": args.topology,
+        "fan": args.fan,
+        "churn": args.churn,
+        "connect_concurrency": args.connect_concurrency,
+        "grace": args.grace,
+        "engine": args.engine,
+        "handshake_executor": args.handshake_executor,
+        "queue_size": args.queue_size,
+    }
+    scenarios = {name: dict(base, **overrides) for name, overrides in SUITE.items()} if args.suite \
+        else {"custom": base}
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "scenarios": {},
+    }
+    with tempfile.TemporaryDirectory() as cert_dir:
+        for name, config in scenarios.items():
+            result = run_scenario(config, cert_dir)
+            report["scenarios"][name] = {"config": config, "results": result}
+            print_summary(name, result)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Resultados salvos em {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,25 @@
 import asyncio
 import logging
+import os
+import time
 import uuid
-from typing import Optional
+from typing import AsyncIterable, AsyncIterator, Dict, Iterable, List, Optional, Sequence, Tuple, Union
 from protocol import (
-    ClientHandshake, MessageCrypto, MessageFrame
+    ClientHandshake, MessageCrypto, MessageFrame,
+    HandshakeResponse, ResumeResponse, FRAME_HEADER,
+    EXT_COMPRESSION, EXT_WIRE_FORMAT, EXT_REKEY, EXT_SESSION_TICKET, encode_extensions, decode_extensions,
+    STREAM_CHUNK_FLAG, CHUNK_HEADER, CHUNK_FINAL, CONTROL_FLAG, SEQ_MASK,
+    CONTROL_HANDLE, CONTROL_PING, CONTROL_PONG, CONTROL_REKEY
+)
+from crypto import AESGCMCipher, PublicKeyMaterial, ServerTrust
+from framing import frame_reader, TRANSPORT_ENGINES
+from eventlog import EventLog, start_async_logging, stop_async_logging
+from compression import DeflateCodec, DEFAULT_DICTIONARY
+from replay import ReplayWindow
+from rekey import KeyRatchet
+from wire import (
+    WIRE_V1, WIRE_V2, MAX_HANDLES, PEER_ID_SIZE,
+    CompactFrameEncoder, CompactFrameDecoder, decode_varint
 )
 
 
@@ -13,6 +29,82 @@ logging.basicConfig(
 )
 logger = logging.getLogger("Client")
 
+TAG_SIZE = 16
+# Abaixo do max_frame_size padrão do servidor (1 MiB) com folga
+STREAM_CHUNK_SIZE = 64 * 1024
+
+StreamSource = Union[bytes, bytearray, memoryview, Iterable[bytes], AsyncIterable[bytes]]
+
+
+class ReceivedMessage:
+    __slots__ = (
+        'sender_id', 'recipient_id', 'seq_no', 'payload', 'received_at', 'stream_id', 'chunk_index', 'final'
+    )
+
+    def __init__(
+        self,
+        sender_id: bytes,
+        recipient_id: bytes,
+        seq_no: int,
+        payload: Union[str, bytes],
+        received_at: float,
+        stream_id: Optional[int] = None,
+        chunk_index: int = 0,
+        final: bool = True
+    ):
+        self.sender_id = sender_id
+        self.recipient_id = recipient_id
+        self.seq_no = seq_no
+        # str (UTF-8) por padrão; bytes com messages(raw=True) e em pedaços de stream
+        self.payload = payload
+        self.received_at = received_at
+        # Pedaço de stream: stream_id do remetente, posição e se é o último
+        self.stream_id = stream_id
+        self.chunk_index = chunk_index
+        self.final = final
+
+    def __repr__(self) -> str:
+        stream = "" if self.stream_id is None else f"stream_id={self.stream_id:016x}, chunk_index={self.chunk_index}, "
+        return (
+            f"ReceivedMessage(sender_id={self.sender_id.hex()}, seq_no={self.seq_no}, {stream}"
+            f"size={len(self.payload)}, received_at={self.received_at:.6f})"
+        )
+
+
+async def iter_chunks(source: StreamSource, chunk_size: int) -> AsyncIterator[bytes]:
+    # Bytes em fatias sem cópia; arquivos (read síncrono ou corrotina) e
+    # iteráveis lidos aos poucos, sem nunca ter o payload inteiro em memória
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        view = memoryview(source)
+        for offset in range(0, len(view), chunk_size):
+            yield view[offset:offset + chunk_size]
+        return
+
+    if hasattr(source, "read"):
+        while True:
+            data = source.read(chunk_size)
+            if asyncio.iscoroutine(data):
+                data = await data
+            if not data:
+                return
+            yield data
+
+    buffer = bytearray()
+    if hasattr(source, "__aiter__"):
+        async for data in source:
+            buffer += data
+            while len(buffer) >= chunk_size:
+                yield bytes(buffer[:chunk_size])
+                del buffer[:chunk_size]
+    else:
+        for data in source:
+            buffer += data
+            while len(buffer) >= chunk_size:
+                yield bytes(buffer[:chunk_size])
+                del buffer[:chunk_size]
+    if buffer:
+        yield bytes(buffer)
+
 
 class SecureMessagingClient:
 
@@ -21,33 +113,135 @@ class SecureMessagingClient:
         username: str,
         server_host: str = "127.0.0.1",
         server_port: int = 9999,
-        server_cert_path: str = "../certs/server.crt"
+        server_cert_path: Optional[str] = "../certs/server.crt",
+        server_fingerprints: Sequence[Union[str, bytes]] = (),
+        transport_engine: str = "streams",
+        log_sample_every: int = 1,
+        log_rate_limit: float = 10.0,
+        log_plaintext: bool = False,
+        event_ring_size: int = 1024,
+        compression: bool = False,
+        compression_dictionaries: Sequence[bytes] = (DEFAULT_DICTIONARY,),
+        compression_level: int = 6,
+        compression_threshold: int = 32,
+        replay_window_size: int = 1024,
+        wire_format: int = WIRE_V1,
+        session_tickets: bool = False,
+        rekey_after_messages: int = 0,
+        rekey_after_bytes: int = 0
     ):
+        if transport_engine not in TRANSPORT_ENGINES:
+            raise ValueError(f"Motor de transporte inválido: {transport_engine}")
+
         self.username = username
         self.client_id = uuid.uuid4().bytes
         self.server_host = server_host
         self.server_port = server_port
         self.server_cert_path = server_cert_path
+        # Impressões digitais (SHA-256 da chave pública) fixadas; sem server_cert_path,
+        # a chave apresentada pelo servidor é aceita só se a impressão bater
+        self.server_fingerprints = tuple(server_fingerprints)
+        # Chave confiável já carregada, montada no primeiro handshake; clientes do
+        # mesmo servidor podem compartilhar uma
+        self.server_trust: Optional[ServerTrust] = None
+        self.transport_engine = transport_engine
+
+        self.log_plaintext = log_plaintext
+        self.events = EventLog(logger, ring_size=event_ring_size)
+        for kind in ("message_sent", "message_received"):
+            self.events.policy(kind, sample_every=log_sample_every)
+        for kind in ("replay", "auth_failure", "invalid_payload", "stream_error"):
+            self.events.policy(kind, max_per_second=log_rate_limit)
 
         self.reader: Optional[asyncio.StreamReader] = None
         self.writer: Optional[asyncio.StreamWriter] = None
 
         self.key_c2s: Optional[bytes] = None
         self.key_s2c: Optional[bytes] = None
+        self.cipher_c2s: Optional[AESGCMCipher] = None
+        self.cipher_s2c: Optional[AESGCMCipher] = None
+
+        # Pede ticket de retomada no hello (EXT_SESSION_TICKET) e guarda o recebido
+        # no último handshake. Desligado, o hello é o original
+        self.session_tickets = session_tickets
+        self.session_ticket: Optional[bytes] = None
+        self.resumption_secret: Optional[bytes] = None
+        self.ticket_expires_at = 0.0
 
         self.seq_send = 0
-        self.seq_recv = -1
+        self.replay_window = ReplayWindow(replay_window_size)
+        # Troca de chaves em banda (EXT_REKEY): a chave cliente -> servidor anda
+        # depois de tantos frames ou bytes (0 desliga cada limite). Desligada por
+        # padrão: oferecer a extensão muda o hello, e servidores antigos não o leem
+        self.rekey_after_messages = rekey_after_messages
+        self.rekey_after_bytes = rekey_after_bytes
+        self.rekey: Optional[KeyRatchet] = None
+        self._receiving = False
+        # Recepção: a tarefa de leitura da conexão (com o decodificador e o frame
+        # parcial) e a fila de mensagens prontas ficam no cliente, então um break
+        # no messages() não perde nada e o próximo consumidor continua de onde parou
+        self._reader_task: Optional[asyncio.Task] = None
+        self._inbox: Optional[asyncio.Queue] = None
+        # Próximo índice esperado por (remetente, stream_id) nos streams recebidos
+        self._streams: Dict[Tuple[bytes, int], int] = {}
+
+        # Codecs oferecidos no hello, em ordem de preferência (o último sem dicionário)
+        self.compression_codecs: List[DeflateCodec] = []
+        if compression:
+            for dictionary in (*compression_dictionaries, b''):
+                self.compression_codecs.append(
+                    DeflateCodec(dictionary, level=compression_level, threshold=compression_threshold)
+                )
+        # Codec aceito pelo servidor nesta conexão (None = sem compressão)
+        self.codec: Optional[DeflateCodec] = None
+        # Liga/desliga a compressão dos envios sem renegociar (o marcador vai em cada mensagem)
+        self.compress_outbound = True
+
+        # Formato de frame oferecido (WIRE_V2 cai para v1 se o servidor não aceitar)
+        # e o aceito nesta conexão. Na v2: handles que o servidor deu aos nossos
+        # destinatários e os dos remetentes, ligados nos frames recebidos
+        self.offered_wire_format = wire_format
+        self.wire_format = WIRE_V1
+        self.recipient_handles: Dict[bytes, int] = {}
+        self.sender_ids: Dict[int, bytes] = {}
+        self._encoder: Optional[CompactFrameEncoder] = None
+
+        # Heartbeat: o servidor manda PING a sessões ociosas e a recepção responde;
+        # ping() mede o RTT (preenchido quando o PONG chega por messages())
+        self.last_rtt: Optional[float] = None
 
         logger.info(f"Cliente inicializado: {username} ({self.client_id.hex()})")
 
     async def connect(self) -> bool:
+        # Leitura da conexão anterior para aqui sem encerrar a recepção: o que ela
+        # já enfileirou segue para o messages() em andamento (ou o próximo), antes
+        # das mensagens da conexão nova, lidas por uma tarefa nova na mesma fila
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            self._reader_task = None
+        connected = await self._open_session()
+        if self._inbox is not None:
+            if connected:
+                self._reader_task = asyncio.create_task(self._read_messages(self._inbox))
+            else:
+                self._end_inbox()
+        return connected
+
+    async def _open_session(self) -> bool:
         try:
             self.reader, self.writer = await asyncio.open_connection(
                 self.server_host, self.server_port
             )
             logger.info(f"Conectado ao servidor {self.server_host}:{self.server_port}")
 
-            handshake = ClientHandshake(self.client_id)
+            handshake = ClientHandshake(self.client_id, self._offered_extensions())
+
+            if self.session_ticket is not None and time.time() < self.ticket_expires_at:
+                if await self._resume_session(handshake):
+                    logger.info("Sessão retomada por ticket (sem RSA/ECDH)")
+                    return True
+                logger.info("Ticket recusado, refazendo handshake completo")
+
             initial_message = handshake.get_initial_message()
 
             self.writer.write(initial_message)
@@ -55,27 +249,32 @@ class SecureMessagingClient:
 
             logger.info("Mensagem inicial enviada (client_id + pk_C)")
 
-            response_header = await self.reader.readexactly(4)
-            response_size = int.from_bytes(response_header, 'big')
-            response_data = await self.reader.readexactly(response_size)
-
-            from protocol import HandshakeResponse
+            response_data = await self._read_handshake_message()
             handshake_response = HandshakeResponse.from_bytes(response_data)
 
             logger.info("Resposta do servidor recebida (pk_S + cert + sig + salt)")
 
-            with open(self.server_cert_path, 'rb') as f:
-                server_certificate_pem = f.read()
-
             try:
-                self.key_c2s, self.key_s2c, _ = handshake.process_handshake_response(
-                    handshake_response, server_certificate_pem
+                key_c2s, key_s2c, _ = handshake.process_handshake_response(
+                    handshake_response, self._server_trust()
                 )
+                # Servidor que não conhece o hello estendido leu as extensões como
+                # pk_C: a resposta vem sem o bloco de extensões e a sessão não abriria
+                if handshake.extensions and not handshake_response.extended:
+                    raise ValueError("Servidor não reconheceu as extensões do hello")
+                self._install_session_keys(key_c2s, key_s2c)
+                self._accept_extensions(handshake_response.extensions)
                 logger.info("Assinatura RSA validada e chaves derivadas")
             except ValueError as e:
                 logger.error(f"Validação falhou: {e}")
                 return False
 
+            self._store_ticket(
+                handshake,
+                handshake_response.session_ticket,
+                handshake_response.ticket_lifetime
+            )
+
             logger.info("Handshake concluído com sucesso")
             return True
 
@@ -83,97 +282,549 @@ class SecureMessagingClient:
             logger.error(f"Erro ao conectar: {e}")
             return False
 
+    def _server_trust(self) -> ServerTrust:
+        # Certificado lido e carregado uma vez, não a cada conexão; para trocar
+        # de certificado em execução, zere client.server_trust
+        if self.server_trust is None:
+            trusted = PublicKeyMaterial.from_file(self.server_cert_path) if self.server_cert_path else None
+            self.server_trust = ServerTrust(trusted, self.server_fingerprints)
+        return self.server_trust
+
+    async def _resume_session(self, handshake: ClientHandshake) -> bool:
+        self.writer.write(handshake.get_resume_message(self.session_ticket))
+        await self.writer.drain()
+
+        resume_response = ResumeResponse.from_bytes(await self._read_handshake_message())
+        if not resume_response.accepted:
+            self.session_ticket = None
+            self.resumption_secret = None
+            return False
+
+        key_c2s, key_s2c = handshake.process_resume_response(
+            resume_response, self.resumption_secret
+        )
+        self._install_session_keys(key_c2s, key_s2c)
+        self._accept_extensions(resume_response.extensions)
+        self._store_ticket(
+            handshake,
+            resume_response.session_ticket,
+            resume_response.ticket_lifetime
+        )
+        return True
+
+    async def _read_handshake_message(self) -> bytes:
+        response_header = await self.reader.readexactly(4)
+        response_size = int.from_bytes(response_header, 'big')
+        return await self.reader.readexactly(response_size)
+
+    def _install_session_keys(self, key_c2s: bytes, key_s2c: bytes):
+        self.key_c2s, self.key_s2c = key_c2s, key_s2c
+        self.cipher_c2s, self.cipher_s2c = MessageCrypto.session_ciphers(key_c2s, key_s2c)
+        # Nova sessão no servidor: contadores recomeçam
+        self.seq_send = 0
+        self.replay_window.reset()
+        self._streams.clear()
+        self.rekey = None
+        # Handles valem só na sessão em que foram atribuídos
+        self.wire_format = WIRE_V1
+        self._encoder = None
+        self.recipient_handles.clear()
+        self.sender_ids.clear()
+
+    @property
+    def seq_recv(self) -> int:
+        return self.replay_window.highest
+
+    def _offered_extensions(self) -> bytes:
+        extensions = {}
+        if self.compression_codecs:
+            extensions[EXT_COMPRESSION] = b''.join(codec.dictionary_id for codec in self.compression_codecs)
+        if self.offered_wire_format == WIRE_V2:
+            extensions[EXT_WIRE_FORMAT] = bytes((WIRE_V2, WIRE_V1))
+        if self.session_tickets:
+            extensions[EXT_SESSION_TICKET] = b''
+        # Com os dois limites em 0 o cliente não troca chaves nem oferece a extensão
+        if self.rekey_after_messages or self.rekey_after_bytes:
+            extensions[EXT_REKEY] = b''
+        return encode_extensions(extensions)
+
+    def _accept_extensions(self, extensions: bytes):
+        accepted = decode_extensions(extensions)
+        dictionary_id = accepted.get(EXT_COMPRESSION)
+        # Só vale um id que foi oferecido; sem eco o servidor não comprime
+        self.codec = next(
+            (codec for codec in self.compression_codecs if codec.dictionary_id == dictionary_id),
+            None
+        )
+        if self.codec is not None:
+            logger.info(f"Compressão negociada (dicionário {self.codec.dictionary_id.hex()})")
+
+        if self.offered_wire_format == WIRE_V2 and accepted.get(EXT_WIRE_FORMAT) == bytes((WIRE_V2,)):
+            self.wire_format = WIRE_V2
+            self._encoder = CompactFrameEncoder(server_side=False, handles=self.recipient_handles)
+            logger.info("Formato de frame v2 negociado")
+
+        if EXT_REKEY in accepted:
+            self.rekey = KeyRatchet(self.rekey_after_messages, self.rekey_after_bytes)
+
+    def _store_ticket(self, handshake: ClientHandshake, session_ticket: bytes, lifetime: int):
+        if not session_ticket:
+            self.session_ticket = None
+            self.resumption_secret = None
+            return
+        self.session_ticket = session_ticket
+        self.resumption_secret = handshake.resumption_secret
+        self.ticket_expires_at = time.time() + lifetime
+
     async def send_message(self, recipient_username: str, recipient_id: bytes, message: str) -> bool:
-        if self.writer is None or self.key_c2s is None:
+        if self.writer is None or self.cipher_c2s is None:
             logger.warning("Não conectado ao servidor")
             return False
 
         try:
+            plaintext = self._pack(message.encode('utf-8'))
             frame = MessageCrypto.encrypt_message(
-                key=self.key_c2s,
+                key=self.cipher_c2s,
                 sender_id=self.client_id,
                 recipient_id=recipient_id,
                 seq_no=self.seq_send,
-                plaintext=message.encode('utf-8')
+                plaintext=plaintext,
+                counter=self.wire_format == WIRE_V2
             )
 
             self.seq_send += 1
 
-            frame_bytes = (
-                frame.nonce +
-                frame.sender_id +
-                frame.recipient_id +
-                int.to_bytes(frame.seq_no, 8, 'big') +
-                int.to_bytes(len(frame.ciphertext_with_tag), 4, 'big') +
-                frame.ciphertext_with_tag
-            )
-
-            self.writer.write(frame_bytes)
+            self.writer.writelines(self._sealed_parts(frame, len(plaintext)))
             await self.writer.drain()
 
-            logger.info(f"Mensagem enviada para {recipient_username}")
+            self.events.event("message_sent", logging.INFO, "Mensagem enviada para %s", recipient_username)
             return True
 
         except Exception as e:
             logger.error(f"Erro ao enviar mensagem: {e}")
             return False
 
-    async def receive_messages(self):
-        if self.reader is None or self.key_s2c is None:
-            logger.warning("Não conectado ao servidor")
-            return
+    def _encode_message(self, recipient_id: bytes, payload: bytes) -> List[bytes]:
+        plaintext = self._pack(payload)
+        frame = MessageCrypto.encrypt_message(
+            key=self.cipher_c2s,
+            sender_id=self.client_id,
+            recipient_id=recipient_id,
+            seq_no=self.seq_send,
+            plaintext=plaintext,
+            counter=self.wire_format == WIRE_V2
+        )
+        self.seq_send += 1
+        return self._sealed_parts(frame, len(plaintext))
+
+    def _wire_parts(self, frame: MessageFrame) -> List[bytes]:
+        if self._encoder is None:
+            return frame.to_wire_parts()
+        return self._encoder.encode(frame)
+
+    def _sealed_parts(self, frame: MessageFrame, size: int) -> List[bytes]:
+        # Partes do frame no fio. Se ele fechou a cota da chave, segue o REKEY
+        # (ainda sob a chave atual) e os próximos envios já usam a da nova época
+        parts = self._wire_parts(frame)
+        if self.rekey is None or not self.rekey.count(size):
+            return parts
+        payload, cipher = self.rekey.ratchet_send(self.cipher_c2s)
+        rekey_frame = MessageCrypto.encrypt_control(
+            self.cipher_c2s, self.seq_send, payload, self.wire_format == WIRE_V2
+        )
+        self.seq_send += 1
+        self.cipher_c2s = cipher
+        return parts + self._wire_parts(rekey_frame)
+
+    def _write_control(self, payload: bytes):
+        frame = MessageCrypto.encrypt_control(self.cipher_c2s, self.seq_send, payload, self.wire_format == WIRE_V2)
+        self.seq_send += 1
+        self.writer.writelines(self._sealed_parts(frame, len(payload)))
 
+    async def ping(self) -> bool:
+        if self.writer is None or self.cipher_c2s is None:
+            logger.warning("Não conectado ao servidor")
+            return False
         try:
-            while True:
-                header = await self.reader.readexactly(52)
+            self._write_control(bytes((CONTROL_PING,)) + time.monotonic_ns().to_bytes(8, 'big'))
+            await self.writer.drain()
+            return True
+        except Exception as e:
+            logger.error(f"Erro ao enviar ping: {e}")
+            return False
 
-                size_data = await self.reader.readexactly(4)
-                ciphertext_size = int.from_bytes(size_data, 'big')
-                ciphertext_with_tag = await self.reader.readexactly(ciphertext_size)
+    def _pack(self, payload: bytes) -> bytes:
+        if self.codec is None:
+            return payload
+        return self.codec.pack(payload, self.compress_outbound)
 
-                frame_data = header + size_data + ciphertext_with_tag
-                frame = self._parse_frame_with_size(frame_data)
+    async def send_many(
+        self,
+        messages: Union[Iterable[Tuple[bytes, Union[str, bytes]]], AsyncIterable[Tuple[bytes, Union[str, bytes]]]],
+        window_bytes: int = 256 * 1024,
+        linger: float = 0.001
+    ) -> List[bool]:
+        # Um resultado por mensagem consumida, na ordem de entrada: False para
+        # entradas inválidas e, se a conexão cai, para a janela ainda sem drain.
+        # As mensagens são cifradas só na hora da escrita (um writelines por
+        # janela), então o seq segue a ordem do fio mesmo com outros envios
+        # intercalados enquanto uma fonte assíncrona espera.
+        results: List[bool] = []
+        if self.writer is None or self.cipher_c2s is None:
+            logger.warning("Não conectado ao servidor")
+            return results
+
+        loop = asyncio.get_running_loop()
+        pending: List[Tuple[bytes, bytes]] = []
+        window = 0
+        window_start = 0
+        timer = None
+
+        def write_pending():
+            nonlocal pending, timer
+            if timer is not None:
+                timer.cancel()
+                timer = None
+            if not pending:
+                return
+            parts: List[bytes] = []
+            for recipient_id, payload in pending:
+                parts.extend(self._encode_message(recipient_id, payload))
+            pending = []
+            self.writer.writelines(parts)
+
+        def write_lingering():
+            nonlocal timer
+            timer = None
+            try:
+                write_pending()
+            except Exception as e:
+                logger.error(f"Erro ao enviar mensagens: {e}")
 
-                if frame.seq_no <= self.seq_recv:
-                    logger.warning("Ataque de replay detectado")
-                    continue
+        async def drain() -> bool:
+            nonlocal window, window_start
+            try:
+                write_pending()
+                await self.writer.drain()
+            except Exception as e:
+                logger.error(f"Erro ao enviar mensagens: {e}")
+                for i in range(window_start, len(results)):
+                    results[i] = False
+                return False
+            window = 0
+            window_start = len(results)
+            return True
 
-                self.seq_recv = frame.seq_no
+        def add(recipient_id, payload) -> bool:
+            nonlocal window
+            if isinstance(payload, str):
+                payload = payload.encode('utf-8')
+            if len(recipient_id) != 16 or not isinstance(payload, (bytes, bytearray, memoryview)):
+                results.append(False)
+                return False
+            pending.append((recipient_id, payload))
+            window += FRAME_HEADER.size + len(payload) + TAG_SIZE
+            results.append(True)
+            return window >= window_bytes
 
-                plaintext = MessageCrypto.decrypt_message(
-                    self.key_s2c, frame
+        try:
+            if hasattr(messages, "__aiter__"):
+                async for recipient_id, payload in messages:
+                    if add(recipient_id, payload):
+                        if not await drain():
+                            return results
+                    elif pending and timer is None:
+                        # Fonte lenta: o que já chegou sai em até linger segundos
+                        timer = loop.call_later(linger, write_lingering)
+            else:
+                for recipient_id, payload in messages:
+                    if add(recipient_id, payload) and not await drain():
+                        return results
+
+            if await drain():
+                self.events.event(
+                    "message_sent", logging.INFO, "%d mensagens enviadas em lote", results.count(True)
                 )
+            return results
+        finally:
+            if timer is not None:
+                timer.cancel()
+
+    async def send_stream(
+        self,
+        recipient_id: bytes,
+        source: StreamSource,
+        chunk_size: int = STREAM_CHUNK_SIZE
+    ) -> bool:
+        # Payload de qualquer tamanho em pedaços de até chunk_size, cada um com o
+        # próprio tag. Só um pedaço em memória por vez e drain() a cada um
+        if self.writer is None or self.cipher_c2s is None:
+            logger.warning("Não conectado ao servidor")
+            return False
+        if len(recipient_id) != 16 or chunk_size < 1:
+            return False
 
-                if plaintext is None:
-                    logger.warning("Falha na validação de autenticidade")
-                    continue
+        stream_id = int.from_bytes(os.urandom(8), 'big')
+        index = 0
+        total = 0
+        try:
+            # Um pedaço de atraso: o último sai com o flag final
+            previous = None
+            async for chunk in iter_chunks(source, chunk_size):
+                if previous is not None:
+                    self._write_chunk(recipient_id, stream_id, index, 0, previous)
+                    index += 1
+                    await self.writer.drain()
+                previous = chunk
+                total += len(chunk)
+            self._write_chunk(recipient_id, stream_id, index, CHUNK_FINAL, previous or b'')
+            await self.writer.drain()
+        except Exception as e:
+            logger.error(f"Erro ao enviar stream: {e}")
+            return False
 
-                message_text = plaintext.decode('utf-8', errors='ignore')
-                sender_id = frame.sender_id.hex()
+        self.events.event(
+            "message_sent", logging.INFO, "Stream de %d bytes (%d pedaços) enviado", total, index + 1
+        )
+        return True
 
-                logger.info(f"[{sender_id[:8]}]: {message_text}")
-                print(f"\n[Mensagem de {sender_id[:8]}]: {message_text}")
+    def _write_chunk(self, recipient_id: bytes, stream_id: int, index: int, flags: int, payload: bytes):
+        frame = MessageCrypto.encrypt_chunk(
+            key=self.cipher_c2s,
+            sender_id=self.client_id,
+            recipient_id=recipient_id,
+            seq_no=self.seq_send,
+            chunk_header=CHUNK_HEADER.pack(stream_id, index, flags),
+            plaintext=payload,
+            counter=self.wire_format == WIRE_V2
+        )
+        self.seq_send += 1
+        self.writer.writelines(self._sealed_parts(frame, len(payload)))
+
+    async def messages(self, raw: bool = False, max_buffered: int = 1024) -> AsyncIterator["ReceivedMessage"]:
+        # Fila limitada entre a leitura e o consumidor: cheia, a leitura para,
+        # o buffer do socket enche e o TCP segura o servidor. A fila é criada na
+        # primeira chamada (max_buffered vale a partir daí) e sair do async for
+        # não cancela a leitura: o que chegar espera pelo próximo consumidor
+        if self.reader is None or self.cipher_s2c is None:
+            logger.warning("Não conectado ao servidor")
+            return
+        if self._receiving:
+            raise RuntimeError("Recepção já em andamento nesta conexão")
+
+        if self._inbox is None:
+            self._inbox = asyncio.Queue(max_buffered)
+        inbox = self._inbox
+        if self._reader_task is None:
+            self._reader_task = asyncio.create_task(self._read_messages(inbox))
+
+        self._receiving = True
+        try:
+            while True:
+                message = await inbox.get()
+                if message is None:
+                    if self._reader_task is not None and not self._reader_task.done():
+                        # Fim de uma conexão anterior; a atual continua
+                        continue
+                    # Fim da conexão: fica na fila para os próximos consumidores
+                    inbox.put_nowait(None)
+                    return
+                if not raw and message.stream_id is None:
+                    message.payload = message.payload.decode('utf-8', errors='ignore')
+                yield message
+        finally:
+            self._receiving = False
+
+    async def _read_messages(self, queue: asyncio.Queue):
+        try:
+            decoder = None
+            if self.wire_format == WIRE_V2:
+                decoder = CompactFrameDecoder(self.client_id, self.sender_ids, server_side=False)
+            source = await frame_reader(self.transport_engine, self.reader, self.writer, decoder=decoder)
+            while True:
+                for frame in await source.read_frames():
+                    if frame.seq_no & CONTROL_FLAG:
+                        self._open_control(frame)
+                        continue
+                    if frame.seq_no & STREAM_CHUNK_FLAG:
+                        message = self._open_chunk(frame)
+                        if message is None:
+                            continue
+                    else:
+                        plaintext = self._open_frame(frame)
+                        if plaintext is None:
+                            continue
+
+                        # Decodificado (ou não) por quem consome, conforme o raw dele
+                        message = ReceivedMessage(
+                            frame.sender_id,
+                            frame.recipient_id,
+                            frame.seq_no,
+                            plaintext,
+                            time.time()
+                        )
+                    if queue.full():
+                        await queue.put(message)
+                    else:
+                        queue.put_nowait(message)
 
         except asyncio.IncompleteReadError:
             logger.info("Conexão fechada pelo servidor")
         except Exception as e:
             logger.error(f"Erro ao receber mensagens: {e}")
+        finally:
+            # Também se cancelada. A leitura trocada por connect() não encerra a
+            # recepção: a da conexão nova continua na mesma fila
+            if self._reader_task is asyncio.current_task():
+                self._end_inbox()
+
+    def _end_inbox(self):
+        # Fim da recepção para quem está (ou entrar) em messages(); com a fila
+        # cheia, o marcador entra quando o consumidor abrir vaga
+        inbox = self._inbox
+        if inbox is None:
+            return
+        if inbox.full():
+            asyncio.ensure_future(inbox.put(None))
+        else:
+            inbox.put_nowait(None)
+
+    def _check_replay(self, seq_no: int, accept: bool = False) -> bool:
+        # Consulta antes de decifrar; marca (accept) só depois do tag validado
+        window = self.replay_window
+        if window.accept(seq_no) if accept else window.check(seq_no):
+            return True
+        self.events.event("replay", logging.WARNING, "Ataque de replay detectado")
+        return False
+
+    def _receive_cipher(self, seq_no: int) -> AESGCMCipher:
+        # A chave anterior do servidor ainda vale para frames de antes da última troca
+        if self.rekey is None:
+            return self.cipher_s2c
+        return self.rekey.receive_cipher(self.cipher_s2c, seq_no, self.replay_window)
+
+    def _open_control(self, frame: MessageFrame):
+        seq_no = frame.seq_no & SEQ_MASK
+        if not self._check_replay(seq_no):
+            return
+        payload = MessageCrypto.decrypt_message(self._receive_cipher(seq_no), frame)
+        if payload is None:
+            self.events.event("auth_failure", logging.WARNING, "Falha na validação de autenticidade")
+            return
+        if not self._check_replay(seq_no, accept=True):
+            return
 
-    def _parse_frame_with_size(self, data: bytes) -> MessageFrame:
-        nonce = data[0:12]
-        sender_id = data[12:28]
-        recipient_id = data[28:44]
-        seq_no = int.from_bytes(data[44:52], 'big')
-        ciphertext_with_tag = data[56:]
+        control_type = payload[:1]
+        if control_type == bytes((CONTROL_PING,)):
+            try:
+                self._write_control(bytes((CONTROL_PONG,)) + payload[1:])
+            except Exception as e:
+                logger.error(f"Erro ao responder ping: {e}")
+            return
+        if control_type == bytes((CONTROL_PONG,)):
+            if len(payload) == 9:
+                self.last_rtt = (time.monotonic_ns() - int.from_bytes(payload[1:], 'big')) / 1e9
+            return
+        if control_type == bytes((CONTROL_REKEY,)) and self.rekey is not None:
+            # Frames do servidor a partir do próximo seq vêm com a chave da nova época
+            cipher = self.rekey.ratchet_receive(self.cipher_s2c, payload, seq_no)
+            if cipher is not None:
+                self.cipher_s2c = cipher
+                return
+
+        if control_type == bytes((CONTROL_HANDLE,)):
+            # Handle curto para um destinatário: os próximos envios para ele o usam
+            try:
+                handle, offset = decode_varint(payload, 1)
+            except IndexError:
+                handle, offset = 0, 0
+            recipient_id = payload[offset:offset + PEER_ID_SIZE]
+            if 0 < handle <= MAX_HANDLES and len(recipient_id) == PEER_ID_SIZE:
+                self.recipient_handles[recipient_id] = handle
+                return
+        self.events.event("invalid_payload", logging.WARNING, "Frame de controle inválido")
+
+    def _open_chunk(self, frame: MessageFrame) -> Optional[ReceivedMessage]:
+        seq_no = frame.seq_no & SEQ_MASK
+        if not self._check_replay(seq_no):
+            return None
+
+        opened = MessageCrypto.decrypt_chunk(self._receive_cipher(seq_no), frame)
+        if opened is None:
+            self.events.event("auth_failure", logging.WARNING, "Falha na validação de autenticidade")
+            return None
+        if not self._check_replay(seq_no, accept=True):
+            return None
+
+        chunk_header, payload = opened
+        stream_id, index, flags = CHUNK_HEADER.unpack(chunk_header)
+        key = (frame.sender_id, stream_id)
+        # Pedaço fora de ordem: o stream é abandonado (os seguintes também são recusados)
+        if self._streams.pop(key, 0) != index:
+            self.events.event("stream_error", logging.WARNING, "Pedaço de stream fora de ordem de %s", frame.sender_id)
+            return None
+
+        final = bool(flags & CHUNK_FINAL)
+        if not final:
+            self._streams[key] = index + 1
+
+        self.events.event(
+            "message_received", logging.INFO, "Pedaço %d de stream de %s (%d bytes)",
+            index, frame.sender_id, len(payload)
+        )
+        return ReceivedMessage(
+            frame.sender_id,
+            frame.recipient_id,
+            seq_no,
+            payload,
+            time.time(),
+            stream_id,
+            index,
+            final
+        )
 
-        return MessageFrame(
-            nonce=nonce,
-            sender_id=sender_id,
-            recipient_id=recipient_id,
-            seq_no=seq_no,
-            ciphertext_with_tag=ciphertext_with_tag
+    def _open_frame(self, frame: MessageFrame) -> Optional[bytes]:
+        if not self._check_replay(frame.seq_no):
+            return None
+
+        plaintext = MessageCrypto.decrypt_message(
+            self._receive_cipher(frame.seq_no), frame
         )
 
+        if plaintext is None:
+            self.events.event("auth_failure", logging.WARNING, "Falha na validação de autenticidade")
+            return None
+        if not self._check_replay(frame.seq_no, accept=True):
+            return None
+
+        if self.codec is not None:
+            plaintext = self.codec.unpack(plaintext)
+            if plaintext is None:
+                self.events.event("invalid_payload", logging.WARNING, "Mensagem comprimida inválida")
+                return None
+
+        if self.log_plaintext:
+            self.events.event(
+                "message_received", logging.INFO, "[%s]: %s",
+                frame.sender_id, plaintext.decode('utf-8', errors='ignore')
+            )
+        else:
+            self.events.event(
+                "message_received", logging.INFO, "Mensagem de %s (%d bytes)", frame.sender_id, len(plaintext)
+            )
+        return plaintext
+
+    async def receive_messages(self):
+        async for message in self.messages():
+            if message.stream_id is not None:
+                end = " (fim)" if message.final else ""
+                print(
+                    f"\n[Stream de {message.sender_id.hex()[:8]}]: pedaço {message.chunk_index}, "
+                    f"{len(message.payload)} bytes{end}"
+                )
+                continue
+            print(f"\n[Mensagem de {message.sender_id.hex()[:8]}]: {message.payload}")
+
     async def interactive_session(self):
         print(f"\nConectado como: {self.username} ({self.client_id.hex()[:8]})")
         print("Formato de comando: /msg <recipient_id_hex> <mensagem>")
@@ -237,4 +888,8 @@ async def main():
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    start_async_logging()
+    try:
+        asyncio.run(main())
+    finally:
+        stop_async_logging()
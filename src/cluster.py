@@ -0,0 +1,397 @@
+import abc
+import argparse
+import asyncio
+import logging
+import os
+import struct
+from typing import Dict, List, Optional, Tuple
+
+from forwarding import (
+    ForwardLink, RecipientDispatcher, Record, accept_link, check_link_secret, read_records,
+    RECORD_HELLO, RECORD_PRESENCE, message_record, parse_message_record
+)
+from server import SecureMessagingServer
+
+
+logger = logging.getLogger("Cluster")
+
+NO_ID = bytes(16)
+PRESENCE_ENTRY = struct.Struct('>16s?')
+
+# (client_id, online)
+PresenceUpdate = Tuple[bytes, bool]
+
+
+def encode_presence(node_id: str, updates: List[PresenceUpdate]) -> bytes:
+    name = node_id.encode()
+    return bytes([len(name)]) + name + b''.join(
+        PRESENCE_ENTRY.pack(client_id, online) for client_id, online in updates
+    )
+
+
+def decode_presence(payload: bytes) -> Tuple[str, List[PresenceUpdate]]:
+    name_len = payload[0]
+    node_id = payload[1:1 + name_len].decode()
+    offset = 1 + name_len
+    updates = [
+        PRESENCE_ENTRY.unpack_from(payload, pos)
+        for pos in range(offset, len(payload) - PRESENCE_ENTRY.size + 1, PRESENCE_ENTRY.size)
+    ]
+    return node_id, updates
+
+
+class Backplane(abc.ABC):
+
+    @abc.abstractmethod
+    async def start(self, router: 'ClusterRouter'):
+        ...
+
+    @abc.abstractmethod
+    async def publish_presence(self, updates: List[PresenceUpdate]):
+        ...
+
+    @abc.abstractmethod
+    async def send(
+        self, node_id: str, sender_id: bytes, recipient_id: bytes, payload: bytes,
+        chunk_header: bytes = b'', compress: bool = False
+    ) -> bool:
+        ...
+
+    @abc.abstractmethod
+    async def close(self):
+        ...
+
+
+class LoopbackHub:
+
+    def __init__(self):
+        self.nodes: Dict[str, 'LoopbackBackplane'] = {}
+
+
+class LoopbackBackplane(Backplane):
+
+    def __init__(self, hub: LoopbackHub):
+        self.hub = hub
+        self.router: Optional['ClusterRouter'] = None
+
+    def _peers(self):
+        return [b for node_id, b in self.hub.nodes.items() if node_id != self.router.node_id]
+
+    async def start(self, router: 'ClusterRouter'):
+        self.router = router
+        self.hub.nodes[router.node_id] = self
+        # Troca de snapshots, como no HELLO do backplane por stream
+        for peer in self._peers():
+            peer.router.apply_presence(router.node_id, router.local_snapshot())
+            router.apply_presence(peer.router.node_id, peer.router.local_snapshot())
+
+    async def publish_presence(self, updates: List[PresenceUpdate]):
+        for peer in self._peers():
+            peer.router.apply_presence(self.router.node_id, updates)
+
+    async def send(
+        self, node_id: str, sender_id: bytes, recipient_id: bytes, payload: bytes,
+        chunk_header: bytes = b'', compress: bool = False
+    ) -> bool:
+        target = self.hub.nodes.get(node_id)
+        if target is None:
+            return False
+        return await target.router.deliver(sender_id, recipient_id, payload, chunk_header, compress)
+
+    async def close(self):
+        if self.hub.nodes.get(self.router.node_id) is self:
+            del self.hub.nodes[self.router.node_id]
+            for peer in self._peers():
+                peer.router.node_down(self.router.node_id)
+
+
+class StreamBackplane(Backplane):
+
+    def __init__(
+        self,
+        listen_host: str,
+        listen_port: int,
+        peers: Dict[str, Tuple[str, int]],
+        secret: bytes,
+        reconnect_interval: float = 1.0,
+        linger: float = 0.001,
+        max_batch_bytes: int = 256 * 1024
+    ):
+        self.listen_host = listen_host
+        self.listen_port = listen_port
+        self.peers = peers
+        # Segredo compartilhado por todos os nós: autentica o enlace e deriva
+        # a chave que sela cada registro (quem não o tem não injeta nada)
+        self.secret = check_link_secret(secret)
+        self.reconnect_interval = reconnect_interval
+        self.linger = linger
+        self.max_batch_bytes = max_batch_bytes
+
+        self.router: Optional['ClusterRouter'] = None
+        self.links: Dict[str, ForwardLink] = {}
+        self.dispatcher: Optional[RecipientDispatcher] = None
+        self._server = None
+        self._maintain_task = None
+
+    def _greeting(self) -> List[Record]:
+        # HELLO + snapshot completo antes de qualquer registro da fila
+        records = [(RECORD_HELLO, NO_ID, NO_ID, self.router.node_id.encode())]
+        for chunk in self.router.snapshot_chunks():
+            records.append((RECORD_PRESENCE, NO_ID, NO_ID, encode_presence(self.router.node_id, chunk)))
+        return records
+
+    async def start(self, router: 'ClusterRouter'):
+        self.router = router
+        # Um destinatário lento (pedaços de stream esperando vaga) não segura o enlace
+        self.dispatcher = RecipientDispatcher(router.deliver)
+        self._server = await asyncio.start_server(
+            self._handle_peer, self.listen_host, self.listen_port
+        )
+        for node_id, (host, port) in self.peers.items():
+            self.links[node_id] = ForwardLink(
+                lambda host=host, port=port: asyncio.open_connection(host, port),
+                max_batch_bytes=self.max_batch_bytes,
+                linger=self.linger,
+                secret=self.secret,
+                greeting=self._greeting
+            )
+        self._maintain_task = asyncio.create_task(self._maintain_links())
+
+    async def _maintain_links(self):
+        while True:
+            for link in self.links.values():
+                if not link.connected:
+                    await link.connect()
+            await asyncio.sleep(self.reconnect_interval)
+
+    async def _handle_peer(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        peer_node: List[Optional[str]] = [None]
+
+        async def handle(record_type, sender_id, recipient_id, payload):
+            message = parse_message_record(record_type, payload)
+            if message is not None:
+                await self.dispatcher.dispatch(sender_id, recipient_id, *message)
+            elif record_type == RECORD_PRESENCE:
+                node_id, updates = decode_presence(payload)
+                self.router.apply_presence(node_id, updates)
+            elif record_type == RECORD_HELLO:
+                peer_node[0] = payload.decode()
+                logger.info(f"Nó {peer_node[0]} conectado")
+
+        try:
+            try:
+                opener = await accept_link(reader, writer, self.secret)
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+                opener = None
+            if opener is None:
+                logger.warning(f"Conexão de cluster recusada de {writer.get_extra_info('peername')}")
+                return
+            await read_records(reader, handle, opener)
+        finally:
+            writer.close()
+            if peer_node[0] is not None:
+                self.router.node_down(peer_node[0])
+
+    async def publish_presence(self, updates: List[PresenceUpdate]):
+        payload = encode_presence(self.router.node_id, updates)
+        for link in self.links.values():
+            if link.connected:
+                await link.send(RECORD_PRESENCE, NO_ID, NO_ID, payload)
+
+    async def send(
+        self, node_id: str, sender_id: bytes, recipient_id: bytes, payload: bytes,
+        chunk_header: bytes = b'', compress: bool = False
+    ) -> bool:
+        link = self.links.get(node_id)
+        if link is None:
+            return False
+        record_type, payload = message_record(payload, chunk_header, compress)
+        return await link.send(record_type, sender_id, recipient_id, payload)
+
+    async def close(self):
+        if self._maintain_task is not None:
+            self._maintain_task.cancel()
+        if self._server is not None:
+            self._server.close()
+        for link in self.links.values():
+            await link.close()
+        if self.dispatcher is not None:
+            await self.dispatcher.close()
+
+
+class ClusterRouter:
+
+    def __init__(
+        self,
+        server: SecureMessagingServer,
+        node_id: str,
+        backplane: Backplane,
+        presence_flush_interval: float = 0.05,
+        max_presence_batch: int = 4096
+    ):
+        if not 0 < len(node_id.encode()) < 256:
+            raise ValueError("node_id deve ter entre 1 e 255 bytes")
+
+        self.server = server
+        self.node_id = node_id
+        self.backplane = backplane
+        self.presence_flush_interval = presence_flush_interval
+        self.max_presence_batch = max_presence_batch
+
+        # client_id -> nó remoto onde a sessão está
+        self.presence: Dict[bytes, str] = {}
+        self._pending: List[PresenceUpdate] = []
+        self._flush_needed: Optional[asyncio.Event] = None
+        self._flush_task = None
+
+        self.forwarded = 0
+        self.delivered = 0
+        self.undeliverable = 0
+        self.presence_batches = 0
+
+    async def start(self):
+        self._flush_needed = asyncio.Event()
+        await self.backplane.start(self)
+        self._flush_task = asyncio.create_task(self._flush_loop())
+        self.server.router = self
+
+    def local_snapshot(self) -> List[PresenceUpdate]:
+        return [(client_id, True) for client_id in self.server.sessions]
+
+    def snapshot_chunks(self):
+        snapshot = self.local_snapshot()
+        for start in range(0, len(snapshot), self.max_presence_batch):
+            yield snapshot[start:start + self.max_presence_batch]
+
+    def session_opened(self, client_id: bytes):
+        self._queue_presence(client_id, True)
+
+    def session_closed(self, client_id: bytes):
+        self._queue_presence(client_id, False)
+
+    def _queue_presence(self, client_id: bytes, online: bool):
+        self._pending.append((client_id, online))
+        if len(self._pending) >= self.max_presence_batch and self._flush_needed is not None:
+            self._flush_needed.set()
+
+    async def _flush_loop(self):
+        while True:
+            # Presença agregada: um registro por intervalo em vez de um por conexão
+            try:
+                await asyncio.wait_for(self._flush_needed.wait(), self.presence_flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_needed.clear()
+            await self.flush_presence()
+
+    async def flush_presence(self):
+        while self._pending:
+            batch = self._pending[:self.max_presence_batch]
+            del self._pending[:self.max_presence_batch]
+            await self.backplane.publish_presence(batch)
+            self.presence_batches += 1
+
+    def apply_presence(self, node_id: str, updates: List[PresenceUpdate]):
+        for client_id, online in updates:
+            if online:
+                self.presence[client_id] = node_id
+            elif self.presence.get(client_id) == node_id:
+                del self.presence[client_id]
+
+    def node_down(self, node_id: str):
+        stale = [client_id for client_id, node in self.presence.items() if node == node_id]
+        for client_id in stale:
+            del self.presence[client_id]
+        if stale:
+            logger.warning(f"Nó {node_id} indisponível, {len(stale)} sessões removidas")
+
+    async def forward(
+        self, sender_id: bytes, recipient_id: bytes, plaintext: bytes, chunk_header: bytes = b'', compress: bool = False
+    ) -> bool:
+        node_id = self.presence.get(recipient_id)
+        if node_id is None:
+            return False
+        if await self.backplane.send(node_id, sender_id, recipient_id, plaintext, chunk_header, compress):
+            self.forwarded += 1
+            return True
+        return False
+
+    async def deliver(
+        self, sender_id: bytes, recipient_id: bytes, payload: bytes, chunk_header: bytes = b'', compress: bool = False
+    ) -> bool:
+        if await self.server.deliver_local(sender_id, recipient_id, payload, chunk_header, compress):
+            self.delivered += 1
+            return True
+        self.undeliverable += 1
+        logger.warning(f"Destinatário {recipient_id.hex()} não está mais neste nó")
+        return False
+
+    async def close(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+        await self.backplane.close()
+        if self.server.router is self:
+            self.server.router = None
+
+
+def load_cluster_secret(path: Optional[str]) -> bytes:
+    # Arquivo (ex.: head -c 32 /dev/urandom | base64 > cluster.key) ou variável de ambiente
+    if path:
+        with open(path, "rb") as f:
+            secret = f.read().strip()
+    else:
+        secret = os.environ.get("MENSAGERIA_CLUSTER_SECRET", "").encode()
+    if not secret:
+        raise ValueError("Segredo do cluster ausente: use --cluster-secret-file ou MENSAGERIA_CLUSTER_SECRET")
+    return check_link_secret(secret)
+
+
+def parse_peer(value: str) -> Tuple[str, Tuple[str, int]]:
+    node_id, address = value.split("=", 1)
+    host, port = address.rsplit(":", 1)
+    return node_id, (host, int(port))
+
+
+async def run_node(args):
+    server = SecureMessagingServer(
+        host=args.host,
+        port=args.port,
+        cert_path=args.cert,
+        key_path=args.key
+    )
+    backplane = StreamBackplane(
+        args.cluster_host, args.cluster_port, dict(parse_peer(p) for p in args.peer),
+        load_cluster_secret(args.cluster_secret_file)
+    )
+    router = ClusterRouter(server, args.node_id, backplane)
+    await router.start()
+    try:
+        await server.start()
+    finally:
+        await router.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Nó de cluster do servidor de mensageria")
+    parser.add_argument("--node-id", required=True)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=9999)
+    parser.add_argument("--cluster-host", default="127.0.0.1")
+    parser.add_argument("--cluster-port", type=int, default=9900)
+    parser.add_argument("--peer", action="append", default=[], help="node_id=host:porta de outro nó")
+    parser.add_argument(
+        "--cluster-secret-file",
+        help="arquivo com o segredo compartilhado entre os nós (padrão: $MENSAGERIA_CLUSTER_SECRET)"
+    )
+    parser.add_argument("--cert", default="../certs/server.crt")
+    parser.add_argument("--key", default="../certs/server.key")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(run_node(args))
+    except KeyboardInterrupt:
+        logger.info("Nó interrompido")
+
+
+if __name__ == "__main__":
+    main()
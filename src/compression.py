@@ -0,0 +1,134 @@
+import hashlib
+import zlib
+from collections import Counter
+from typing import Iterable, Optional
+
+
+# Janela de 4 KiB e memLevel baixo: o estado do zlib cabe em poucos KiB, então
+# copiar o compressor já carregado com o dicionário custa menos que recriá-lo
+WINDOW_BITS = -12
+MEM_LEVEL = 4
+MAX_DICTIONARY_SIZE = 1 << 12
+MAX_DECOMPRESSED_SIZE = 16 * 1024 * 1024
+
+# Primeiro byte do texto claro quando a compressão foi negociada (coberto pelo tag GCM)
+MARKER_RAW = 0x00
+MARKER_DEFLATE = 0x01
+
+NO_DICTIONARY_ID = b'\x00' * 4
+
+# Frases frequentes em conversas; as mais comuns ficam no fim (distâncias curtas no deflate)
+DEFAULT_DICTIONARY = (
+    "obrigado pela ajuda, até amanhã. beleza, combinado então. pode deixar que eu resolvo. "
+    "não consegui ver ainda, vou olhar depois. foi mal, tava sem sinal. que horas você chega? "
+    "estou saindo agora, chego em dez minutos. manda o endereço por favor. já paguei o boleto. "
+    "reunião remarcada para amanhã às 10h. o pedido foi enviado e chega em dois dias úteis. "
+    "seu código de verificação é . sua entrega saiu para entrega. pagamento confirmado. "
+    "lembrete: sua consulta está marcada para . alerta: uso de CPU acima do limite no servidor "
+    "thank you, see you tomorrow. sounds good, let me know. I'll call you later. on my way. "
+    "feliz aniversário! parabéns, muitas felicidades! bom dia, tudo bem com você? boa noite! "
+    "kkkkkk verdade, também acho. sim, pode ser. não sei, vou ver e te aviso. ok, valeu! "
+    "você viu a mensagem que eu mandei? te mando o arquivo daqui a pouco. estou em reunião. "
+    "vamos almoçar hoje? onde vocês estão? já chegou? tá bom, obrigado! bom dia! boa tarde! "
+    "oi, tudo bem? tudo ótimo e você? obrigado! de nada. combinado. beleza! ok. sim. não. "
+).encode("utf-8")
+
+
+def dictionary_id(dictionary: bytes) -> bytes:
+    if not dictionary:
+        return NO_DICTIONARY_ID
+    return hashlib.sha256(dictionary).digest()[:4]
+
+
+def train_dictionary(samples: Iterable[bytes], size: int = MAX_DICTIONARY_SIZE, max_words: int = 4) -> bytes:
+    # Sequências de 1..max_words palavras pontuadas por frequência x tamanho;
+    # as mais valiosas vão para o fim, onde o deflate alcança com menos bits
+    counts: Counter = Counter()
+    for sample in samples:
+        words = sample.split(b' ')
+        for n in range(1, max_words + 1):
+            for i in range(len(words) - n + 1):
+                counts[b' '.join(words[i:i + n]) + b' '] += 1
+
+    ranked = sorted(
+        (c * len(seq), seq) for seq, c in counts.items() if c > 1 and len(seq) > 3
+    )
+    chosen = []
+    total = 0
+    for _, seq in reversed(ranked):
+        if any(seq in other for other in chosen):
+            continue
+        # Uma sequência mais longa substitui as que ela já contém
+        contained = [other for other in chosen if other in seq]
+        freed = sum(len(other) for other in contained)
+        if total - freed + len(seq) > size:
+            continue
+        for other in contained:
+            chosen.remove(other)
+        chosen.append(seq)
+        total += len(seq) - freed
+    return b''.join(reversed(chosen))
+
+
+class DeflateCodec:
+    # Compartilhado entre sessões: cada mensagem usa uma cópia dos objetos-modelo
+
+    def __init__(self, dictionary: bytes = b'', level: int = 6, threshold: int = 32):
+        self.dictionary = dictionary[-MAX_DICTIONARY_SIZE:]
+        self.dictionary_id = dictionary_id(self.dictionary)
+        self.level = level
+        # Mensagens menores que isso vão sem comprimir
+        self.threshold = threshold
+
+        if self.dictionary:
+            self._compressor = zlib.compressobj(
+                level, zlib.DEFLATED, WINDOW_BITS, MEM_LEVEL, zlib.Z_DEFAULT_STRATEGY, self.dictionary
+            )
+            self._decompressor = zlib.decompressobj(WINDOW_BITS, zdict=self.dictionary)
+        else:
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, WINDOW_BITS, MEM_LEVEL)
+            self._decompressor = zlib.decompressobj(WINDOW_BITS)
+
+        self.compressed = 0
+        self.skipped = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def pack(self, payload: bytes, enabled: bool = True) -> bytes:
+        if enabled and len(payload) >= self.threshold:
+            compressor = self._compressor.copy()
+            body = compressor.compress(payload) + compressor.flush()
+            if len(body) < len(payload):
+                self.compressed += 1
+                self.bytes_in += len(payload)
+                self.bytes_out += len(body)
+                return bytes([MARKER_DEFLATE]) + body
+
+        self.skipped += 1
+        return bytes([MARKER_RAW]) + payload
+
+    def unpack(self, data: bytes) -> Optional[bytes]:
+        if not data:
+            return None
+        marker = data[0]
+        if marker == MARKER_RAW:
+            return data[1:]
+        if marker != MARKER_DEFLATE:
+            return None
+
+        decompressor = self._decompressor.copy()
+        try:
+            payload = decompressor.decompress(data[1:], MAX_DECOMPRESSED_SIZE)
+        except zlib.error:
+            return None
+        # Saída acima do limite ou fluxo incompleto: recusa (bomba de descompressão)
+        if decompressor.unconsumed_tail or not decompressor.eof:
+            return None
+        return payload
+
+    def stats(self) -> dict:
+        return {
+            "compressed": self.compressed,
+            "skipped": self.skipped,
+            "ratio": self.bytes_out / self.bytes_in if self.bytes_in else None,
+        }
@@ -1,5 +1,6 @@
 import os
 import struct
+from typing import Iterable, Optional, Union
 from cryptography.hazmat.primitives import hashes, serialization
 from cryptography.hazmat.primitives.asymmetric import rsa, ec, padding
 from cryptography.hazmat.primitives.kdf.hkdf import HKDF
@@ -33,6 +34,111 @@ class ECDHEKeyExchange:
         return shared_secret
 
 
+# RSA-PSS com SHA-256 usado em todas as assinaturas do handshake
+PSS_PADDING = padding.PSS(
+    mgf=padding.MGF1(hashes.SHA256()),
+    salt_length=padding.PSS.MAX_LENGTH
+)
+
+
+def public_key_fingerprint(public_key) -> bytes:
+    # SHA-256 do SubjectPublicKeyInfo em DER: não muda com a serialização PEM
+    der = public_key.public_bytes(
+        encoding=serialization.Encoding.DER,
+        format=serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+    digest = hashes.Hash(hashes.SHA256(), backend=default_backend())
+    digest.update(der)
+    return digest.finalize()
+
+
+class PublicKeyMaterial:
+    # Chave pública do servidor pronta para o handshake: objeto já carregado
+    # (verificar não reparseia o PEM), certificado serializado uma única vez e a
+    # impressão digital para fixação
+    __slots__ = ('public_key', 'pem', 'fingerprint')
+
+    def __init__(self, public_key, pem: Optional[bytes] = None):
+        self.public_key = public_key
+        self.pem = pem or public_key.public_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PublicFormat.SubjectPublicKeyInfo
+        )
+        self.fingerprint = public_key_fingerprint(public_key)
+
+    @classmethod
+    def from_pem(cls, pem: bytes) -> 'PublicKeyMaterial':
+        # ValueError se o PEM não for uma chave pública válida
+        public_key = serialization.load_pem_public_key(bytes(pem), backend=default_backend())
+        if not isinstance(public_key, rsa.RSAPublicKey):
+            raise ValueError("Certificado do servidor não é uma chave RSA")
+        return cls(public_key, bytes(pem))
+
+    @classmethod
+    def from_file(cls, path: str) -> 'PublicKeyMaterial':
+        with open(path, 'rb') as f:
+            return cls.from_pem(f.read())
+
+    def key_for(self, presented_pem: bytes) -> Optional['PublicKeyMaterial']:
+        # Chave confiável fixa: o certificado que veio na resposta não é usado
+        return self
+
+    def verify(self, signature, data) -> bool:
+        try:
+            self.public_key.verify(signature, data, PSS_PADDING, hashes.SHA256())
+            return True
+        except Exception:
+            return False
+
+
+def parse_fingerprint(value: Union[str, bytes]) -> bytes:
+    # Hex (com ou sem ':' e prefixo "sha256:") ou os 32 bytes crus
+    if isinstance(value, str):
+        text = value.strip().lower()
+        if text.startswith("sha256:"):
+            text = text[7:]
+        value = bytes.fromhex(text.replace(":", ""))
+    if len(value) != 32:
+        raise ValueError("Impressão digital deve ter 32 bytes (SHA-256)")
+    return bytes(value)
+
+
+class ServerTrust:
+    # O que o cliente aceita como chave do servidor: um certificado confiável
+    # (carregado uma vez) e/ou impressões digitais fixadas. Sem certificado, a
+    # chave vem da resposta do handshake e só vale se a impressão estiver entre
+    # as fixadas; a última aceita fica em cache, sem reparsear a cada conexão
+    __slots__ = ('trusted', 'pins', '_presented')
+
+    def __init__(
+        self,
+        trusted: Optional[PublicKeyMaterial] = None,
+        pins: Iterable[Union[str, bytes]] = ()
+    ):
+        self.trusted = trusted
+        self.pins = frozenset(parse_fingerprint(pin) for pin in pins)
+        if trusted is None and not self.pins:
+            raise ValueError("Informe um certificado confiável ou impressões digitais")
+        if trusted is not None and self.pins and trusted.fingerprint not in self.pins:
+            raise ValueError("Certificado confiável não confere com as impressões digitais fixadas")
+        self._presented: Optional[PublicKeyMaterial] = None
+
+    def key_for(self, presented_pem: bytes) -> Optional[PublicKeyMaterial]:
+        if self.trusted is not None:
+            return self.trusted
+        presented = self._presented
+        if presented is not None and presented.pem == presented_pem:
+            return presented
+        try:
+            presented = PublicKeyMaterial.from_pem(presented_pem)
+        except ValueError:
+            return None
+        if presented.fingerprint not in self.pins:
+            return None
+        self._presented = presented
+        return presented
+
+
 class RSASignature:
 
     def __init__(self, private_key=None):
@@ -46,12 +152,11 @@ class RSASignature:
             self.private_key = private_key
 
         self.public_key = self.private_key.public_key()
+        # Certificado serializado e impressão digital calculados uma vez por chave
+        self.key_material = PublicKeyMaterial(self.public_key)
 
     def get_public_key_pem(self):
-        return self.public_key.public_bytes(
-            encoding=serialization.Encoding.PEM,
-            format=serialization.PublicFormat.SubjectPublicKeyInfo
-        )
+        return self.key_material.pem
 
     def get_private_key_pem(self):
         return self.private_key.private_bytes(
@@ -61,32 +166,14 @@ class RSASignature:
         )
 
     def sign(self, data):
-        signature = self.private_key.sign(
-            data,
-            padding.PSS(
-                mgf=padding.MGF1(hashes.SHA256()),
-                salt_length=padding.PSS.MAX_LENGTH
-            ),
-            hashes.SHA256()
-        )
+        signature = self.private_key.sign(data, PSS_PADDING, hashes.SHA256())
         return signature
 
     @staticmethod
     def verify(public_key_pem, signature, data):
+        # Carrega o PEM a cada chamada; no handshake use PublicKeyMaterial.verify
         try:
-            public_key = serialization.load_pem_public_key(
-                public_key_pem, backend=default_backend()
-            )
-            public_key.verify(
-                signature,
-                data,
-                padding.PSS(
-                    mgf=padding.MGF1(hashes.SHA256()),
-                    salt_length=padding.PSS.MAX_LENGTH
-                ),
-                hashes.SHA256()
-            )
-            return True
+            return PublicKeyMaterial.from_pem(public_key_pem).verify(signature, data)
         except Exception:
             return False
 
@@ -94,7 +181,7 @@ class RSASignature:
 class HKDFKeyDerivation:
 
     @staticmethod
-    def derive_keys(shared_secret, salt, label_c2s="c2s", label_s2c="s2c"):
+    def derive_prk(shared_secret, salt):
         hkdf = HKDF(
             algorithm=hashes.SHA256(),
             length=32,
@@ -102,45 +189,55 @@ class HKDFKeyDerivation:
             info=b'',
             backend=default_backend()
         )
-        prk = hkdf.derive(shared_secret)
+        return hkdf.derive(shared_secret)
 
-        hkdf_c2s = HKDF(
+    @staticmethod
+    def expand(prk, info, length=16):
+        hkdf = HKDF(
             algorithm=hashes.SHA256(),
-            length=16,
+            length=length,
             salt=b'',
-            info=label_c2s.encode(),
+            info=info,
             backend=default_backend()
         )
-        key_c2s = hkdf_c2s.derive(prk)
+        return hkdf.derive(prk)
 
-        hkdf_s2c = HKDF(
-            algorithm=hashes.SHA256(),
-            length=16,
-            salt=b'',
-            info=label_s2c.encode(),
-            backend=default_backend()
+    @staticmethod
+    def derive_keys(shared_secret, salt, label_c2s="c2s", label_s2c="s2c"):
+        key_c2s, key_s2c, _ = HKDFKeyDerivation.derive_session_secrets(
+            shared_secret, salt, label_c2s, label_s2c
         )
-        key_s2c = hkdf_s2c.derive(prk)
-
         return key_c2s, key_s2c
 
+    @staticmethod
+    def derive_session_secrets(shared_secret, salt, label_c2s="c2s", label_s2c="s2c"):
+        prk = HKDFKeyDerivation.derive_prk(shared_secret, salt)
+
+        key_c2s = HKDFKeyDerivation.expand(prk, label_c2s.encode())
+        key_s2c = HKDFKeyDerivation.expand(prk, label_s2c.encode())
+        # Segredo de retomada: permite derivar chaves novas sem ECDH na reconexão
+        resumption_secret = HKDFKeyDerivation.expand(prk, b'resumption', length=32)
+
+        return key_c2s, key_s2c, resumption_secret
+
 
 class AESGCMCipher:
+    __slots__ = ('key', '_aead')
 
     def __init__(self, key):
         if len(key) != 16:
             raise ValueError("Chave AES-128 deve ter 16 bytes")
         self.key = key
+        # Contexto AEAD criado uma única vez: o key schedule não é refeito por mensagem
+        self._aead = AESGCM(key)
 
     def encrypt(self, nonce, plaintext, aad=b''):
-        cipher = AESGCM(self.key)
-        ciphertext = cipher.encrypt(nonce, plaintext, aad)
+        ciphertext = self._aead.encrypt(nonce, plaintext, aad)
         return ciphertext
 
     def decrypt(self, nonce, ciphertext, aad=b''):
         try:
-            cipher = AESGCM(self.key)
-            plaintext = cipher.decrypt(nonce, ciphertext, aad)
+            plaintext = self._aead.decrypt(nonce, ciphertext, aad)
             return plaintext
         except Exception:
             return None
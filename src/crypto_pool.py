@@ -0,0 +1,77 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence
+
+from protocol import MessageCrypto, MessageFrame, STREAM_CHUNK_FLAG, CONTROL_FLAG, SEQ_MASK
+from crypto import AESGCMCipher
+
+
+class CryptoPool:
+    # AES-GCM de payloads grandes em threads: a cifra roda em C/Rust sem o GIL,
+    # então vários frames grandes usam vários núcleos. Abaixo de `threshold`
+    # o salto até a thread custa mais que a cifra e ela fica no event loop
+
+    def __init__(self, workers: int = 4, threshold: int = 64 * 1024):
+        if workers < 1:
+            raise ValueError("Pool de criptografia deve ter ao menos 1 thread")
+        self.workers = workers
+        self.threshold = threshold
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="crypto")
+
+        self.offloaded = 0
+        self.inflight = 0
+
+    def offload(self, size: int) -> bool:
+        return size >= self.threshold
+
+    def submit(self, fn: Callable, *args) -> asyncio.Future:
+        self.offloaded += 1
+        self.inflight += 1
+        future = asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future: asyncio.Future):
+        self.inflight -= 1
+
+    def open_frames(
+        self,
+        cipher_for: Callable[[int], AESGCMCipher],
+        frames: Sequence[MessageFrame]
+    ) -> List[Optional[asyncio.Future]]:
+        # Frames grandes do lote são decifrados juntos; o resultado de cada um é
+        # esperado na ordem do lote, então a sessão continua processando em ordem.
+        # cipher_for(seq) dá a chave de cada frame. Um frame de controle (ex.: REKEY)
+        # pode trocá-la: dali em diante o lote é decifrado no event loop, em ordem
+        openings: List[Optional[asyncio.Future]] = []
+        for index, frame in enumerate(frames):
+            if frame.seq_no & CONTROL_FLAG:
+                openings.extend([None] * (len(frames) - index))
+                break
+            if len(frame.ciphertext_with_tag) < self.threshold:
+                openings.append(None)
+                continue
+            cipher = cipher_for(frame.seq_no & SEQ_MASK)
+            if frame.seq_no & STREAM_CHUNK_FLAG:
+                openings.append(self.submit(MessageCrypto.decrypt_chunk, cipher, frame))
+            else:
+                openings.append(self.submit(MessageCrypto.decrypt_message, cipher, frame))
+        return openings
+
+    async def settle(self, openings: Sequence[Optional[asyncio.Future]]):
+        # Frames apontam para o buffer de recepção: nenhuma thread pode estar
+        # lendo quando ele for reaproveitado pela próxima leitura
+        pending = [future for future in openings if future is not None and not future.done()]
+        if pending:
+            await asyncio.wait(pending)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "workers": self.workers,
+            "threshold": self.threshold,
+            "offloaded": self.offloaded,
+            "inflight": self.inflight,
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,173 @@
+import logging
+import queue
+import time
+from collections import deque
+from logging.handlers import QueueHandler, QueueListener
+from typing import Deque, Dict, List, Optional, Tuple
+
+
+# Listener ativo quando o log assíncrono está ligado (None = handlers síncronos)
+_listener: Optional[QueueListener] = None
+
+
+def _format_args(args: tuple) -> tuple:
+    # IDs de 16 bytes viajam crus até aqui; .hex() só para o que de fato é escrito
+    return tuple(arg.hex() if isinstance(arg, bytes) else arg for arg in args)
+
+
+class AsyncLogHandler(QueueHandler):
+    # O registro vai para a fila sem formatar: msg % args roda na thread escritora
+
+    def __init__(self, log_queue: queue.SimpleQueue, max_pending: int):
+        super().__init__(log_queue)
+        self.max_pending = max_pending
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        # Escritor atrasado: descarta em vez de bloquear o event loop ou crescer sem limite
+        if self.queue.qsize() >= self.max_pending:
+            self.dropped += 1
+            return
+        self.queue.put_nowait(record)
+
+
+class _FormattingListener(QueueListener):
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if isinstance(record.args, tuple) and record.args:
+            record.args = _format_args(record.args)
+        return record
+
+
+def start_async_logging(queue_size: int = 65536) -> AsyncLogHandler:
+    # Move os handlers do logger raiz para uma thread escritora
+    global _listener
+    root = logging.getLogger()
+    if _listener is not None:
+        return next(h for h in root.handlers if isinstance(h, AsyncLogHandler))
+
+    handlers = root.handlers[:]
+    for handler in handlers:
+        root.removeHandler(handler)
+
+    # SimpleQueue (em C, sem Condition) custa bem menos por registro que queue.Queue
+    log_queue = queue.SimpleQueue()
+    handler = AsyncLogHandler(log_queue, queue_size)
+    root.addHandler(handler)
+
+    _listener = _FormattingListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    return handler
+
+
+def stop_async_logging():
+    # Esvazia a fila e devolve os handlers originais ao logger raiz
+    global _listener
+    if _listener is None:
+        return
+    listener, _listener = _listener, None
+    listener.stop()
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        if isinstance(handler, AsyncLogHandler):
+            root.removeHandler(handler)
+    for handler in listener.handlers:
+        root.addHandler(handler)
+
+
+class EventPolicy:
+    __slots__ = ('sample_every', 'max_per_second', '_countdown', '_window_start', '_window_count', 'suppressed')
+
+    def __init__(self, sample_every: int = 1, max_per_second: Optional[float] = None):
+        if sample_every < 1:
+            raise ValueError("Amostragem de log deve ser >= 1")
+        self.sample_every = sample_every
+        self.max_per_second = max_per_second
+        self._countdown = 1
+        self._window_start = 0.0
+        self._window_count = 0
+        # Eventos omitidos desde o último escrito
+        self.suppressed = 0
+
+    def admit(self) -> bool:
+        if self.sample_every > 1:
+            self._countdown -= 1
+            if self._countdown:
+                self.suppressed += 1
+                return False
+            self._countdown = self.sample_every
+
+        if self.max_per_second is not None:
+            now = time.monotonic()
+            if now - self._window_start >= 1.0:
+                self._window_start = now
+                self._window_count = 0
+            if self._window_count >= self.max_per_second:
+                self.suppressed += 1
+                return False
+            self._window_count += 1
+
+        return True
+
+
+class EventLog:
+
+    def __init__(self, logger: logging.Logger, ring_size: int = 4096):
+        self.logger = logger
+        self.policies: Dict[str, EventPolicy] = {}
+        # Últimos eventos crus (inclusive os omitidos pela amostragem)
+        self.ring: Optional[Deque[Tuple[float, str, int, str, tuple]]] = (
+            deque(maxlen=ring_size) if ring_size > 0 else None
+        )
+        self.emitted = 0
+        self.suppressed = 0
+
+    def policy(self, kind: str, sample_every: int = 1, max_per_second: Optional[float] = None):
+        self.policies[kind] = EventPolicy(sample_every, max_per_second)
+
+    def event(self, kind: str, level: int, msg: str, *args):
+        if self.ring is not None:
+            self.ring.append((time.time(), kind, level, msg, args))
+
+        policy = self.policies.get(kind)
+        if policy is not None and not policy.admit():
+            self.suppressed += 1
+            return
+
+        if not self.logger.isEnabledFor(level):
+            return
+
+        if policy is not None and policy.suppressed:
+            msg = f"{msg} (+{policy.suppressed} omitidos)"
+            policy.suppressed = 0
+
+        self.emitted += 1
+        # Com o log assíncrono a formatação fica para a thread escritora
+        self.logger.log(level, msg, *(args if _listener is not None else _format_args(args)))
+
+    def recent(self, limit: Optional[int] = None) -> List[str]:
+        if self.ring is None:
+            return []
+        events = list(self.ring)
+        if limit is not None:
+            events = events[-limit:]
+
+        lines = []
+        for timestamp, kind, level, msg, args in events:
+            moment = time.strftime('%H:%M:%S', time.localtime(timestamp))
+            lines.append(
+                f"{moment}.{int(timestamp % 1 * 1000):03d} {logging.getLevelName(level)} "
+                f"{kind}: {msg % _format_args(args)}"
+            )
+        return lines
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "emitted": self.emitted,
+            "suppressed": self.suppressed,
+            "buffered": len(self.ring) if self.ring is not None else 0,
+        }
@@ -0,0 +1,327 @@
+import asyncio
+import hmac
+import logging
+import os
+import struct
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from crypto import AESGCMCipher, HKDFKeyDerivation
+from outbound import OutboundQueue, OverflowPolicy
+from protocol import CHUNK_HEADER, counter_nonce
+
+
+logger = logging.getLogger("Forwarding")
+
+# Registro encaminhado entre workers/nós: tipo + remetente + destinatário + tamanho
+FORWARD_HEADER = struct.Struct('>B16s16sI')
+RECORD_MESSAGE = 0x01
+RECORD_HELLO = 0x02
+RECORD_PRESENCE = 0x03
+# Pedaço de stream: cabeçalho do pedaço seguido do texto claro
+RECORD_CHUNK = 0x04
+# Mensagem que o remetente mandou sem comprimir: segue crua até o destinatário
+RECORD_MESSAGE_RAW = 0x05
+MAX_RECORD_SIZE = 16 * 1024 * 1024
+
+ConnectFn = Callable[[], Awaitable[Tuple[asyncio.StreamReader, asyncio.StreamWriter]]]
+RecordHandler = Callable[[int, bytes, bytes, bytes], Awaitable[None]]
+# deliver(remetente, destinatário, texto claro, cabeçalho do pedaço, compress)
+DeliverFn = Callable[[bytes, bytes, bytes, bytes, bool], Awaitable[bool]]
+# (tipo, remetente, destinatário, payload)
+Record = Tuple[int, bytes, bytes, bytes]
+
+# Enlace autenticado (entre nós do cluster): quem disca manda LINK_MAGIC + nonce,
+# quem aceita responde nonce + prova. A chave sai do segredo compartilhado e dos
+# dois nonces (HKDF), e cada registro vai selado com AES-GCM: tamanho (4) +
+# cifra de cabeçalho e payload, nonce = contador do enlace
+LINK_MAGIC = b'MSGL\x01'
+LINK_NONCE_SIZE = 32
+LINK_PROOF_SIZE = 16
+MIN_LINK_SECRET_SIZE = 16
+LINK_HANDSHAKE_TIMEOUT = 10.0
+SEALED_LENGTH = struct.Struct('>I')
+SEALED_OVERHEAD = FORWARD_HEADER.size + 16
+
+
+def encode_record(record_type: int, sender_id: bytes, recipient_id: bytes, payload: bytes):
+    header = FORWARD_HEADER.pack(record_type, sender_id, recipient_id, len(payload))
+    return [header, payload]
+
+
+def message_record(plaintext: bytes, chunk_header: bytes = b'', compress: bool = False) -> Tuple[int, bytes]:
+    if chunk_header:
+        return RECORD_CHUNK, chunk_header + plaintext
+    return (RECORD_MESSAGE if compress else RECORD_MESSAGE_RAW), plaintext
+
+
+def parse_message_record(record_type: int, payload: bytes) -> Optional[Tuple[bytes, bytes, bool]]:
+    # (texto claro, cabeçalho do pedaço, compress), na ordem de deliver(), ou None se não for mensagem
+    if record_type == RECORD_CHUNK:
+        chunk_header, plaintext = split_chunk_record(payload)
+        return plaintext, chunk_header, False
+    if record_type == RECORD_MESSAGE or record_type == RECORD_MESSAGE_RAW:
+        return payload, b'', record_type == RECORD_MESSAGE
+    return None
+
+
+def split_chunk_record(payload: bytes) -> Tuple[bytes, bytes]:
+    return payload[:CHUNK_HEADER.size], payload[CHUNK_HEADER.size:]
+
+
+def check_link_secret(secret: bytes) -> bytes:
+    if len(secret) < MIN_LINK_SECRET_SIZE:
+        raise ValueError(f"Segredo do enlace deve ter ao menos {MIN_LINK_SECRET_SIZE} bytes")
+    return bytes(secret)
+
+
+def _link_keys(secret: bytes, connector_nonce: bytes, acceptor_nonce: bytes) -> Tuple[AESGCMCipher, bytes]:
+    prk = HKDFKeyDerivation.derive_prk(secret, connector_nonce + acceptor_nonce)
+    cipher = AESGCMCipher(HKDFKeyDerivation.expand(prk, b'link-records'))
+    proof = HKDFKeyDerivation.expand(prk, b'link-accept', LINK_PROOF_SIZE)
+    return cipher, proof
+
+
+class RecordSealer:
+    # Lado que disca: sela cada registro ao sair da fila de escrita, na ordem do fio
+    __slots__ = ('cipher', 'seq')
+
+    def __init__(self, cipher: AESGCMCipher):
+        self.cipher = cipher
+        self.seq = 0
+
+    def seal(self, parts: Sequence[bytes]) -> List[bytes]:
+        sealed = self.cipher.encrypt(counter_nonce(self.seq), b''.join(parts))
+        self.seq += 1
+        return [SEALED_LENGTH.pack(len(sealed)), sealed]
+
+
+class RecordOpener:
+    # Lado que aceita: o TCP entrega em ordem, então o contador esperado é exato;
+    # registro forjado, repetido ou fora de ordem não passa pelo tag
+    __slots__ = ('cipher', 'seq')
+
+    def __init__(self, cipher: AESGCMCipher):
+        self.cipher = cipher
+        self.seq = 0
+
+    def open(self, sealed: bytes) -> Optional[bytes]:
+        record = self.cipher.decrypt(counter_nonce(self.seq), sealed)
+        if record is not None:
+            self.seq += 1
+        return record
+
+
+async def connect_link(
+    reader: asyncio.StreamReader,
+    writer: asyncio.StreamWriter,
+    secret: bytes
+) -> RecordSealer:
+    connector_nonce = os.urandom(LINK_NONCE_SIZE)
+    writer.write(LINK_MAGIC + connector_nonce)
+    await writer.drain()
+    reply = await asyncio.wait_for(
+        reader.readexactly(LINK_NONCE_SIZE + LINK_PROOF_SIZE), LINK_HANDSHAKE_TIMEOUT
+    )
+    cipher, proof = _link_keys(secret, connector_nonce, reply[:LINK_NONCE_SIZE])
+    if not hmac.compare_digest(reply[LINK_NONCE_SIZE:], proof):
+        raise ConnectionError("Nó remoto não conhece o segredo do enlace")
+    return RecordSealer(cipher)
+
+
+async def accept_link(
+    reader: asyncio.StreamReader,
+    writer: asyncio.StreamWriter,
+    secret: bytes
+) -> Optional[RecordOpener]:
+    # None se quem conectou não fala o protocolo do enlace. Quem não tem o
+    # segredo passa daqui, mas o primeiro registro já não abre
+    hello = await asyncio.wait_for(
+        reader.readexactly(len(LINK_MAGIC) + LINK_NONCE_SIZE), LINK_HANDSHAKE_TIMEOUT
+    )
+    if hello[:len(LINK_MAGIC)] != LINK_MAGIC:
+        return None
+    acceptor_nonce = os.urandom(LINK_NONCE_SIZE)
+    cipher, proof = _link_keys(secret, hello[len(LINK_MAGIC):], acceptor_nonce)
+    writer.write(acceptor_nonce + proof)
+    await writer.drain()
+    return RecordOpener(cipher)
+
+
+class ForwardLink:
+
+    def __init__(
+        self,
+        connect: ConnectFn,
+        max_frames: int = 8192,
+        max_batch_bytes: int = 256 * 1024,
+        linger: float = 0.0,
+        secret: Optional[bytes] = None,
+        greeting: Optional[Callable[[], Iterable[Record]]] = None
+    ):
+        self._connect = connect
+        self.max_frames = max_frames
+        self.max_batch_bytes = max_batch_bytes
+        self.linger = linger
+        # Com secret, o enlace é autenticado e cada registro vai selado; sem ele
+        # (sockets Unix locais entre workers), registros vão em claro
+        self.secret = check_link_secret(secret) if secret is not None else None
+        # Registros enviados a cada (re)conexão antes de qualquer outro (ex.: HELLO)
+        self.greeting = greeting
+
+        self._queue: Optional[OutboundQueue] = None
+        self._connecting: Optional[asyncio.Lock] = None
+
+        self.reconnects = 0
+        self.forwarded = 0
+
+    async def _ensure_connected(self) -> OutboundQueue:
+        if self._connecting is None:
+            self._connecting = asyncio.Lock()
+
+        async with self._connecting:
+            if self._queue is None or self._queue.closed:
+                if self._queue is not None:
+                    await self._queue.close()
+                    self.reconnects += 1
+
+                reader, writer = await self._connect()
+                encode = None
+                if self.secret is not None:
+                    try:
+                        encode = (await connect_link(reader, writer, self.secret)).seal
+                    except BaseException:
+                        writer.close()
+                        raise
+                # Enlace persistente: registros em lote via a mesma fila de escrita das sessões
+                self._queue = OutboundQueue(
+                    writer,
+                    max_frames=self.max_frames,
+                    policy=OverflowPolicy.BACKPRESSURE,
+                    max_batch_bytes=self.max_batch_bytes,
+                    linger=self.linger,
+                    encode=encode
+                )
+                if self.greeting is not None:
+                    for record in self.greeting():
+                        self._queue.put_control(encode_record(*record))
+                self._queue.start()
+
+        return self._queue
+
+    @property
+    def connected(self) -> bool:
+        return self._queue is not None and not self._queue.closed
+
+    async def connect(self) -> bool:
+        try:
+            await self._ensure_connected()
+            return True
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+            logger.warning(f"Falha ao conectar enlace de encaminhamento: {e!r}")
+            return False
+
+    async def send(self, record_type: int, sender_id: bytes, recipient_id: bytes, payload: bytes) -> bool:
+        if not self.connected and not await self.connect():
+            return False
+
+        if await self._queue.put(encode_record(record_type, sender_id, recipient_id, payload)):
+            self.forwarded += 1
+            return True
+        return False
+
+    async def close(self):
+        if self._queue is not None:
+            await self._queue.close()
+            self._queue.writer.close()
+            self._queue = None
+
+
+class RecipientDispatcher:
+    # Entrega o que chega pelos enlaces sem que um destinatário lento segure os
+    # outros: pedaços de stream (que esperam vaga na fila do destinatário) vão
+    # para uma fila e uma tarefa por destinatário, e mensagens para quem já tem
+    # fila entram atrás deles para manter a ordem. O enlace não espera; acima de
+    # max_pending_bytes para um destinatário, os registros dele são descartados
+    __slots__ = ('deliver', 'max_pending_bytes', '_queues', '_pending_bytes', '_tasks', 'dropped')
+
+    def __init__(self, deliver: DeliverFn, max_pending_bytes: int = 8 * 1024 * 1024):
+        self.deliver = deliver
+        self.max_pending_bytes = max_pending_bytes
+        self._queues: Dict[bytes, Deque[Tuple[bytes, bytes, bytes, bool]]] = {}
+        self._pending_bytes: Dict[bytes, int] = {}
+        self._tasks: Dict[bytes, asyncio.Task] = {}
+        self.dropped = 0
+
+    async def dispatch(
+        self, sender_id: bytes, recipient_id: bytes, plaintext: bytes, chunk_header: bytes = b'', compress: bool = False
+    ):
+        queue = self._queues.get(recipient_id)
+        if queue is None:
+            if not chunk_header:
+                await self.deliver(sender_id, recipient_id, plaintext, chunk_header, compress)
+                return
+            queue = self._queues[recipient_id] = deque()
+            self._pending_bytes[recipient_id] = 0
+            self._tasks[recipient_id] = asyncio.create_task(self._drain(recipient_id, queue))
+
+        pending = self._pending_bytes[recipient_id]
+        if pending and pending + len(plaintext) > self.max_pending_bytes:
+            self.dropped += 1
+            logger.warning(f"Destinatário {recipient_id.hex()} lento, registro encaminhado descartado")
+            return
+        queue.append((sender_id, plaintext, chunk_header, compress))
+        self._pending_bytes[recipient_id] = pending + len(plaintext)
+
+    async def _drain(self, recipient_id: bytes, queue: Deque[Tuple[bytes, bytes, bytes, bool]]):
+        try:
+            while queue:
+                sender_id, plaintext, chunk_header, compress = queue.popleft()
+                self._pending_bytes[recipient_id] -= len(plaintext)
+                try:
+                    await self.deliver(sender_id, recipient_id, plaintext, chunk_header, compress)
+                except Exception as e:
+                    logger.warning(f"Falha ao entregar registro encaminhado: {e}")
+        finally:
+            del self._queues[recipient_id]
+            del self._pending_bytes[recipient_id]
+            del self._tasks[recipient_id]
+
+    async def close(self):
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def read_records(
+    reader: asyncio.StreamReader,
+    handler: RecordHandler,
+    opener: Optional[RecordOpener] = None
+):
+    try:
+        while True:
+            if opener is None:
+                header = await reader.readexactly(FORWARD_HEADER.size)
+                record_type, sender_id, recipient_id, size = FORWARD_HEADER.unpack(header)
+                if size > MAX_RECORD_SIZE:
+                    logger.warning("Registro encaminhado acima do limite, fechando enlace")
+                    return
+                payload = await reader.readexactly(size)
+            else:
+                sealed_size, = SEALED_LENGTH.unpack(await reader.readexactly(SEALED_LENGTH.size))
+                if not SEALED_OVERHEAD <= sealed_size <= MAX_RECORD_SIZE + SEALED_OVERHEAD:
+                    logger.warning("Registro encaminhado com tamanho inválido, fechando enlace")
+                    return
+                record = opener.open(await reader.readexactly(sealed_size))
+                if record is None:
+                    logger.warning("Registro encaminhado sem autenticação válida, fechando enlace")
+                    return
+                record_type, sender_id, recipient_id, size = FORWARD_HEADER.unpack_from(record)
+                payload = record[FORWARD_HEADER.size:]
+                if size != len(payload):
+                    logger.warning("Registro encaminhado inconsistente, fechando enlace")
+                    return
+            await handler(record_type, sender_id, recipient_id, payload)
+    except asyncio.IncompleteReadError:
+        pass
@@ -0,0 +1,342 @@
+import asyncio
+import time
+from typing import List, Optional
+
+from protocol import FRAME_HEADER, MessageFrame
+
+
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+READ_CHUNK_SIZE = 64 * 1024
+# Janela de leitura adaptativa: começa pequena, dobra a cada leitura que enche
+# o espaço oferecido (até buffer_size) e encolhe quando as leituras ficam curtas
+MIN_READ_SIZE = 2 * 1024
+
+# Sem buffer: decodificador recém-criado ou com tudo entregue e o socket vazio
+_NO_BUFFER = bytearray()
+_NO_VIEW = memoryview(_NO_BUFFER)
+
+TRANSPORT_ENGINES = ("streams", "protocol")
+
+
+class FrameDecoder:
+    # Um por conexão: sem __dict__
+    __slots__ = (
+        'buffer_size', 'max_frame_size', '_buffer', '_view', '_keep', '_start', '_end', '_base',
+        '_released', '_missing', '_read_size', '_offered', '_drained',
+        'frames', 'bytes_received', 'bytes_copied', 'reallocations'
+    )
+
+    def __init__(self, buffer_size: int = 64 * 1024, max_frame_size: int = MAX_FRAME_SIZE):
+        self.buffer_size = buffer_size
+        self.max_frame_size = max_frame_size
+
+        # Buffer de recepção reutilizado enquanto a conexão tem tráfego; alocado na
+        # primeira leitura e devolvido quando tudo foi liberado com o socket vazio,
+        # então conexões ociosas não seguram buffer.
+        # [_keep, _start) frames entregues e ainda em uso, [_start, _end) não decodificado
+        self._buffer = _NO_BUFFER
+        self._view = _NO_VIEW
+        self._keep = 0
+        self._start = 0
+        self._end = 0
+        # Offset absoluto (no fluxo) do índice 0 do buffer e do que já foi liberado
+        self._base = 0
+        self._released = 0
+        # Bytes que faltam para completar o próximo frame
+        self._missing = FRAME_HEADER.size
+        # Próxima janela de leitura, espaço oferecido na última e se ela esvaziou o socket
+        self._read_size = MIN_READ_SIZE
+        self._offered = 0
+        self._drained = True
+
+        self.frames = 0
+        self.bytes_received = 0
+        self.bytes_copied = 0
+        self.reallocations = 0
+
+    @property
+    def mark(self) -> int:
+        return self._base + self._start
+
+    @property
+    def held_bytes(self) -> int:
+        return self.mark - self._released
+
+    def release(self, mark: Optional[int] = None):
+        # Libera os frames entregues até `mark` (padrão: todos)
+        self._released = max(self._released, self.mark if mark is None else mark)
+        self._keep = min(max(self._released - self._base, self._keep), self._start)
+        if self._keep == self._end:
+            self._base += self._end
+            self._keep = self._start = self._end = 0
+            if self._drained or len(self._buffer) > self.buffer_size:
+                # Nada pendente no socket (ou buffer crescido por um frame grande):
+                # a próxima leitura aloca de novo, do tamanho da janela atual
+                self._buffer = _NO_BUFFER
+                self._view = _NO_VIEW
+
+    def _replace_buffer(self, size: int, pending: int):
+        buffer = bytearray(size)
+        buffer[:pending] = self._view[self._start:self._end]
+        if len(self._buffer):
+            self.reallocations += 1
+        self._buffer = buffer
+        self._view = memoryview(buffer)
+
+    def _reserve(self, needed: int):
+        if len(self._buffer) - self._end >= needed:
+            return
+
+        pending = self._end - self._start
+        if self._keep == self._start and pending + needed <= len(self._buffer):
+            # Compacta: só o frame parcial é movido para o início
+            self._view[:pending] = self._view[self._start:self._end]
+        else:
+            # Frames ainda em uso continuam no buffer antigo
+            self._replace_buffer(max(self._read_size, pending + needed), pending)
+
+        self.bytes_copied += pending
+        self._base += self._start
+        self._keep = self._start = 0
+        self._end = pending
+
+    def get_buffer(self, sizehint: int = -1) -> memoryview:
+        self._reserve(max(self._missing, self._read_size, sizehint))
+        view = self._view[self._end:]
+        self._offered = len(view)
+        return view
+
+    def buffer_updated(self, nbytes: int) -> List[MessageFrame]:
+        self._end += nbytes
+        self.bytes_received += nbytes
+        if nbytes >= self._offered:
+            # Encheu o espaço oferecido: provavelmente há mais no socket
+            self._drained = False
+            self._read_size = min(self._read_size * 2, max(self.buffer_size, MIN_READ_SIZE))
+        else:
+            self._drained = True
+            if nbytes <= self._read_size // 4:
+                self._read_size = max(self._read_size // 2, MIN_READ_SIZE)
+        return self.decode()
+
+    def feed(self, data: bytes) -> List[MessageFrame]:
+        # Uso sem retenção: frames anteriores deixam de valer
+        self.release()
+        size = len(data)
+        self._reserve(max(size, self._missing))
+        self._view[self._end:self._end + size] = data
+        self.bytes_copied += size
+        # StreamFrameReader lê até READ_CHUNK_SIZE por vez
+        self._offered = READ_CHUNK_SIZE
+        return self.buffer_updated(size)
+
+    def decode(self) -> List[MessageFrame]:
+        frames = []
+        view = self._view
+        start, end = self._start, self._end
+        header_size = FRAME_HEADER.size
+
+        while True:
+            available = end - start
+            if available < header_size:
+                self._missing = header_size - available
+                break
+
+            nonce, sender_id, recipient_id, seq_no, size = FRAME_HEADER.unpack_from(view, start)
+            if size > self.max_frame_size:
+                raise ValueError(f"Frame de {size} bytes acima do limite")
+
+            body = start + header_size
+            if end - body < size:
+                self._missing = size - (end - body)
+                break
+
+            frames.append(MessageFrame(nonce, sender_id, recipient_id, seq_no, view[body:body + size]))
+            start = body + size
+
+        self.frames += len(frames)
+        self._start = start
+        return frames
+
+
+class StreamFrameReader:
+
+    def __init__(
+        self,
+        reader: asyncio.StreamReader,
+        decoder: Optional[FrameDecoder] = None,
+        decode_histogram=None
+    ):
+        self.reader = reader
+        self.decoder = decoder or FrameDecoder()
+        self.decode_histogram = decode_histogram
+
+    async def read_frames(self) -> List[MessageFrame]:
+        # Um await por bloco lido, não três por frame.
+        # Frames valem até a próxima chamada: os do lote anterior são liberados
+        # antes de esperar, e com o socket vazio o buffer vai junto
+        self.decoder.release()
+        while True:
+            data = await self.reader.read(READ_CHUNK_SIZE)
+            if not data:
+                raise asyncio.IncompleteReadError(b'', None)
+            if self.decode_histogram is not None:
+                started = time.perf_counter()
+                frames = self.decoder.feed(data)
+                self.decode_histogram.observe(time.perf_counter() - started)
+            else:
+                frames = self.decoder.feed(data)
+            if frames:
+                return frames
+
+
+class FrameProtocol(asyncio.BufferedProtocol):
+    __slots__ = (
+        '_stream_protocol', 'decoder', 'max_held_bytes', 'decode_histogram', 'transport',
+        '_frames', '_returned_mark', '_waiter', '_error', '_eof', '_paused', 'batches'
+    )
+
+    def __init__(
+        self,
+        stream_protocol: asyncio.BaseProtocol,
+        decoder: Optional[FrameDecoder] = None,
+        max_held_bytes: int = 1024 * 1024,
+        decode_histogram=None
+    ):
+        # Protocolo de streams original: continua recebendo eventos de escrita
+        # e de fechamento, para drain() e wait_closed() do StreamWriter
+        self._stream_protocol = stream_protocol
+        self.decoder = decoder or FrameDecoder()
+        self.max_held_bytes = max_held_bytes
+        self.decode_histogram = decode_histogram
+
+        self.transport: Optional[asyncio.Transport] = None
+        self._frames: List[MessageFrame] = []
+        self._returned_mark: Optional[int] = None
+        self._waiter: Optional[asyncio.Future] = None
+        self._error: Optional[Exception] = None
+        self._eof = False
+        self._paused = False
+
+        self.batches = 0
+
+    def connection_made(self, transport: asyncio.BaseTransport):
+        self.transport = transport
+
+    def get_buffer(self, sizehint: int) -> memoryview:
+        return self.decoder.get_buffer(sizehint)
+
+    def buffer_updated(self, nbytes: int):
+        started = time.perf_counter() if self.decode_histogram is not None else 0.0
+        try:
+            frames = self.decoder.buffer_updated(nbytes)
+        except ValueError as e:
+            self._error = e
+            self.transport.abort()
+            self._wakeup()
+            return
+
+        if self.decode_histogram is not None:
+            self.decode_histogram.observe(time.perf_counter() - started)
+
+        if frames:
+            self._frames += frames
+            self._wakeup()
+            # Consumidor atrasado: para de ler em vez de acumular frames
+            if self.decoder.held_bytes > self.max_held_bytes and not self._paused:
+                self._paused = True
+                self.transport.pause_reading()
+
+    def feed(self, data: bytes):
+        buffer = self.get_buffer(len(data))
+        buffer[:len(data)] = data
+        self.decoder.bytes_copied += len(data)
+        self.buffer_updated(len(data))
+
+    def _wakeup(self):
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    def eof_received(self) -> bool:
+        self._eof = True
+        self._wakeup()
+        return False
+
+    def connection_lost(self, exc: Optional[Exception]):
+        self._eof = True
+        self._wakeup()
+        self._stream_protocol.connection_lost(exc)
+
+    def pause_writing(self):
+        self._stream_protocol.pause_writing()
+
+    def resume_writing(self):
+        self._stream_protocol.resume_writing()
+
+    async def read_frames(self) -> List[MessageFrame]:
+        # Lote anterior já processado: sua região do buffer pode ser reutilizada
+        if self._returned_mark is not None:
+            self.decoder.release(self._returned_mark)
+            self._returned_mark = None
+        if self._paused:
+            self._paused = False
+            self.transport.resume_reading()
+
+        while not self._frames:
+            if self._error is not None:
+                raise ValueError(str(self._error))
+            if self._eof:
+                raise asyncio.IncompleteReadError(b'', None)
+            self._waiter = asyncio.get_running_loop().create_future()
+            await self._waiter
+
+        frames, self._frames = self._frames, []
+        self._returned_mark = self.decoder.mark
+        self.batches += 1
+        return frames
+
+
+async def attach_frame_protocol(
+    reader: asyncio.StreamReader,
+    writer: asyncio.StreamWriter,
+    decode_histogram=None,
+    max_frame_size: int = MAX_FRAME_SIZE,
+    decoder: Optional[FrameDecoder] = None
+) -> FrameProtocol:
+    transport = writer.transport
+    protocol = FrameProtocol(
+        transport.get_protocol(),
+        decoder or FrameDecoder(max_frame_size=max_frame_size),
+        decode_histogram=decode_histogram
+    )
+    transport.set_protocol(protocol)
+    protocol.connection_made(transport)
+
+    # Bytes que o StreamReader já tinha recebido depois do handshake, pela API
+    # pública: ele não recebe mais nada do transporte, então o EOF marca o fim
+    # do que tem, e read() com EOF devolve o buffer sem esperar (nenhum byte
+    # novo chega ao protocolo antes destes)
+    reader.feed_eof()
+    pending = await reader.read()
+    if pending:
+        protocol.feed(pending)
+    if not transport.is_reading():
+        # O StreamReader pode ter pausado a leitura com o buffer cheio
+        transport.resume_reading()
+    return protocol
+
+
+async def frame_reader(
+    engine: str,
+    reader: asyncio.StreamReader,
+    writer: asyncio.StreamWriter,
+    decode_histogram=None,
+    max_frame_size: int = MAX_FRAME_SIZE,
+    decoder: Optional[FrameDecoder] = None
+):
+    # decoder: formato negociado diferente da v1 (ver wire.CompactFrameDecoder)
+    if engine == "protocol":
+        return await attach_frame_protocol(reader, writer, decode_histogram, max_frame_size, decoder)
+    return StreamFrameReader(
+        reader, decoder or FrameDecoder(max_frame_size=max_frame_size), decode_histogram=decode_histogram
+    )
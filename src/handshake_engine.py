@@ -0,0 +1,182 @@
+import asyncio
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.backends import default_backend
+
+from crypto import RSASignature
+from keypool import EphemeralKeyPool
+from protocol import ServerHandshake, HandshakeResponse
+
+
+EXECUTOR_KINDS = ("inline", "thread", "process")
+
+
+def _run_server_handshake(
+    handshake: ServerHandshake,
+    client_id: bytes,
+    client_public_key: bytes,
+    extensions: bytes = b''
+) -> Tuple[HandshakeResponse, bytes, bytes, bytes]:
+    ecdhe = handshake.new_key_exchange()
+    handshake_response = handshake.generate_handshake_response(
+        client_id, client_public_key, ecdhe, extensions
+    )
+    key_c2s, key_s2c, resumption_secret = handshake.derive_session_secrets(
+        client_public_key, handshake_response.salt, ecdhe
+    )
+    return handshake_response, key_c2s, key_s2c, resumption_secret
+
+
+# Estado de cada processo do pool (modo "process"); cada processo tem seu
+# próprio pool de pares ECDHE, reabastecido numa thread entre os handshakes
+_worker_handshake: Optional[ServerHandshake] = None
+_worker_key_pool: Optional[EphemeralKeyPool] = None
+
+
+def _init_process_worker(
+    private_key_pem: bytes,
+    pool_size: int,
+    refill_batch: int,
+    refill_interval: float
+):
+    global _worker_handshake, _worker_key_pool
+    private_key = serialization.load_pem_private_key(
+        private_key_pem, password=None, backend=default_backend()
+    )
+    if pool_size > 0:
+        # Enche em segundo plano: o primeiro handshake do processo não espera o pool
+        _worker_key_pool = EphemeralKeyPool(pool_size, refill_batch, refill_interval)
+        _worker_key_pool.start_thread()
+    _worker_handshake = ServerHandshake(RSASignature(private_key), key_pool=_worker_key_pool)
+
+
+def _process_worker_handshake(client_id: bytes, client_public_key: bytes, extensions: bytes):
+    result = _run_server_handshake(_worker_handshake, client_id, client_public_key, extensions)
+    # Contadores do pool do processo voltam junto com o resultado
+    pool_stats = _worker_key_pool.stats() if _worker_key_pool is not None else None
+    return result, os.getpid(), pool_stats
+
+
+class HandshakeEngine:
+
+    def __init__(
+        self,
+        handshake: ServerHandshake,
+        executor_kind: str = "thread",
+        max_workers: Optional[int] = None,
+        max_inflight: int = 32,
+        max_pending: int = 1024,
+        ecdhe_pool_size: int = 0,
+        ecdhe_refill_batch: int = 32,
+        ecdhe_refill_interval: float = 0.0
+    ):
+        if executor_kind not in EXECUTOR_KINDS:
+            raise ValueError(f"Executor de handshake inválido: {executor_kind}")
+
+        self.handshake = handshake
+        self.executor_kind = executor_kind
+        self.max_inflight = max_inflight
+        self.max_pending = max_pending
+
+        self._executor: Optional[Executor] = None
+        if executor_kind == "thread":
+            self._executor = ThreadPoolExecutor(
+                max_workers=max_workers, thread_name_prefix="handshake"
+            )
+        elif executor_kind == "process":
+            self._executor = ProcessPoolExecutor(
+                max_workers=max_workers,
+                initializer=_init_process_worker,
+                initargs=(
+                    handshake.rsa.get_private_key_pem(),
+                    ecdhe_pool_size, ecdhe_refill_batch, ecdhe_refill_interval
+                )
+            )
+
+        self._inflight_slots: Optional[asyncio.Semaphore] = None
+
+        self.pending = 0
+        self.inflight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.failed = 0
+        # Último retrato do pool ECDHE de cada processo (modo "process"), por pid
+        self._worker_pool_stats: Dict[int, Dict[str, int]] = {}
+
+    def admit(self) -> bool:
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            return False
+        self.pending += 1
+        return True
+
+    def release(self):
+        self.pending -= 1
+
+    async def respond(
+        self,
+        client_id: bytes,
+        client_public_key: bytes,
+        extensions: bytes = b''
+    ) -> Tuple[HandshakeResponse, bytes, bytes, bytes]:
+        if self._inflight_slots is None:
+            self._inflight_slots = asyncio.Semaphore(self.max_inflight)
+
+        async with self._inflight_slots:
+            self.inflight += 1
+            try:
+                if self.executor_kind == "inline":
+                    result = _run_server_handshake(
+                        self.handshake, client_id, client_public_key, extensions
+                    )
+                elif self.executor_kind == "process":
+                    result, pid, pool_stats = await asyncio.get_running_loop().run_in_executor(
+                        self._executor, _process_worker_handshake,
+                        client_id, client_public_key, extensions
+                    )
+                    if pool_stats is not None:
+                        self._worker_pool_stats[pid] = pool_stats
+                else:
+                    result = await asyncio.get_running_loop().run_in_executor(
+                        self._executor, _run_server_handshake,
+                        self.handshake, client_id, client_public_key, extensions
+                    )
+            except Exception:
+                self.failed += 1
+                raise
+            finally:
+                self.inflight -= 1
+
+        self.completed += 1
+        return result
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "pending": self.pending,
+            "inflight": self.inflight,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "failed": self.failed,
+        }
+
+    def worker_key_pool_stats(self) -> Optional[Dict[str, int]]:
+        # Soma dos pools dos processos, cada um como estava no último handshake
+        # que fez; None fora do modo "process" ou antes do primeiro handshake
+        if not self._worker_pool_stats:
+            return None
+        totals: Dict[str, int] = {}
+        for stats in self._worker_pool_stats.values():
+            for name, value in stats.items():
+                totals[name] = totals.get(name, 0) + value
+        return totals
+
+    def shutdown(self):
+        if self._executor is not None:
+            # O pool de processos espera os workers saírem: sem isso o aviso de
+            # parada pode não chegar antes do fim do interpretador e o processo
+            # fica preso esperando o filho
+            self._executor.shutdown(wait=self.executor_kind == "process")
+            self._executor = None
@@ -1,6 +1,6 @@
 import os
 import sys
-from crypto import RSASignature
+from crypto import RSASignature, PublicKeyMaterial
 
 
 def initialize_server_certificates(cert_dir: str = "certs"):
@@ -12,6 +12,7 @@ def initialize_server_certificates(cert_dir: str = "certs"):
 
     if os.path.exists(cert_path) and os.path.exists(key_path):
         print(f"Certificados já existem em {cert_dir}")
+        print(f"Impressão digital: sha256:{PublicKeyMaterial.from_file(cert_path).fingerprint.hex()}")
         return
 
     print("Gerando par de chaves RSA-2048")
@@ -24,6 +25,7 @@ def initialize_server_certificates(cert_dir: str = "certs"):
     with open(key_path, 'wb') as f:
         f.write(rsa.get_private_key_pem())
     print(f"Chave privada salva: {key_path}")
+    print(f"Impressão digital: sha256:{rsa.key_material.fingerprint.hex()}")
 
     print("Certificados inicializados")
 
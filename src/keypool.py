@@ -0,0 +1,137 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+from crypto import ECDHEKeyExchange
+
+
+def _generate_keys(count: int) -> List[ECDHEKeyExchange]:
+    return [ECDHEKeyExchange() for _ in range(count)]
+
+
+class EphemeralKeyPool:
+
+    def __init__(
+        self,
+        size: int = 256,
+        refill_batch: int = 32,
+        refill_interval: float = 0.0
+    ):
+        if size < 1:
+            raise ValueError("Pool de chaves efêmeras deve ter tamanho positivo")
+
+        self.size = size
+        self.refill_batch = max(1, refill_batch)
+        # Pausa entre lotes: limita a taxa de reabastecimento (lotes/s)
+        self.refill_interval = refill_interval
+
+        self._keys: Deque[ECDHEKeyExchange] = deque()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._task = None
+        # Reabastecimento em thread (processos sem event loop)
+        self._thread: Optional[threading.Thread] = None
+        self._thread_wake: Optional[threading.Event] = None
+
+        # Contadores atualizados pelas threads de handshake e pelo event loop
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.generated = 0
+
+    def prefill(self):
+        missing = self.size - len(self._keys)
+        if missing > 0:
+            self._keys.extend(_generate_keys(missing))
+            with self._stats_lock:
+                self.generated += missing
+
+    def start(self):
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._refill_loop())
+
+    def start_thread(self):
+        # Nos processos do pool de handshake não há event loop: o
+        # reabastecimento roda numa thread do próprio processo
+        if self._thread is not None:
+            return
+        self._thread_wake = threading.Event()
+        self._thread = threading.Thread(target=self._refill_thread, name="ecdhe-refill", daemon=True)
+        self._thread.start()
+
+    def take(self) -> ECDHEKeyExchange:
+        # Pode ser chamado de threads do executor de handshake: deque.popleft é atômico
+        try:
+            key = self._keys.popleft()
+            hit = True
+        except IndexError:
+            key = ECDHEKeyExchange()
+            hit = False
+
+        with self._stats_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+                self.generated += 1
+
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._wake.set)
+        elif self._thread_wake is not None:
+            self._thread_wake.set()
+
+        return key
+
+    async def _refill_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            while len(self._keys) < self.size:
+                count = min(self.refill_batch, self.size - len(self._keys))
+                # Geração P-256 fora do event loop
+                keys = await loop.run_in_executor(None, _generate_keys, count)
+                self._keys.extend(keys)
+                with self._stats_lock:
+                    self.generated += count
+                if self.refill_interval > 0:
+                    await asyncio.sleep(self.refill_interval)
+
+            self._wake.clear()
+            await self._wake.wait()
+
+    def _refill_thread(self):
+        while True:
+            while len(self._keys) < self.size:
+                count = min(self.refill_batch, self.size - len(self._keys))
+                self._keys.extend(_generate_keys(count))
+                with self._stats_lock:
+                    self.generated += count
+                if self.refill_interval > 0:
+                    time.sleep(self.refill_interval)
+
+            self._thread_wake.wait()
+            self._thread_wake.clear()
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._loop = None
+
+    def stats(self) -> Dict[str, int]:
+        with self._stats_lock:
+            return {
+                "available": len(self._keys),
+                "size": self.size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "generated": self.generated,
+            }
@@ -0,0 +1,182 @@
+import asyncio
+import logging
+import os
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+logger = logging.getLogger("Metrics")
+
+# Limites dos buckets (s): 1 µs a ~8 s, dobrando
+LATENCY_BUCKETS = tuple(1e-6 * 2 ** i for i in range(24))
+
+STAGES = ("handshake", "decode", "decrypt", "route", "encrypt", "enqueue", "drain", "timer_tick")
+
+COUNTERS = (
+    ("frames_in", "Frames recebidos de clientes"),
+    ("bytes_in", "Bytes de frames recebidos"),
+    ("frames_out", "Frames escritos para clientes"),
+    ("bytes_out", "Bytes escritos para clientes"),
+    ("replays_rejected", "Frames recusados por número de sequência repetido"),
+    ("auth_failures", "Frames com tag AES-GCM inválida"),
+    ("unknown_recipients", "Mensagens sem destinatário conhecido"),
+    ("forwarded", "Mensagens encaminhadas a outro worker/nó"),
+    ("offline_stored", "Mensagens guardadas para destinatários offline"),
+    ("outbound_dropped", "Frames descartados nas filas de saída"),
+)
+
+PREFIX = "mensageria_"
+
+
+class Histogram:
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        # Limite superior do bucket que contém o quantil
+        if self.count == 0:
+            return None
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return float('inf')
+
+
+class ServerMetrics:
+
+    def __init__(self, sample_every: int = 16):
+        if sample_every < 1:
+            raise ValueError("Amostragem de métricas deve ser >= 1")
+
+        self.stages: Dict[str, Histogram] = {stage: Histogram() for stage in STAGES}
+        for name, _ in COUNTERS:
+            setattr(self, name, 0)
+
+        # Contadores são exatos; as etapas por mensagem são cronometradas em
+        # 1 de cada sample_every frames (perf_counter + observe custam ~0,5 µs)
+        self.sample_every = sample_every
+        self._receive_countdown = 1
+        self._send_countdown = 1
+
+        # Valores lidos só na exportação (sessões, filas, pools...)
+        self._gauges: List[Tuple[str, str, Callable[[], float]]] = []
+        self._derived_counters: List[Tuple[str, str, Callable[[], float]]] = []
+
+    def sample_receive(self) -> bool:
+        self._receive_countdown -= 1
+        if self._receive_countdown:
+            return False
+        self._receive_countdown = self.sample_every
+        return True
+
+    def sample_send(self) -> bool:
+        self._send_countdown -= 1
+        if self._send_countdown:
+            return False
+        self._send_countdown = self.sample_every
+        return True
+
+    def gauge(self, name: str, help_text: str, read: Callable[[], float]):
+        self._gauges.append((name, help_text, read))
+
+    def counter(self, name: str, help_text: str, read: Callable[[], float]):
+        self._derived_counters.append((name, help_text, read))
+
+    def render(self) -> str:
+        lines = []
+        metric = f"{PREFIX}stage_seconds"
+        lines.append(
+            f"# HELP {metric} Latência por etapa do processamento "
+            f"(decrypt/route/encrypt/enqueue: 1 a cada {self.sample_every} mensagens)"
+        )
+        lines.append(f"# TYPE {metric} histogram")
+        for stage, histogram in self.stages.items():
+            cumulative = 0
+            for bound, count in zip(histogram.bounds, histogram.counts):
+                cumulative += count
+                lines.append(f'{metric}_bucket{{stage="{stage}",le="{bound:.6g}"}} {cumulative}')
+            lines.append(f'{metric}_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}')
+            lines.append(f'{metric}_sum{{stage="{stage}"}} {histogram.sum:.9f}')
+            lines.append(f'{metric}_count{{stage="{stage}"}} {histogram.count}')
+
+        counters = [(name, help_text, getattr(self, name)) for name, help_text in COUNTERS]
+        counters += [(name, help_text, read()) for name, help_text, read in self._derived_counters]
+        for name, help_text, value in counters:
+            lines.append(f"# HELP {PREFIX}{name}_total {help_text}")
+            lines.append(f"# TYPE {PREFIX}{name}_total counter")
+            lines.append(f"{PREFIX}{name}_total {value}")
+
+        for name, help_text, read in self._gauges:
+            lines.append(f"# HELP {PREFIX}{name} {help_text}")
+            lines.append(f"# TYPE {PREFIX}{name} gauge")
+            lines.append(f"{PREFIX}{name} {read()}")
+
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> Dict[str, Dict[str, Optional[float]]]:
+        return {
+            stage: {
+                "count": h.count,
+                "mean": h.sum / h.count if h.count else None,
+                "p50": h.quantile(0.50),
+                "p99": h.quantile(0.99),
+            }
+            for stage, h in self.stages.items()
+        }
+
+
+async def start_metrics_server(metrics: ServerMetrics, host: str, port: int) -> asyncio.AbstractServer:
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = await reader.readline()
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass
+
+            if request.split(b' ')[1:2] == [b'/metrics']:
+                status, body = "200 OK", metrics.render().encode()
+            else:
+                status, body = "404 Not Found", b''
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                f"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    logger.info(f"Métricas em http://{host}:{port}/metrics")
+    return server
+
+
+def _write_atomic(path: str, text: str):
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w') as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+async def dump_metrics(metrics: ServerMetrics, path: str, interval: float):
+    # Arquivo sempre completo para quem lê (textfile collector ou cat)
+    while True:
+        await asyncio.sleep(interval)
+        # Render no event loop (lê os contadores sem disputa); disco na thread padrão
+        text = metrics.render()
+        await asyncio.get_running_loop().run_in_executor(None, _write_atomic, path, text)
@@ -0,0 +1,478 @@
+import asyncio
+import logging
+import mmap
+import os
+import struct
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from crypto import AESGCMCipher, generate_nonce
+
+
+logger = logging.getLogger("OfflineStore")
+
+# Registro no log: tipo + seq global + destinatário + remetente + instante (ms) + tamanho do corpo
+RECORD_HEADER = struct.Struct('>BQ16s16sQI')
+RECORD_MESSAGE = 0x01
+# ACK: mensagens do destinatário com seq <= seq do registro já foram entregues
+RECORD_ACK = 0x02
+# Mensagem que o remetente mandou sem comprimir (volta crua para o destinatário)
+RECORD_MESSAGE_RAW = 0x03
+
+SEGMENT_PREFIX = "segment-"
+SEGMENT_SUFFIX = ".log"
+KEY_FILE = "store.key"
+NO_ID = bytes(16)
+
+# (seq, remetente, texto claro, compress)
+StoredMessage = Tuple[int, bytes, bytes, bool]
+
+
+def _find(entries: array, seq: int) -> int:
+    # entries = [seq, local, seq, local, ...] ordenado por seq
+    lo, hi = 0, len(entries) // 2
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if entries[2 * mid] < seq:
+            lo = mid + 1
+        else:
+            hi = mid
+    return 2 * lo
+
+
+class OfflineStore:
+
+    def __init__(
+        self,
+        path: str,
+        segment_bytes: int = 64 * 1024 * 1024,
+        max_bytes: int = 1024 * 1024 * 1024,
+        ttl: float = 7 * 24 * 3600,
+        compact_ratio: float = 0.5,
+        flush_interval: float = 0.05,
+        fsync: bool = False
+    ):
+        if not 0 < segment_bytes < 2 ** 32:
+            raise ValueError("Tamanho de segmento deve caber em 32 bits")
+
+        self.path = path
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max(max_bytes, segment_bytes)
+        self.ttl = ttl
+        # Segmento antigo com fração viva abaixo disso é reescrito no ativo
+        self.compact_ratio = compact_ratio
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+
+        os.makedirs(path, mode=0o700, exist_ok=True)
+        # Mensagens ficam cifradas em disco com uma chave local do servidor
+        self.cipher = AESGCMCipher(self._load_or_create_key())
+
+        # destinatário -> [seq, segmento << 32 | offset, ...]
+        self._index: Dict[bytes, array] = {}
+        self._live: Dict[int, int] = {}
+        self._records: Dict[int, int] = {}
+        self._sizes: Dict[int, int] = {}
+        self._newest_ms: Dict[int, int] = {}
+        self._maps: Dict[int, mmap.mmap] = {}
+
+        self._next_seq = 1
+        self._active_id = 0
+        self._active = None
+        self._dirty = False
+        self._task = None
+        # Disco e mmap fora do event loop: uma única thread, então as operações
+        # assíncronas rodam em série, na ordem em que foram pedidas
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # destinatário -> appends assíncronos ainda na fila da thread
+        self._appending: Dict[bytes, int] = {}
+
+        self.appended = 0
+        self.delivered = 0
+        self.expired = 0
+        self.evicted = 0
+        self.compactions = 0
+
+        self._recover()
+
+    def _load_or_create_key(self) -> bytes:
+        key_path = os.path.join(self.path, KEY_FILE)
+        if os.path.exists(key_path):
+            with open(key_path, 'rb') as f:
+                return f.read()
+        key = os.urandom(16)
+        fd = os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(key)
+        return key
+
+    def _segment_path(self, segment_id: int) -> str:
+        return os.path.join(self.path, f"{SEGMENT_PREFIX}{segment_id:08d}{SEGMENT_SUFFIX}")
+
+    def _segment_ids(self) -> List[int]:
+        ids = []
+        for name in os.listdir(self.path):
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX):
+                ids.append(int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]))
+        return sorted(ids)
+
+    def _scan(self, segment_id: int):
+        # (offset, tipo, seq, destinatário, instante) de cada registro completo
+        view = self._map(segment_id)
+        offset = 0
+        size = len(view) if view is not None else 0
+        while offset + RECORD_HEADER.size <= size:
+            record_type, seq, recipient, _, stored_ms, length = RECORD_HEADER.unpack_from(view, offset)
+            end = offset + RECORD_HEADER.size + length
+            if end > size or record_type not in (RECORD_MESSAGE, RECORD_MESSAGE_RAW, RECORD_ACK):
+                break
+            yield offset, end, record_type, seq, recipient, stored_ms
+            offset = end
+
+    def _recover(self):
+        last_id = 0
+        for segment_id in self._segment_ids():
+            last_id = segment_id
+            self._live[segment_id] = 0
+            self._records[segment_id] = 0
+            self._newest_ms[segment_id] = 0
+            valid_end = 0
+
+            for offset, end, record_type, seq, recipient, stored_ms in self._scan(segment_id):
+                valid_end = end
+                self._next_seq = max(self._next_seq, seq + 1)
+                if record_type == RECORD_ACK:
+                    self._drop_acked(recipient, seq)
+                    continue
+
+                entries = self._index.setdefault(recipient, array('Q'))
+                position = _find(entries, seq)
+                if position < len(entries) and entries[position] == seq:
+                    # Cópia de compactação interrompida: fica a mais nova
+                    self._move_entry(entries, position, segment_id, offset)
+                    continue
+                entries[position:position] = array('Q', (seq, segment_id << 32 | offset))
+                self._live[segment_id] += 1
+                self._records[segment_id] += 1
+                self._newest_ms[segment_id] = max(self._newest_ms[segment_id], stored_ms)
+
+            # Registro parcial no fim (queda durante a escrita) é descartado
+            self._close_map(segment_id)
+            if valid_end < os.path.getsize(self._segment_path(segment_id)):
+                os.truncate(self._segment_path(segment_id), valid_end)
+            self._sizes[segment_id] = valid_end
+
+        self._open_active(last_id or 1)
+        if self._index:
+            logger.info(f"{self.pending_messages} mensagens offline recuperadas de {len(self._sizes)} segmentos")
+
+    def _move_entry(self, entries: array, position: int, segment_id: int, offset: int):
+        old_segment = entries[position + 1] >> 32
+        self._live[old_segment] -= 1
+        entries[position + 1] = segment_id << 32 | offset
+        self._live[segment_id] += 1
+        self._records[segment_id] += 1
+
+    def _drop_acked(self, recipient: bytes, seq: int):
+        entries = self._index.get(recipient)
+        if entries is None:
+            return
+        end = _find(entries, seq + 1)
+        for i in range(1, end, 2):
+            self._live[entries[i] >> 32] -= 1
+        del entries[:end]
+        if not entries:
+            del self._index[recipient]
+
+    def _open_active(self, segment_id: int):
+        self._active_id = segment_id
+        self._active = open(self._segment_path(segment_id), 'ab', buffering=1024 * 1024)
+        self._sizes.setdefault(segment_id, 0)
+        self._live.setdefault(segment_id, 0)
+        self._records.setdefault(segment_id, 0)
+        self._newest_ms.setdefault(segment_id, 0)
+
+    def _roll(self):
+        self.flush()
+        self._active.close()
+        self._close_map(self._active_id)
+        self._open_active(self._active_id + 1)
+
+    def _map(self, segment_id: int) -> Optional[mmap.mmap]:
+        view = self._maps.get(segment_id)
+        size = self._sizes.get(segment_id)
+        if view is not None and (size is None or len(view) >= size):
+            return view
+
+        if segment_id == self._active_id and self._active is not None:
+            self._active.flush()
+        self._close_map(segment_id)
+        with open(self._segment_path(segment_id), 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return None
+            view = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps[segment_id] = view
+        return view
+
+    def _close_map(self, segment_id: int):
+        view = self._maps.pop(segment_id, None)
+        if view is not None:
+            view.close()
+
+    # list(): lidos do event loop enquanto a thread do armazenamento altera os dicts
+    @property
+    def pending_messages(self) -> int:
+        return sum(len(entries) for entries in list(self._index.values())) // 2
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(list(self._sizes.values()))
+
+    def _write_record(self, record_type: int, seq: int, recipient: bytes, sender: bytes,
+                      stored_ms: int, body: bytes) -> int:
+        size = RECORD_HEADER.size + len(body)
+        if self._sizes[self._active_id] + size > self.segment_bytes and self._sizes[self._active_id] > 0:
+            self._roll()
+
+        offset = self._sizes[self._active_id]
+        self._active.write(RECORD_HEADER.pack(record_type, seq, recipient, sender, stored_ms, len(body)))
+        self._active.write(body)
+        self._sizes[self._active_id] = offset + size
+        self._dirty = True
+        return offset
+
+    def append(self, recipient_id: bytes, sender_id: bytes, plaintext: bytes, compress: bool = False) -> int:
+        seq = self._next_seq
+        self._next_seq += 1
+        stored_ms = int(time.time() * 1000)
+
+        nonce = generate_nonce()
+        aad = recipient_id + sender_id + seq.to_bytes(8, 'big')
+        body = nonce + self.cipher.encrypt(nonce, plaintext, aad)
+
+        record_type = RECORD_MESSAGE if compress else RECORD_MESSAGE_RAW
+        offset = self._write_record(record_type, seq, recipient_id, sender_id, stored_ms, body)
+        segment_id = self._active_id
+        entries = self._index.get(recipient_id)
+        if entries is None:
+            entries = self._index[recipient_id] = array('Q')
+        entries.append(seq)
+        entries.append(segment_id << 32 | offset)
+        self._live[segment_id] += 1
+        self._records[segment_id] += 1
+        self._newest_ms[segment_id] = stored_ms
+        self.appended += 1
+
+        if self.total_bytes > self.max_bytes:
+            self._evict_oldest()
+        return seq
+
+    def has_messages(self, recipient_id: bytes) -> bool:
+        return recipient_id in self._index or recipient_id in self._appending
+
+    def take(self, recipient_id: bytes, limit: int = 1024) -> Tuple[List[StoredMessage], int]:
+        # Não tira do índice o que devolve: as mensagens continuam indexadas até
+        # ack(), que vem depois de elas saírem pelo socket. Devolve também o seq da última entrada lida
+        # (0 = nada pendente), que cobre as expiradas no fim do lote
+        entries = self._index.get(recipient_id)
+        if entries is None:
+            return [], 0
+
+        count = min(len(entries), 2 * limit)
+        expire_before = (time.time() - self.ttl) * 1000
+        messages = []
+        kept = array('Q')
+        for i in range(0, count, 2):
+            location = entries[i + 1]
+            segment_id, offset = location >> 32, location & 0xFFFFFFFF
+
+            view = self._map(segment_id)
+            record_type, seq, _, sender_id, stored_ms, length = RECORD_HEADER.unpack_from(view, offset)
+            if stored_ms < expire_before:
+                self._live[segment_id] -= 1
+                self.expired += 1
+                continue
+            kept.append(seq)
+            kept.append(location)
+
+            start = offset + RECORD_HEADER.size
+            body = view[start:start + length]
+            aad = recipient_id + sender_id + seq.to_bytes(8, 'big')
+            plaintext = self.cipher.decrypt(body[:12], body[12:], aad)
+            if plaintext is None:
+                logger.warning(f"Registro offline corrompido para {recipient_id.hex()} (seq {seq})")
+                continue
+            messages.append((seq, sender_id, plaintext, record_type == RECORD_MESSAGE))
+
+        last_seq = entries[count - 2]
+        if len(kept) < count:
+            # Expiradas saem do índice na primeira leitura: contadas uma vez só, e
+            # o segmento delas pode ser compactado sem esperar o ACK
+            entries[:count] = kept
+            if not entries:
+                del self._index[recipient_id]
+        return messages, last_seq
+
+    def ack(self, recipient_id: bytes, seq: int, delivered: int):
+        # Mensagens do destinatário com seq <= seq foram entregues (ou expiraram)
+        self._drop_acked(recipient_id, seq)
+        self._write_record(RECORD_ACK, seq, recipient_id, NO_ID, int(time.time() * 1000), b'')
+        self.delivered += delivered
+        self.compact()
+
+    async def _run(self, fn, *args):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="offline-store")
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    # Versões para o event loop: a partir do primeiro uso, todo acesso ao disco
+    # passa pela thread do armazenamento (não misturar com as chamadas diretas)
+    async def append_async(
+        self, recipient_id: bytes, sender_id: bytes, plaintext: bytes, compress: bool = False
+    ) -> int:
+        # Contado antes de entrar na fila: has_messages() já o enxerga, e um
+        # take_async pedido depois roda depois dele
+        self._appending[recipient_id] = self._appending.get(recipient_id, 0) + 1
+        try:
+            return await self._run(self.append, recipient_id, sender_id, plaintext, compress)
+        finally:
+            remaining = self._appending[recipient_id] - 1
+            if remaining:
+                self._appending[recipient_id] = remaining
+            else:
+                del self._appending[recipient_id]
+
+    async def take_async(self, recipient_id: bytes, limit: int = 1024) -> Tuple[List[StoredMessage], int]:
+        return await self._run(self.take, recipient_id, limit)
+
+    async def ack_async(self, recipient_id: bytes, seq: int, delivered: int):
+        await self._run(self.ack, recipient_id, seq, delivered)
+
+    def _segment_messages(self, segment_id: int):
+        # Registros de mensagem ainda indexados neste segmento
+        for offset, end, record_type, seq, recipient, stored_ms in self._scan(segment_id):
+            if record_type == RECORD_ACK:
+                continue
+            entries = self._index.get(recipient)
+            if entries is None:
+                continue
+            position = _find(entries, seq)
+            if position < len(entries) and entries[position] == seq \
+                    and entries[position + 1] == segment_id << 32 | offset:
+                yield offset, end, recipient, seq, stored_ms
+
+    def _delete_segment(self, segment_id: int):
+        self._close_map(segment_id)
+        os.unlink(self._segment_path(segment_id))
+        for table in (self._live, self._records, self._sizes, self._newest_ms):
+            table.pop(segment_id, None)
+
+    def _drop_segment(self, segment_id: int) -> int:
+        dropped = 0
+        for _, _, recipient, seq, _ in list(self._segment_messages(segment_id)):
+            entries = self._index[recipient]
+            position = _find(entries, seq)
+            del entries[position:position + 2]
+            if not entries:
+                del self._index[recipient]
+            dropped += 1
+        self._delete_segment(segment_id)
+        return dropped
+
+    def _rewrite_segment(self, segment_id: int):
+        # Move os registros vivos para o segmento ativo e apaga o antigo
+        view = self._map(segment_id)
+        for offset, end, recipient, seq, stored_ms in list(self._segment_messages(segment_id)):
+            record = view[offset:end]
+            if self._sizes[self._active_id] + len(record) > self.segment_bytes:
+                self._roll()
+            new_offset = self._sizes[self._active_id]
+            self._active.write(record)
+            self._sizes[self._active_id] = new_offset + len(record)
+            entries = self._index[recipient]
+            self._move_entry(entries, _find(entries, seq), self._active_id, new_offset)
+            self._newest_ms[self._active_id] = max(self._newest_ms[self._active_id], stored_ms)
+        self._dirty = True
+        # A cópia precisa estar em disco antes de o original sumir
+        self.flush()
+        self._delete_segment(segment_id)
+
+    def _evict_oldest(self):
+        sealed = [s for s in sorted(self._sizes) if s != self._active_id]
+        if not sealed:
+            return
+        dropped = self._drop_segment(sealed[0])
+        self.evicted += dropped
+        logger.warning(f"Armazenamento offline cheio: {dropped} mensagens antigas descartadas")
+
+    def compact(self):
+        # Sempre do segmento mais antigo: ACKs em segmentos novos não podem
+        # sobreviver às mensagens que eles cobrem
+        expire_before = (time.time() - self.ttl) * 1000
+        for segment_id in sorted(self._sizes):
+            if segment_id == self._active_id:
+                break
+
+            if self._live[segment_id] <= 0:
+                self._delete_segment(segment_id)
+            elif self._newest_ms[segment_id] < expire_before:
+                self.expired += self._drop_segment(segment_id)
+            elif self._live[segment_id] < self.compact_ratio * self._records[segment_id]:
+                self._rewrite_segment(segment_id)
+            else:
+                break
+            self.compactions += 1
+
+    def flush(self):
+        if not self._dirty:
+            return
+        self._active.flush()
+        if self.fsync:
+            os.fsync(self._active.fileno())
+        self._dirty = False
+
+    def start(self):
+        if self._task is None and self.flush_interval > 0:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            if self._dirty:
+                await self._run(self.flush)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._executor is not None:
+            await self._run(self._close)
+            self._executor.shutdown()
+            self._executor = None
+        else:
+            self._close()
+
+    def _close(self):
+        self.flush()
+        self._active.close()
+        for segment_id in list(self._maps):
+            self._close_map(segment_id)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "pending": self.pending_messages,
+            "recipients": len(self._index),
+            "segments": len(self._sizes),
+            "bytes": self.total_bytes,
+            "appended": self.appended,
+            "delivered": self.delivered,
+            "expired": self.expired,
+            "evicted": self.evicted,
+            "compactions": self.compactions,
+        }
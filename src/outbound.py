@@ -0,0 +1,296 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from enum import Enum
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence, Tuple
+
+
+logger = logging.getLogger("Outbound")
+
+
+class OverflowPolicy(str, Enum):
+    DROP_OLDEST = "drop_oldest"
+    DISCONNECT = "disconnect"
+    BACKPRESSURE = "backpressure"
+
+
+class OutboundQueue:
+    # Uma por sessão: com 100k conexões ociosas cada objeto conta. Sem __dict__,
+    # sem Events permanentes, e a tarefa de escrita só existe enquanto há frames
+    __slots__ = (
+        'writer', 'max_frames', 'policy', 'max_batch_bytes', 'linger', 'encode',
+        '_frames', '_queued_bytes', '_not_full', '_batch_waiter', '_flush_waiters', '_started', '_task', 'metrics',
+        'closed', 'enqueued', 'sent', 'dropped', 'high_watermark', 'batches', 'bytes_sent'
+    )
+
+    def __init__(
+        self,
+        writer: asyncio.StreamWriter,
+        max_frames: int = 1024,
+        policy: OverflowPolicy = OverflowPolicy.DROP_OLDEST,
+        max_batch_bytes: int = 64 * 1024,
+        linger: float = 0.0,
+        metrics=None,
+        encode: Optional[Callable[[Any], Sequence[bytes]]] = None
+    ):
+        if max_frames < 1:
+            raise ValueError("Fila de saída deve comportar ao menos 1 frame")
+
+        self.writer = writer
+        self.max_frames = max_frames
+        self.policy = OverflowPolicy(policy)
+        # linger = 0: um lote por volta do event loop (menor latência);
+        # linger > 0: espera até linger segundos ou max_batch_bytes (mais vazão)
+        self.max_batch_bytes = max_batch_bytes
+        self.linger = linger
+
+        # Com encode, os itens da fila são objetos (ex.: MessageFrame) codificados
+        # só ao sair dela, na ordem do fio; descartes por overflow não pulam
+        # nada que o codificador já tenha considerado enviado
+        self.encode = encode
+
+        # Só existe com frames na fila: um deque vazio já ocupa ~600 bytes
+        self._frames: Optional[Deque[Tuple[Any, int, bool]]] = None
+        self._queued_bytes = 0
+        # Criados só quando usados: Event para remetentes em backpressure e a
+        # future em que o escritor espera o lote completar (linger)
+        self._not_full: Optional[asyncio.Event] = None
+        self._batch_waiter: Optional[asyncio.Future] = None
+        # (frames enfileirados até então, future) de quem espera em flushed()
+        self._flush_waiters: Optional[List[Tuple[int, asyncio.Future]]] = None
+        self._started = False
+        self._task = None
+        # ServerMetrics opcional: frames/bytes escritos e tempo de escrita + drain
+        self.metrics = metrics
+
+        self.closed = False
+        self.enqueued = 0
+        self.sent = 0
+        self.dropped = 0
+        self.high_watermark = 0
+        self.batches = 0
+        self.bytes_sent = 0
+
+    @property
+    def depth(self) -> int:
+        return len(self._frames) if self._frames else 0
+
+    def start(self):
+        # Libera a escrita; a tarefa sobe no primeiro frame e termina quando a fila esvazia
+        self._started = True
+        self._spawn_writer()
+
+    def _spawn_writer(self):
+        if self._task is None and self._started and self._frames and not self.closed:
+            self._task = asyncio.create_task(self._writer_loop())
+
+    def _wait_not_full(self):
+        if self._not_full is None:
+            self._not_full = asyncio.Event()
+        self._not_full.clear()
+        return self._not_full.wait()
+
+    def _set_not_full(self):
+        if self._not_full is not None:
+            self._not_full.set()
+
+    def _wake_batch(self):
+        waiter = self._batch_waiter
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    async def put(self, parts: Any, size: Optional[int] = None) -> bool:
+        if self.closed:
+            self._count_dropped()
+            return False
+
+        while self.depth >= self.max_frames:
+            if self.policy is OverflowPolicy.DROP_OLDEST:
+                self._drop_oldest()
+                break
+
+            if self.policy is OverflowPolicy.DISCONNECT:
+                self._count_dropped()
+                logger.warning("Consumidor lento: fila cheia, desconectando")
+                self.abort()
+                return False
+
+            # BACKPRESSURE: o remetente espera até haver espaço
+            await self._wait_not_full()
+            if self.closed:
+                self._count_dropped()
+                return False
+
+        self._append(parts, size, False)
+        return True
+
+    def put_control(self, parts: Any, size: Optional[int] = None) -> bool:
+        # Frames de controle que não podem esperar nem se perder (ex.: REKEY, que
+        # precisa sair antes dos frames já cifrados com a chave nova): entram na
+        # hora, mesmo acima de max_frames, e o descarte por overflow os pula
+        if self.closed:
+            self._count_dropped()
+            return False
+        self._append(parts, size, True)
+        return True
+
+    def _count_dropped(self, count: int = 1):
+        # Total do servidor mantido junto: a exportação não percorre as sessões
+        self.dropped += count
+        if self.metrics is not None:
+            self.metrics.outbound_dropped += count
+
+    def _drop_oldest(self):
+        frames = self._frames
+        for i, (_, size, control) in enumerate(frames):
+            if not control:
+                del frames[i]
+                self._queued_bytes -= size
+                self._count_dropped()
+                return
+
+    def _append(self, parts: Any, size: Optional[int], control: bool):
+        if size is None:
+            size = sum(len(part) for part in parts)
+        frames = self._frames
+        if frames is None:
+            frames = self._frames = deque()
+        frames.append((parts, size, control))
+        self._queued_bytes += size
+        self.enqueued += 1
+        if len(frames) > self.high_watermark:
+            self.high_watermark = len(frames)
+        if self._task is None:
+            self._spawn_writer()
+        elif self._queued_bytes >= self.max_batch_bytes:
+            self._wake_batch()
+
+    async def wait_not_full(self, max_bytes: Optional[int] = None):
+        # Para envios em massa (ex.: mensagens offline): espera vaga em vez de descartar.
+        # max_bytes também limita os bytes na fila (frames grandes, ex.: pedaços de stream)
+        while not self.closed and (
+            self.depth >= self.max_frames or (max_bytes is not None and self._queued_bytes >= max_bytes)
+        ):
+            await self._wait_not_full()
+
+    def _take_batch(self):
+        buffers = []
+        batch_bytes = 0
+        count = 0
+        while self._frames and batch_bytes < self.max_batch_bytes:
+            parts, size, _ = self._frames.popleft()
+            buffers.extend(parts if self.encode is None else self.encode(parts))
+            batch_bytes += size
+            count += 1
+
+        self._queued_bytes -= batch_bytes
+        self._set_not_full()
+        return buffers, batch_bytes, count
+
+    async def _writer_loop(self):
+        try:
+            while self._frames:
+                if self.linger > 0 and self._queued_bytes < self.max_batch_bytes:
+                    self._batch_waiter = asyncio.get_running_loop().create_future()
+                    try:
+                        await asyncio.wait_for(self._batch_waiter, self.linger)
+                    except asyncio.TimeoutError:
+                        pass
+                    self._batch_waiter = None
+
+                buffers, batch_bytes, count = self._take_batch()
+                if self.encode is not None:
+                    # Tamanhos na fila eram estimativas; conta o que foi codificado
+                    batch_bytes = sum(len(buffer) for buffer in buffers)
+
+                metrics = self.metrics
+                started = time.perf_counter() if metrics is not None else 0.0
+
+                # Um único writelines por lote: sem concatenação intermediária
+                self.writer.writelines(buffers)
+                await self.writer.drain()
+
+                if metrics is not None:
+                    metrics.stages["drain"].observe(time.perf_counter() - started)
+                    metrics.frames_out += count
+                    metrics.bytes_out += batch_bytes
+                self.sent += count
+                self.batches += 1
+                self.bytes_sent += batch_bytes
+                if self._flush_waiters:
+                    self._notify_flushed()
+
+            # Fila vazia: a tarefa termina e o próximo put cria outra
+            self._frames = None
+            self._task = None
+
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Escritor da fila de saída encerrado: {e}")
+            self._mark_closed()
+
+    async def flushed(self) -> bool:
+        # Espera tudo o que já entrou na fila ser escrito e drenado no socket.
+        # False se a fila fechar antes: `sent` diz quantos frames saíram
+        if self.closed:
+            return False
+        target = self.enqueued
+        if self.sent + self.dropped >= target:
+            return True
+        waiter = asyncio.get_running_loop().create_future()
+        if self._flush_waiters is None:
+            self._flush_waiters = []
+        self._flush_waiters.append((target, waiter))
+        return await waiter
+
+    def _notify_flushed(self):
+        done = self.sent + self.dropped
+        pending = []
+        for target, waiter in self._flush_waiters:
+            if target <= done:
+                if not waiter.done():
+                    waiter.set_result(True)
+            else:
+                pending.append((target, waiter))
+        self._flush_waiters = pending or None
+
+    def _mark_closed(self):
+        self.closed = True
+        self._count_dropped(self.depth)
+        self._frames = None
+        self._queued_bytes = 0
+        # Libera remetentes bloqueados em backpressure e quem espera o flush
+        self._set_not_full()
+        waiters, self._flush_waiters = self._flush_waiters, None
+        for _, waiter in waiters or ():
+            if not waiter.done():
+                waiter.set_result(False)
+
+    def abort(self):
+        self._mark_closed()
+        transport = self.writer.transport
+        if transport is not None:
+            transport.abort()
+
+    async def close(self):
+        self._mark_closed()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "depth": self.depth,
+            "high_watermark": self.high_watermark,
+            "enqueued": self.enqueued,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "batches": self.batches,
+            "bytes_sent": self.bytes_sent,
+        }
@@ -1,20 +1,130 @@
 import struct
 import os
+import time
 from dataclasses import dataclass
-from typing import Tuple, Optional
+from typing import Dict, Tuple, Optional, Union, List
 from crypto import (
-    ECDHEKeyExchange, RSASignature, HKDFKeyDerivation,
+    ECDHEKeyExchange, RSASignature, HKDFKeyDerivation, PublicKeyMaterial, ServerTrust,
     AESGCMCipher, generate_nonce, bytes_to_int, int_to_bytes
 )
+from keypool import EphemeralKeyPool
+
+
+FRAME_HEADER = struct.Struct('>12s16s16sQI')
+# Pedaço de stream: bit alto do seq_no ligado e, no início do corpo, em claro,
+# stream_id + índice + flags. O cabeçalho do pedaço entra no AAD, então o tag
+# de cada pedaço fica preso ao stream e à posição (e o fim, ao flag final)
+STREAM_CHUNK_FLAG = 1 << 63
+CHUNK_HEADER = struct.Struct('>QIB')
+CHUNK_FINAL = 0x01
+# Frame de controle (bit 62 do seq_no): entre cliente e servidor, sem remetente
+# nem destinatário (NO_ID nos dois); o primeiro byte do texto claro é o tipo
+CONTROL_FLAG = 1 << 62
+FRAME_FLAGS = STREAM_CHUNK_FLAG | CONTROL_FLAG
+SEQ_MASK = CONTROL_FLAG - 1
+NO_ID = bytes(16)
+# Servidor -> cliente: varint do handle + id de 16 bytes do destinatário
+CONTROL_HANDLE = 0x01
+# Heartbeat, nos dois sentidos: o PONG devolve os bytes que vieram no PING
+CONTROL_PING = 0x02
+CONTROL_PONG = 0x03
+# Nos dois sentidos: tipo + época (4 bytes). A chave de envio de quem mandou passa
+# para a da época seguinte a partir do próximo seq (ver rekey.KeyRatchet)
+CONTROL_REKEY = 0x04
+
+# Primeiro byte após o client_id no hello: 0x02/0x03 é o prefixo do ponto
+# comprimido de pk_C (handshake completo); HELLO_RESUME pede retomada por ticket
+HELLO_PREFIX_SIZE = 17
+HELLO_RESUME = 0x52
+# Hello estendido: client_id + HELLO_EXTENDED + tamanho (2) + extensões TLV,
+# seguido do byte de tipo do hello normal (pk_C ou HELLO_RESUME)
+HELLO_EXTENDED = 0x45
+MAX_EXTENSIONS_SIZE = 1024
+EXT_COMPRESSION = 0x01
+EXT_WIRE_FORMAT = 0x02
+# Sem valor: a ponta entende CONTROL_REKEY. O servidor ecoa se também entende
+EXT_REKEY = 0x03
+# Sem valor: o cliente guarda tickets de retomada. Só então o servidor anexa um
+# à resposta do handshake completo (clientes antigos leem o resto como salt)
+EXT_SESSION_TICKET = 0x04
+RESUME_NONCE_SIZE = 32
+RESUME_REQUEST_FIXED_SIZE = HELLO_PREFIX_SIZE + RESUME_NONCE_SIZE + 2
+MAX_TICKET_SIZE = 512
+
+
+def encode_extensions(extensions: Dict[int, bytes]) -> bytes:
+    return b''.join(
+        struct.pack('>BH', ext_type, len(value)) + value
+        for ext_type, value in extensions.items()
+    )
+
+
+def decode_extensions(data: bytes) -> Dict[int, bytes]:
+    extensions = {}
+    offset = 0
+    while offset < len(data):
+        if len(data) < offset + 3:
+            raise ValueError("Extensão truncada")
+        ext_type, size = struct.unpack('>BH', data[offset:offset+3])
+        offset += 3
+        if len(data) < offset + size:
+            raise ValueError("Extensão truncada")
+        extensions[ext_type] = data[offset:offset+size]
+        offset += size
+    return extensions
+
+
+def resume_salt(client_nonce: bytes, server_nonce: bytes, offered: bytes, accepted: bytes) -> bytes:
+    # A resposta de retomada não é assinada: as extensões oferecidas e aceitas
+    # entram no salt, então removê-las ou trocá-las no caminho faz as duas pontas
+    # derivarem chaves diferentes e o primeiro frame não abre. Sem extensões, o
+    # salt é o de antes (clientes sem hello estendido continuam retomando)
+    if not offered and not accepted:
+        return client_nonce + server_nonce
+    return (
+        client_nonce + server_nonce +
+        struct.pack('>H', len(offered)) + offered +
+        struct.pack('>H', len(accepted)) + accepted
+    )
+
+
+def extended_hello(client_id: bytes, extensions: bytes, hello_body: bytes) -> bytes:
+    if not extensions:
+        return client_id + hello_body
+    return client_id + bytes([HELLO_EXTENDED]) + struct.pack('>H', len(extensions)) + extensions + hello_body
+
+
+def counter_nonce(seq_no: int) -> bytes:
+    # Nonce = seq da direção: cada sessão e direção tem chave própria e o seq
+    # nunca se repete sob ela (mensagens, pedaços e controle dividem a sequência)
+    return (seq_no & SEQ_MASK).to_bytes(12, 'big')
 
 
-@dataclass
 class MessageFrame:
-    nonce: bytes
-    sender_id: bytes
-    recipient_id: bytes
-    seq_no: int
-    ciphertext_with_tag: bytes
+    # Sem __dict__: um objeto por mensagem. ciphertext_with_tag pode ser um
+    # memoryview sobre o buffer de recepção (ver framing.FrameDecoder)
+    __slots__ = ('nonce', 'sender_id', 'recipient_id', 'seq_no', 'ciphertext_with_tag')
+
+    def __init__(
+        self,
+        nonce: bytes,
+        sender_id: bytes,
+        recipient_id: bytes,
+        seq_no: int,
+        ciphertext_with_tag: Union[bytes, memoryview]
+    ):
+        self.nonce = nonce
+        self.sender_id = sender_id
+        self.recipient_id = recipient_id
+        self.seq_no = seq_no
+        self.ciphertext_with_tag = ciphertext_with_tag
+
+    def __repr__(self) -> str:
+        return (
+            f"MessageFrame(sender_id={self.sender_id.hex()}, "
+            f"recipient_id={self.recipient_id.hex()}, seq_no={self.seq_no}, "
+            f"size={len(self.ciphertext_with_tag)})"
+        )
 
     def to_bytes(self) -> bytes:
         return (
@@ -25,6 +135,17 @@ class MessageFrame:
             self.ciphertext_with_tag
         )
 
+    def to_wire_parts(self) -> List[bytes]:
+        # Cabeçalho + tamanho num único pack; o ciphertext segue sem cópia
+        header = FRAME_HEADER.pack(
+            self.nonce,
+            self.sender_id,
+            self.recipient_id,
+            self.seq_no,
+            len(self.ciphertext_with_tag)
+        )
+        return [header, self.ciphertext_with_tag]
+
     @staticmethod
     def from_bytes(data: bytes) -> 'MessageFrame':
         if len(data) < 48:
@@ -51,12 +172,24 @@ class HandshakeResponse:
     server_certificate: bytes
     signature: bytes
     salt: bytes
+    ticket_lifetime: int = 0
+    session_ticket: bytes = b''
+    # Extensões aceitas pelo servidor (TLV); entram na assinatura
+    extensions: bytes = b''
+    # Resposta a um hello estendido: ticket e extensões vão sempre, mesmo vazios,
+    # e o cliente sabe que o servidor leu as extensões. Fora disso o layout é o
+    # original (pk, certificado, assinatura e salt)
+    extended: bool = False
 
     def to_bytes(self) -> bytes:
         data = struct.pack('>H', len(self.server_public_key)) + self.server_public_key
         data += struct.pack('>H', len(self.server_certificate)) + self.server_certificate
         data += struct.pack('>H', len(self.signature)) + self.signature
         data += self.salt
+        if self.extended:
+            data += struct.pack('>IH', self.ticket_lifetime, len(self.session_ticket))
+            data += self.session_ticket
+            data += struct.pack('>H', len(self.extensions)) + self.extensions
         return data
 
     @staticmethod
@@ -78,48 +211,268 @@ class HandshakeResponse:
         signature = data[offset:offset+sig_len]
         offset += sig_len
 
-        salt = data[offset:]
+        salt = data[offset:offset+32]
+        offset += 32
+
+        ticket_lifetime = 0
+        session_ticket = b''
+        extensions = b''
+        extended = len(data) >= offset + 8
+        if extended:
+            ticket_lifetime, ticket_len = struct.unpack('>IH', data[offset:offset+6])
+            offset += 6
+            session_ticket = data[offset:offset+ticket_len]
+            offset += ticket_len
+
+            if len(data) < offset + 2:
+                raise ValueError("Resposta do handshake truncada")
+            ext_len = struct.unpack('>H', data[offset:offset+2])[0]
+            offset += 2
+            extensions = data[offset:offset+ext_len]
 
         return HandshakeResponse(
             server_public_key=server_public_key,
             server_certificate=server_certificate,
             signature=signature,
-            salt=salt
+            salt=salt,
+            ticket_lifetime=ticket_lifetime,
+            session_ticket=session_ticket,
+            extensions=extensions,
+            extended=extended
+        )
+
+
+@dataclass
+class ResumeRequest:
+    client_id: bytes
+    client_nonce: bytes
+    session_ticket: bytes
+
+    def to_bytes(self) -> bytes:
+        return (
+            self.client_id +
+            bytes([HELLO_RESUME]) +
+            self.client_nonce +
+            struct.pack('>H', len(self.session_ticket)) +
+            self.session_ticket
+        )
+
+
+@dataclass
+class ResumeResponse:
+    accepted: bool
+    server_nonce: bytes = b''
+    ticket_lifetime: int = 0
+    session_ticket: bytes = b''
+    extensions: bytes = b''
+
+    def to_bytes(self) -> bytes:
+        if not self.accepted:
+            return b'\x00'
+        data = (
+            b'\x01' +
+            self.server_nonce +
+            struct.pack('>IH', self.ticket_lifetime, len(self.session_ticket)) +
+            self.session_ticket
+        )
+        if self.extensions:
+            data += struct.pack('>H', len(self.extensions)) + self.extensions
+        return data
+
+    @staticmethod
+    def from_bytes(data: bytes) -> 'ResumeResponse':
+        if not data or data[0] != 1:
+            return ResumeResponse(accepted=False)
+
+        offset = 1 + RESUME_NONCE_SIZE
+        server_nonce = data[1:offset]
+        ticket_lifetime, ticket_len = struct.unpack('>IH', data[offset:offset+6])
+        offset += 6
+        session_ticket = data[offset:offset+ticket_len]
+        offset += ticket_len
+
+        extensions = b''
+        if len(data) >= offset + 2:
+            ext_len = struct.unpack('>H', data[offset:offset+2])[0]
+            extensions = data[offset+2:offset+2+ext_len]
+
+        return ResumeResponse(
+            accepted=True,
+            server_nonce=server_nonce,
+            ticket_lifetime=ticket_lifetime,
+            session_ticket=session_ticket,
+            extensions=extensions
         )
 
 
+class SessionTicketKeys:
+
+    def __init__(
+        self,
+        ticket_lifetime: int = 3600,
+        rotation_interval: int = 3600,
+        master_secret: Optional[bytes] = None
+    ):
+        if rotation_interval <= 0:
+            raise ValueError("Intervalo de rotação das chaves de ticket deve ser positivo")
+        self.ticket_lifetime = ticket_lifetime
+        self.rotation_interval = rotation_interval
+        # Com segredo mestre as chaves são derivadas por época: processos que
+        # compartilham o segredo aceitam os tickets uns dos outros
+        self.master_secret = master_secret
+        # key_id -> (cifra, instante de criação)
+        self._keys: Dict[bytes, Tuple[AESGCMCipher, float]] = {}
+        self._current_id: Optional[bytes] = None
+        self.rotate()
+
+    def _epoch_key(self, key_id: bytes) -> AESGCMCipher:
+        return AESGCMCipher(HKDFKeyDerivation.expand(self.master_secret, b'ticket' + key_id))
+
+    def _epoch_id(self, now: float) -> bytes:
+        return int_to_bytes(int(now // self.rotation_interval) & 0xFFFFFFFF, 4)
+
+    def rotate(self):
+        now = time.time()
+        if self.master_secret is None:
+            key_id = os.urandom(4)
+            cipher = AESGCMCipher(os.urandom(16))
+        else:
+            key_id = self._epoch_id(now)
+            cipher = self._epoch_key(key_id)
+        self._keys[key_id] = (cipher, now)
+        self._current_id = key_id
+
+        # Uma chave antiga só é mantida enquanto ainda puder haver ticket válido emitido por ela
+        max_age = self.rotation_interval + self.ticket_lifetime
+        for old_id in [k for k, (_, created) in self._keys.items() if now - created > max_age]:
+            del self._keys[old_id]
+
+    def _maybe_rotate(self):
+        now = time.time()
+        if self.master_secret is not None:
+            if self._epoch_id(now) != self._current_id:
+                self.rotate()
+            return
+
+        _, created = self._keys[self._current_id]
+        if now - created >= self.rotation_interval:
+            self.rotate()
+
+    def _lookup(self, key_id: bytes) -> Optional[AESGCMCipher]:
+        entry = self._keys.get(key_id)
+        if entry is not None:
+            return entry[0]
+
+        if self.master_secret is None:
+            return None
+
+        # Época emitida por outro processo: aceita só se ainda estiver na janela de validade
+        age = bytes_to_int(self._epoch_id(time.time())) - bytes_to_int(key_id)
+        max_epochs = 1 + self.ticket_lifetime // self.rotation_interval
+        if not 0 <= age <= max_epochs:
+            return None
+
+        cipher = self._epoch_key(key_id)
+        self._keys[key_id] = (cipher, time.time())
+        return cipher
+
+    def issue(self, client_id: bytes, resumption_secret: bytes) -> bytes:
+        self._maybe_rotate()
+
+        key_id = self._current_id
+        cipher, _ = self._keys[key_id]
+        nonce = generate_nonce()
+        expires_at = int(time.time()) + self.ticket_lifetime
+        plaintext = int_to_bytes(expires_at, 8) + resumption_secret
+
+        # client_id entra no AAD: o ticket só vale para o cliente que o recebeu
+        return key_id + nonce + cipher.encrypt(nonce, plaintext, key_id + client_id)
+
+    def open(self, client_id: bytes, ticket: bytes) -> Optional[bytes]:
+        if len(ticket) < 4 + 12 + 8 + 16:
+            return None
+
+        key_id = ticket[0:4]
+        cipher = self._lookup(key_id)
+        if cipher is None:
+            return None
+
+        plaintext = cipher.decrypt(ticket[4:16], ticket[16:], key_id + client_id)
+        if plaintext is None:
+            return None
+
+        if bytes_to_int(plaintext[0:8]) < time.time():
+            return None
+
+        return plaintext[8:]
+
+
 class ClientHandshake:
 
-    def __init__(self, client_id: bytes):
+    def __init__(self, client_id: bytes, extensions: bytes = b''):
         self.client_id = client_id
         self.ecdhe = ECDHEKeyExchange()
+        self.resumption_secret: Optional[bytes] = None
+        self.client_nonce: Optional[bytes] = None
+        # Extensões oferecidas (TLV); vazio = hello original
+        self.extensions = extensions
 
     def get_initial_message(self) -> bytes:
-        return self.client_id + self.ecdhe.get_public_key_bytes()
+        return extended_hello(self.client_id, self.extensions, self.ecdhe.get_public_key_bytes())
+
+    def get_resume_message(self, session_ticket: bytes) -> bytes:
+        self.client_nonce = os.urandom(RESUME_NONCE_SIZE)
+        request = ResumeRequest(
+            client_id=self.client_id,
+            client_nonce=self.client_nonce,
+            session_ticket=session_ticket
+        ).to_bytes()
+        return extended_hello(self.client_id, self.extensions, request[16:])
+
+    def process_resume_response(
+        self,
+        resume_response: ResumeResponse,
+        resumption_secret: bytes
+    ) -> Tuple[bytes, bytes]:
+        if not resume_response.accepted:
+            raise ValueError("Ticket de sessão recusado pelo servidor")
+
+        key_c2s, key_s2c, self.resumption_secret = HKDFKeyDerivation.derive_session_secrets(
+            shared_secret=resumption_secret,
+            salt=resume_salt(
+                self.client_nonce, resume_response.server_nonce, self.extensions, resume_response.extensions
+            )
+        )
+
+        return key_c2s, key_s2c
 
     def process_handshake_response(
         self,
         handshake_response: HandshakeResponse,
-        server_certificate_pem: bytes
+        server_key: Union[bytes, PublicKeyMaterial, ServerTrust]
     ) -> Tuple[bytes, bytes, bytes]:
         signed_data = (
             handshake_response.server_public_key +
             self.client_id +
-            handshake_response.salt
+            handshake_response.salt +
+            handshake_response.extensions
         )
 
-        if not RSASignature.verify(
-            server_certificate_pem,
-            handshake_response.signature,
-            signed_data
-        ):
+        if isinstance(server_key, (bytes, bytearray)):
+            # PEM avulso: carregado a cada handshake (o cliente guarda um ServerTrust)
+            server_key = PublicKeyMaterial.from_pem(server_key)
+        public_key = server_key.key_for(handshake_response.server_certificate)
+        if public_key is None:
+            raise ValueError("Certificado do servidor não confere com as impressões digitais fixadas")
+
+        if not public_key.verify(handshake_response.signature, signed_data):
             raise ValueError("Assinatura RSA do servidor inválida!")
 
         shared_secret = self.ecdhe.compute_shared_secret(
             handshake_response.server_public_key
         )
 
-        key_c2s, key_s2c = HKDFKeyDerivation.derive_keys(
+        key_c2s, key_s2c, self.resumption_secret = HKDFKeyDerivation.derive_session_secrets(
             shared_secret=shared_secret,
             salt=handshake_response.salt
         )
@@ -129,12 +482,21 @@ class ClientHandshake:
 
 class ServerHandshake:
 
-    def __init__(self, rsa_signature: RSASignature):
+    def __init__(
+        self,
+        rsa_signature: RSASignature,
+        ticket_keys: Optional[SessionTicketKeys] = None,
+        key_pool: Optional[EphemeralKeyPool] = None
+    ):
         self.rsa = rsa_signature
-        self.ecdhe = ECDHEKeyExchange()
+        self.ticket_keys = ticket_keys
+        self.key_pool = key_pool
 
-    def get_server_public_key(self) -> bytes:
-        return self.ecdhe.get_public_key_bytes()
+    def new_key_exchange(self) -> ECDHEKeyExchange:
+        # Um par ECDHE novo por conexão; o pool evita gerar P-256 no caminho do accept
+        if self.key_pool is not None:
+            return self.key_pool.take()
+        return ECDHEKeyExchange()
 
     def process_client_initial_message(self, data: bytes) -> Tuple[bytes, bytes]:
         if len(data) < 49:
@@ -148,54 +510,134 @@ class ServerHandshake:
     def generate_handshake_response(
         self,
         client_id: bytes,
-        client_public_key: bytes
+        client_public_key: bytes,
+        ecdhe: ECDHEKeyExchange,
+        extensions: bytes = b''
     ) -> HandshakeResponse:
         salt = os.urandom(32)
 
-        server_pk = self.get_server_public_key()
-        signed_data = server_pk + client_id + salt
+        server_pk = ecdhe.get_public_key_bytes()
+        signed_data = server_pk + client_id + salt + extensions
 
         signature = self.rsa.sign(signed_data)
 
-        certificate = self.rsa.get_public_key_pem()
-
         return HandshakeResponse(
             server_public_key=server_pk,
-            server_certificate=certificate,
+            # Serializado uma vez por chave, não por handshake
+            server_certificate=self.rsa.key_material.pem,
             signature=signature,
-            salt=salt
+            salt=salt,
+            extensions=extensions
         )
 
     def derive_session_keys(
         self,
         client_public_key: bytes,
-        salt: bytes
+        salt: bytes,
+        ecdhe: ECDHEKeyExchange
     ) -> Tuple[bytes, bytes]:
-        shared_secret = self.ecdhe.compute_shared_secret(client_public_key)
+        key_c2s, key_s2c, _ = self.derive_session_secrets(client_public_key, salt, ecdhe)
+        return key_c2s, key_s2c
 
-        key_c2s, key_s2c = HKDFKeyDerivation.derive_keys(
+    def derive_session_secrets(
+        self,
+        client_public_key: bytes,
+        salt: bytes,
+        ecdhe: ECDHEKeyExchange
+    ) -> Tuple[bytes, bytes, bytes]:
+        shared_secret = ecdhe.compute_shared_secret(client_public_key)
+
+        return HKDFKeyDerivation.derive_session_secrets(
             shared_secret=shared_secret,
             salt=salt
         )
 
-        return key_c2s, key_s2c
+    def attach_ticket(
+        self,
+        handshake_response: HandshakeResponse,
+        client_id: bytes,
+        resumption_secret: bytes
+    ):
+        if self.ticket_keys is None:
+            return
+        handshake_response.ticket_lifetime = self.ticket_keys.ticket_lifetime
+        handshake_response.session_ticket = self.ticket_keys.issue(client_id, resumption_secret)
+
+    def process_resume_request(self, data: bytes) -> Tuple[bytes, bytes, int]:
+        client_id = data[0:16]
+        client_nonce = data[17:17+RESUME_NONCE_SIZE]
+        ticket_len = struct.unpack('>H', data[17+RESUME_NONCE_SIZE:RESUME_REQUEST_FIXED_SIZE])[0]
+
+        if ticket_len > MAX_TICKET_SIZE:
+            raise ValueError("Ticket de sessão muito longo")
+
+        return client_id, client_nonce, ticket_len
+
+    def resume_session(
+        self,
+        client_id: bytes,
+        client_nonce: bytes,
+        session_ticket: bytes,
+        extensions: bytes = b'',
+        offered: bytes = b''
+    ) -> Optional[Tuple[ResumeResponse, bytes, bytes]]:
+        # extensions: aceitas (vão na resposta); offered: como vieram no hello
+        if self.ticket_keys is None:
+            return None
+
+        resumption_secret = self.ticket_keys.open(client_id, session_ticket)
+        if resumption_secret is None:
+            return None
+
+        # Handshake abreviado: só HKDF, sem assinatura RSA nem ECDH
+        server_nonce = os.urandom(RESUME_NONCE_SIZE)
+        key_c2s, key_s2c, next_secret = HKDFKeyDerivation.derive_session_secrets(
+            shared_secret=resumption_secret,
+            salt=resume_salt(client_nonce, server_nonce, offered, extensions)
+        )
+
+        resume_response = ResumeResponse(
+            accepted=True,
+            server_nonce=server_nonce,
+            ticket_lifetime=self.ticket_keys.ticket_lifetime,
+            session_ticket=self.ticket_keys.issue(client_id, next_secret),
+            extensions=extensions
+        )
+
+        return resume_response, key_c2s, key_s2c
+
+
+KeyOrCipher = Union[bytes, AESGCMCipher]
 
 
 class MessageCrypto:
 
+    @staticmethod
+    def session_ciphers(key_c2s: bytes, key_s2c: bytes) -> Tuple[AESGCMCipher, AESGCMCipher]:
+        return AESGCMCipher(key_c2s), AESGCMCipher(key_s2c)
+
+    @staticmethod
+    def _as_cipher(key: KeyOrCipher) -> AESGCMCipher:
+        if isinstance(key, AESGCMCipher):
+            return key
+        return AESGCMCipher(key)
+
     @staticmethod
     def encrypt_message(
-        key: bytes,
+        key: KeyOrCipher,
         sender_id: bytes,
         recipient_id: bytes,
         seq_no: int,
-        plaintext: bytes
+        plaintext: bytes,
+        counter: bool = False
     ) -> MessageFrame:
-        nonce = generate_nonce()
+        # counter=True só no formato v2, que não leva o nonce no fio (sai do seq);
+        # no v1 o nonce continua aleatório, como os clientes existentes esperam
+        nonce = counter_nonce(seq_no) if counter else generate_nonce()
 
         aad = sender_id + recipient_id + int_to_bytes(seq_no, 8)
 
-        cipher = AESGCMCipher(key)
+        cipher = MessageCrypto._as_cipher(key)
         ciphertext_with_tag = cipher.encrypt(nonce, plaintext, aad)
 
         return MessageFrame(
@@ -208,7 +650,7 @@ class MessageCrypto:
 
     @staticmethod
     def decrypt_message(
-        key: bytes,
+        key: KeyOrCipher,
         frame: MessageFrame
     ) -> Optional[bytes]:
         aad = (
@@ -217,7 +659,7 @@ class MessageCrypto:
             int_to_bytes(frame.seq_no, 8)
         )
 
-        cipher = AESGCMCipher(key)
+        cipher = MessageCrypto._as_cipher(key)
         plaintext = cipher.decrypt(
             frame.nonce,
             frame.ciphertext_with_tag,
@@ -225,3 +667,56 @@ class MessageCrypto:
         )
 
         return plaintext
+
+    @staticmethod
+    def encrypt_control(key: KeyOrCipher, seq_no: int, payload: bytes, counter: bool = False) -> MessageFrame:
+        return MessageCrypto.encrypt_message(key, NO_ID, NO_ID, seq_no | CONTROL_FLAG, payload, counter)
+
+    @staticmethod
+    def encrypt_chunk(
+        key: KeyOrCipher,
+        sender_id: bytes,
+        recipient_id: bytes,
+        seq_no: int,
+        chunk_header: bytes,
+        plaintext: bytes,
+        counter: bool = False
+    ) -> MessageFrame:
+        nonce = counter_nonce(seq_no) if counter else generate_nonce()
+        seq_no |= STREAM_CHUNK_FLAG
+
+        aad = sender_id + recipient_id + int_to_bytes(seq_no, 8) + chunk_header
+
+        cipher = MessageCrypto._as_cipher(key)
+        ciphertext_with_tag = cipher.encrypt(nonce, plaintext, aad)
+
+        return MessageFrame(
+            nonce=nonce,
+            sender_id=sender_id,
+            recipient_id=recipient_id,
+            seq_no=seq_no,
+            ciphertext_with_tag=chunk_header + ciphertext_with_tag
+        )
+
+    @staticmethod
+    def decrypt_chunk(
+        key: KeyOrCipher,
+        frame: MessageFrame
+    ) -> Optional[Tuple[bytes, bytes]]:
+        body = frame.ciphertext_with_tag
+        if len(body) < CHUNK_HEADER.size:
+            return None
+        chunk_header = bytes(body[:CHUNK_HEADER.size])
+
+        aad = (
+            frame.sender_id +
+            frame.recipient_id +
+            int_to_bytes(frame.seq_no, 8) +
+            chunk_header
+        )
+
+        cipher = MessageCrypto._as_cipher(key)
+        plaintext = cipher.decrypt(frame.nonce, body[CHUNK_HEADER.size:], aad)
+        if plaintext is None:
+            return None
+        return chunk_header, plaintext
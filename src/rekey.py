@@ -0,0 +1,100 @@
+from typing import List, Optional, Tuple
+
+from crypto import AESGCMCipher, HKDFKeyDerivation
+from protocol import CONTROL_REKEY
+from replay import ReplayWindow
+
+
+# Limites padrão por chave e sentido; o primeiro atingido dispara a troca
+REKEY_AFTER_MESSAGES = 1 << 24
+REKEY_AFTER_BYTES = 1 << 36
+# Tipo + época (4 bytes)
+REKEY_PAYLOAD_SIZE = 5
+# Chaves de recepção antigas guardadas ao mesmo tempo; trocas seguidas com
+# frames ainda em trânsito deixam mais de uma época pendente
+MAX_PREVIOUS_KEYS = 32
+
+
+def ratchet_key(key: bytes, epoch: int) -> bytes:
+    # Chave da época seguinte derivada da atual: só anda para frente, quem
+    # obtiver a nova não recupera as anteriores
+    return HKDFKeyDerivation.expand(key, b'rekey' + epoch.to_bytes(4, 'big'), length=len(key))
+
+
+class KeyRatchet:
+    # Troca de chaves dentro da conexão, uma por sessão negociada (EXT_REKEY).
+    # Cada ponta troca só a chave do próprio sentido de envio: depois de
+    # max_messages frames ou max_bytes de texto claro, manda CONTROL_REKEY ainda
+    # sob a chave antiga e passa a cifrar com ratchet_key(antiga). O seq continua,
+    # então nonce e janela anti-replay seguem iguais.
+    # Na recepção a chave sai do seq: a partir do seguinte ao REKEY, a nova; antes
+    # dele, a da época em que o seq cai. As anteriores ficam guardadas enquanto a
+    # janela anti-replay ainda aceita frames da faixa delas (os que estavam em
+    # trânsito ou ainda sendo cifrados do outro lado)
+    __slots__ = (
+        'max_messages', 'max_bytes', 'sent_messages', 'sent_bytes', 'send_epoch',
+        'receive_epoch', 'previous', 'switch_seq', 'rekeys_sent', 'rekeys_received'
+    )
+
+    def __init__(self, max_messages: int = REKEY_AFTER_MESSAGES, max_bytes: int = REKEY_AFTER_BYTES):
+        # 0 desliga o limite; com os dois em 0 esta ponta nunca troca, mas
+        # continua aceitando as trocas do outro lado
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.sent_messages = 0
+        self.sent_bytes = 0
+        self.send_epoch = 0
+
+        self.receive_epoch = 0
+        self.switch_seq = 0
+        # (seq da troca, chave válida abaixo dele), da troca mais antiga à mais recente
+        self.previous: List[Tuple[int, AESGCMCipher]] = []
+
+        self.rekeys_sent = 0
+        self.rekeys_received = 0
+
+    def count(self, size: int) -> bool:
+        # Um frame cifrado com a chave de envio atual; True quando é hora de trocar
+        self.sent_messages += 1
+        self.sent_bytes += size
+        return 0 < self.max_messages <= self.sent_messages or 0 < self.max_bytes <= self.sent_bytes
+
+    def ratchet_send(self, cipher: AESGCMCipher) -> Tuple[bytes, AESGCMCipher]:
+        # Payload do REKEY (a cifrar ainda com `cipher`) e a chave dos próximos envios
+        self.send_epoch += 1
+        self.sent_messages = 0
+        self.sent_bytes = 0
+        self.rekeys_sent += 1
+        payload = bytes((CONTROL_REKEY,)) + self.send_epoch.to_bytes(4, 'big')
+        return payload, AESGCMCipher(ratchet_key(cipher.key, self.send_epoch))
+
+    def receive_cipher(self, cipher: AESGCMCipher, seq_no: int, replay: ReplayWindow) -> AESGCMCipher:
+        previous = self.previous
+        if previous:
+            # A janela já passou da troca: nada da faixa antiga é aceito (a janela
+            # só aceita seq > highest - size), a chave sai da memória
+            horizon = replay.highest - replay.size + 1
+            while previous and previous[0][0] <= horizon:
+                del previous[0]
+        if seq_no >= self.switch_seq:
+            return cipher
+        for switch_seq, key in previous:
+            if seq_no < switch_seq:
+                return key
+        return cipher
+
+    def ratchet_receive(self, cipher: AESGCMCipher, payload: bytes, seq_no: int) -> Optional[AESGCMCipher]:
+        # REKEY autenticado do outro lado: a chave nova vale a partir do seq
+        # seguinte. None para época fora de ordem ou REKEY de antes da última troca
+        if len(payload) != REKEY_PAYLOAD_SIZE or seq_no < self.switch_seq:
+            return None
+        epoch = int.from_bytes(payload[1:], 'big')
+        if epoch != self.receive_epoch + 1:
+            return None
+        self.receive_epoch = epoch
+        self.switch_seq = seq_no + 1
+        self.previous.append((self.switch_seq, cipher))
+        if len(self.previous) > MAX_PREVIOUS_KEYS:
+            del self.previous[0]
+        self.rekeys_received += 1
+        return AESGCMCipher(ratchet_key(cipher.key, epoch))
@@ -0,0 +1,53 @@
+from functools import lru_cache
+
+
+@lru_cache(maxsize=None)
+def _window_mask(size: int) -> int:
+    # Compartilhada entre as janelas do mesmo tamanho (~160 bytes cada com 1024)
+    return (1 << size) - 1
+
+
+class ReplayWindow:
+    # Janela deslizante de números de sequência: o bit i do bitmap marca
+    # `highest - i` como já aceito. Frames podem chegar fora de ordem dentro
+    # da janela; repetidos ou mais antigos que ela são recusados
+    __slots__ = ('size', 'highest', 'bitmap', '_mask')
+
+    def __init__(self, size: int = 1024):
+        if size < 1:
+            raise ValueError("Janela anti-replay deve ter ao menos 1 posição")
+        self.size = size
+        self._mask = _window_mask(size)
+        self.highest = -1
+        self.bitmap = 0
+
+    def reset(self):
+        self.highest = -1
+        self.bitmap = 0
+
+    def check(self, seq_no: int) -> bool:
+        # Só consulta: usado antes de decifrar, para recusar barato
+        offset = self.highest - seq_no
+        if offset < 0:
+            return True
+        return offset < self.size and not (self.bitmap >> offset) & 1
+
+    def accept(self, seq_no: int) -> bool:
+        # Consulta e marca; chamar só depois de o tag ser validado, para que
+        # frames forjados não queimem números nem empurrem a janela
+        offset = self.highest - seq_no
+        if offset < 0:
+            if -offset < self.size:
+                self.bitmap = ((self.bitmap << -offset) | 1) & self._mask
+            else:
+                self.bitmap = 1
+            self.highest = seq_no
+            return True
+
+        if offset >= self.size:
+            return False
+        bit = 1 << offset
+        if self.bitmap & bit:
+            return False
+        self.bitmap |= bit
+        return True
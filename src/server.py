@@ -1,13 +1,36 @@
 import asyncio
 import logging
+import signal
+import time
 import uuid
-from typing import Dict, Optional, Tuple
-from dataclasses import dataclass
+from functools import partial
+from typing import Dict, Optional, Sequence, Tuple
 from protocol import (
     ServerHandshake, MessageCrypto, MessageFrame,
-    HandshakeResponse
+    HandshakeResponse, ResumeResponse, SessionTicketKeys,
+    HELLO_PREFIX_SIZE, HELLO_RESUME, RESUME_REQUEST_FIXED_SIZE, FRAME_HEADER,
+    HELLO_EXTENDED, MAX_EXTENSIONS_SIZE, EXT_COMPRESSION, EXT_WIRE_FORMAT, EXT_REKEY, EXT_SESSION_TICKET,
+    encode_extensions, decode_extensions,
+    STREAM_CHUNK_FLAG, CHUNK_HEADER, CHUNK_FINAL, CONTROL_FLAG, SEQ_MASK, NO_ID,
+    CONTROL_HANDLE, CONTROL_PING, CONTROL_PONG, CONTROL_REKEY
 )
-from crypto import RSASignature
+from crypto import RSASignature, AESGCMCipher
+from outbound import OutboundQueue, OverflowPolicy
+from framing import frame_reader, TRANSPORT_ENGINES
+from offline_store import OfflineStore
+from metrics import ServerMetrics, start_metrics_server, dump_metrics
+from eventlog import EventLog, start_async_logging, stop_async_logging
+from compression import DeflateCodec, DEFAULT_DICTIONARY, MARKER_DEFLATE
+from replay import ReplayWindow
+from rekey import KeyRatchet, REKEY_AFTER_MESSAGES, REKEY_AFTER_BYTES
+from crypto_pool import CryptoPool
+from wire import (
+    WIRE_V1, WIRE_V2, WIRE_FORMATS, MAX_HANDLES,
+    CompactFrameEncoder, CompactFrameDecoder, compact_frame_size, encode_varint
+)
+from handshake_engine import HandshakeEngine
+from timer_wheel import TimerWheel, Timer
+from keypool import EphemeralKeyPool
 
 
 logging.basicConfig(
@@ -17,55 +40,352 @@ logging.basicConfig(
 logger = logging.getLogger("Server")
 
 
-@dataclass
 class ClientSession:
-    client_id: bytes
-    reader: asyncio.StreamReader
-    writer: asyncio.StreamWriter
-    key_c2s: bytes
-    key_s2c: bytes
-    seq_recv: int
-    seq_send: int
-    salt: bytes
+    # Uma por conexão autenticada, sem __dict__. O material de chave fica só nos
+    # contextos AES-GCM (cipher_*.key); leitor, escritor e salt do handshake
+    # não são guardados: a fila de saída já tem o escritor
+    __slots__ = (
+        'client_id', 'replay', 'seq_send', 'cipher_c2s', 'cipher_s2c', 'outbound', 'codec', 'streams',
+        'send_tail', 'wire_format', 'recipient_handles', 'recipient_ids', 'last_activity', 'pinged_at', 'timer',
+        'rekey'
+    )
+
+    def __init__(
+        self,
+        client_id: bytes,
+        replay: ReplayWindow,
+        cipher_c2s: AESGCMCipher,
+        cipher_s2c: AESGCMCipher,
+        outbound: OutboundQueue,
+        seq_send: int = 0,
+        codec: Optional[DeflateCodec] = None,
+        wire_format: int = WIRE_V1,
+        last_activity: float = 0.0,
+        rekey: Optional[KeyRatchet] = None
+    ):
+        self.client_id = client_id
+        self.replay = replay
+        self.seq_send = seq_send
+        self.cipher_c2s = cipher_c2s
+        self.cipher_s2c = cipher_s2c
+        self.outbound = outbound
+        # Compressão negociada no handshake (None = desligada nesta sessão)
+        self.codec = codec
+        # Streams abertos por este remetente: stream_id -> (destinatário, próximo índice,
+        # instante do último pedaço)
+        self.streams: Dict[int, Tuple[bytes, int, float]] = {}
+        # Último envio ainda cifrando no pool: os seguintes esperam por ele para
+        # entrar na fila de saída na ordem do seq
+        self.send_tail: Optional[asyncio.Future] = None
+        # Formato dos frames negociado no handshake; na v2, handles curtos que o
+        # servidor atribuiu aos destinatários deste cliente (nos dois sentidos;
+        # só existem na v2)
+        self.wire_format = wire_format
+        self.recipient_handles: Optional[Dict[bytes, int]] = {} if wire_format == WIRE_V2 else None
+        self.recipient_ids: Optional[Dict[int, bytes]] = {} if wire_format == WIRE_V2 else None
+        # Heartbeat e ociosidade: a leitura só atualiza last_activity (um por lote);
+        # o timer da sessão na roda confere quando vence e se reagenda
+        self.last_activity = last_activity
+        self.pinged_at: Optional[float] = None
+        self.timer: Optional[Timer] = None
+        # Troca de chaves em banda, quando negociada: cipher_* são sempre as
+        # chaves da época atual de cada sentido
+        self.rekey = rekey
+
+
+def seal_frame(
+    cipher: AESGCMCipher,
+    codec: Optional[DeflateCodec],
+    sender_id: bytes,
+    recipient_id: bytes,
+    seq_no: int,
+    plaintext: bytes,
+    chunk_header: bytes,
+    control: bool = False,
+    compress: bool = False,
+    counter: bool = False
+) -> MessageFrame:
+    # Compressão + cifra de um envio; roda no event loop ou numa thread do CryptoPool.
+    # compress=False: o remetente mandou cru, e o destinatário recebe cru também.
+    # counter: nonce derivado do seq (sessões v2)
+    if control:
+        return MessageCrypto.encrypt_control(cipher, seq_no, plaintext, counter)
+    if chunk_header:
+        return MessageCrypto.encrypt_chunk(cipher, sender_id, recipient_id, seq_no, chunk_header, plaintext, counter)
+    if codec is not None:
+        plaintext = codec.pack(plaintext, compress)
+    return MessageCrypto.encrypt_message(cipher, sender_id, recipient_id, seq_no, plaintext, counter)
+
+
+def load_or_generate_keys(cert_path: str, key_path: str) -> RSASignature:
+    import os
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.backends import default_backend
+
+    if os.path.exists(key_path):
+        with open(key_path, 'rb') as f:
+            private_key = serialization.load_pem_private_key(
+                f.read(), password=None, backend=default_backend()
+            )
+        logger.info(f"Chaves carregadas de {key_path}")
+        return RSASignature(private_key)
+    else:
+        rsa = RSASignature()
+        os.makedirs(os.path.dirname(cert_path), exist_ok=True)
+        with open(cert_path, 'wb') as f:
+            f.write(rsa.get_public_key_pem())
+        with open(key_path, 'wb') as f:
+            f.write(rsa.get_private_key_pem())
+        logger.info(f"Novas chaves geradas e salvas em {cert_path}, {key_path}")
+        return rsa
 
 
 class SecureMessagingServer:
 
-    def __init__(self, host: str = "127.0.0.1", port: int = 9999, cert_path: str = None, key_path: str = None):
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 9999,
+        cert_path: str = None,
+        key_path: str = None,
+        outbound_queue_size: int = 1024,
+        overflow_policy: OverflowPolicy = OverflowPolicy.DROP_OLDEST,
+        write_batch_bytes: int = 64 * 1024,
+        write_linger: float = 0.0,
+        handshake_executor: str = "thread",
+        handshake_workers: Optional[int] = None,
+        max_inflight_handshakes: int = 32,
+        max_pending_handshakes: int = 1024,
+        session_ticket_lifetime: int = 3600,
+        ticket_key_rotation: int = 3600,
+        ecdhe_pool_size: int = 256,
+        ecdhe_refill_batch: int = 32,
+        ecdhe_refill_interval: float = 0.0,
+        ticket_master_secret: Optional[bytes] = None,
+        transport_engine: str = "streams",
+        offline_store_path: Optional[str] = None,
+        offline_ttl: float = 7 * 24 * 3600,
+        offline_max_bytes: int = 1024 * 1024 * 1024,
+        offline_segment_bytes: int = 64 * 1024 * 1024,
+        offline_drain_batch: int = 1024,
+        enable_metrics: bool = True,
+        metrics_host: str = "127.0.0.1",
+        metrics_port: Optional[int] = None,
+        metrics_dump_path: Optional[str] = None,
+        metrics_dump_interval: float = 10.0,
+        metrics_sample_every: int = 16,
+        log_sample_every: int = 100,
+        log_rate_limit: float = 10.0,
+        log_plaintext: bool = False,
+        event_ring_size: int = 4096,
+        compression: bool = True,
+        compression_dictionaries: Sequence[bytes] = (DEFAULT_DICTIONARY,),
+        compression_level: int = 6,
+        compression_threshold: int = 32,
+        max_frame_size: int = 1024 * 1024,
+        max_open_streams: int = 16,
+        max_stream_queue_bytes: int = 4 * 1024 * 1024,
+        stream_idle_timeout: float = 30.0,
+        replay_window_size: int = 1024,
+        rekey_after_messages: int = REKEY_AFTER_MESSAGES,
+        rekey_after_bytes: int = REKEY_AFTER_BYTES,
+        crypto_workers: int = 0,
+        crypto_offload_threshold: int = 64 * 1024,
+        wire_formats: Sequence[int] = WIRE_FORMATS,
+        handshake_timeout: float = 10.0,
+        idle_timeout: float = 120.0,
+        heartbeat_interval: float = 30.0,
+        timer_tick: float = 0.25
+    ):
+        if transport_engine not in TRANSPORT_ENGINES:
+            raise ValueError(f"Motor de transporte inválido: {transport_engine}")
+
         self.host = host
         self.port = port
         self.sessions: Dict[bytes, ClientSession] = {}
+        self.outbound_queue_size = outbound_queue_size
+        self.overflow_policy = OverflowPolicy(overflow_policy)
+        self.write_batch_bytes = write_batch_bytes
+        self.write_linger = write_linger
+        self.transport_engine = transport_engine
+        self.dropped_frames = 0
+        # Limite rígido por frame: payloads maiores vão em stream (pedaços)
+        self.max_frame_size = max_frame_size
+        self.max_open_streams = max_open_streams
+        # Pedaços de stream esperam a fila do destinatário ficar abaixo disso (bytes)
+        self.max_stream_queue_bytes = max_stream_queue_bytes
+        # Stream sem pedaço novo há mais que isso perde a vaga quando outro precisa dela
+        self.stream_idle_timeout = stream_idle_timeout
+        # Frames aceitos fora de ordem até essa distância do maior seq visto
+        self.replay_window_size = replay_window_size
+        # Troca a chave servidor -> cliente depois de tantos frames ou bytes com a
+        # mesma chave (0 desliga cada limite; as trocas do cliente são aceitas igual)
+        self.rekey_after_messages = rekey_after_messages
+        self.rekey_after_bytes = rekey_after_bytes
+        self.rekeys_sent = 0
+        self.rekeys_received = 0
+        # Versões do formato de frame aceitas quando o cliente oferece (v1 sempre vale)
+        self.wire_formats = tuple(wire_formats)
+        # Cifra/decifra de payloads grandes em threads (None = tudo no event loop)
+        self.crypto_pool = None
+        if crypto_workers > 0:
+            self.crypto_pool = CryptoPool(crypto_workers, crypto_offload_threshold)
+
+        # Log do caminho de mensagens: amostrado (info) ou limitado por segundo (avisos)
+        self.log_plaintext = log_plaintext
+        self.events = EventLog(logger, ring_size=event_ring_size)
+        for kind in ("message_received", "message_routed", "message_forwarded", "message_stored"):
+            self.events.policy(kind, sample_every=log_sample_every)
+        for kind in (
+            "replay", "auth_failure", "invalid_payload", "unknown_recipient", "message_dropped", "stream_error",
+            "connection_reaped"
+        ):
+            self.events.policy(kind, max_per_second=log_rate_limit)
+
+        # Codecs aceitos quando o cliente oferece compressão, por id de dicionário
+        self.compression_codecs: Dict[bytes, DeflateCodec] = {}
+        if compression:
+            for dictionary in (*compression_dictionaries, b''):
+                codec = DeflateCodec(dictionary, level=compression_level, threshold=compression_threshold)
+                self.compression_codecs.setdefault(codec.dictionary_id, codec)
+
+        # Roteamento para sessões fora deste processo (workers/cluster)
+        self.router = None
+
+        # Mensagens para destinatários desconectados (None = descartar)
+        self.offline_store = None
+        self.offline_drain_batch = offline_drain_batch
+        if offline_store_path:
+            self.offline_store = OfflineStore(
+                offline_store_path,
+                segment_bytes=offline_segment_bytes,
+                max_bytes=offline_max_bytes,
+                ttl=offline_ttl
+            )
 
         # Carrega chaves existentes ou gera novas
         if cert_path and key_path:
-            self.rsa_signature = self._load_or_generate_keys(cert_path, key_path)
+            self.rsa_signature = load_or_generate_keys(cert_path, key_path)
         else:
             self.rsa_signature = RSASignature()
+        # Para clientes que fixam a chave (server_fingerprints)
+        logger.info(f"Impressão digital da chave do servidor: sha256:{self.rsa_signature.key_material.fingerprint.hex()}")
+
+        ticket_keys = None
+        if session_ticket_lifetime > 0:
+            ticket_keys = SessionTicketKeys(
+                ticket_lifetime=session_ticket_lifetime,
+                rotation_interval=ticket_key_rotation,
+                master_secret=ticket_master_secret
+            )
+
+        # No modo "process" o pool fica em cada processo do executor de handshake
+        # (HandshakeEngine); um pool aqui seria preenchido e nunca usado
+        self.ecdhe_pool_size = ecdhe_pool_size
+        self.key_pool = None
+        if ecdhe_pool_size > 0 and handshake_executor != "process":
+            self.key_pool = EphemeralKeyPool(
+                size=ecdhe_pool_size,
+                refill_batch=ecdhe_refill_batch,
+                refill_interval=ecdhe_refill_interval
+            )
+            self.key_pool.prefill()
+
+        self.handshake = ServerHandshake(self.rsa_signature, ticket_keys, self.key_pool)
+        self.full_handshakes = 0
+        self.resumed_handshakes = 0
+        self.handshake_engine = HandshakeEngine(
+            self.handshake,
+            executor_kind=handshake_executor,
+            max_workers=handshake_workers,
+            max_inflight=max_inflight_handshakes,
+            max_pending=max_pending_handshakes,
+            ecdhe_pool_size=ecdhe_pool_size,
+            ecdhe_refill_batch=ecdhe_refill_batch,
+            ecdhe_refill_interval=ecdhe_refill_interval
+        )
+
+        # Timeouts de handshake e ociosidade e o heartbeat, todos numa roda de
+        # timers com uma única tarefa (0 desliga cada um)
+        self.handshake_timeout = handshake_timeout
+        self.idle_timeout = idle_timeout
+        self.heartbeat_interval = heartbeat_interval
+        self.reaped_handshakes = 0
+        self.reaped_idle = 0
+        self.heartbeats_sent = 0
+
+        # Histogramas por etapa e contadores (None = sem custo no caminho quente)
+        self.metrics = None
+        self.metrics_host = metrics_host
+        self.metrics_port = metrics_port
+        self.metrics_dump_path = metrics_dump_path
+        self.metrics_dump_interval = metrics_dump_interval
+        self._metrics_server = None
+        self._metrics_dump_task = None
+        if enable_metrics:
+            self.metrics = ServerMetrics(sample_every=metrics_sample_every)
+            self._register_metrics()
+        # Primeiro nível cobrindo o idle_timeout: prazos de sessão não descem de
+        # nível, e o avanço não recoloca metade das sessões de uma vez
+        slots = 256
+        while slots * timer_tick <= max(idle_timeout, heartbeat_interval, handshake_timeout):
+            slots *= 2
+        self.timers = TimerWheel(
+            timer_tick, slots,
+            histogram=self.metrics.stages["timer_tick"] if self.metrics is not None else None
+        )
 
-        self.handshake = ServerHandshake(self.rsa_signature)
         logger.info(f"Servidor iniciado em {host}:{port}")
 
-    def _load_or_generate_keys(self, cert_path: str, key_path: str) -> RSASignature:
-        import os
-        from cryptography.hazmat.primitives import serialization
-        from cryptography.hazmat.backends import default_backend
+    def key_pool_stats(self) -> Optional[Dict[str, int]]:
+        # Pool do servidor, ou a soma dos pools dos processos no modo "process"
+        if self.key_pool is not None:
+            return self.key_pool.stats()
+        return self.handshake_engine.worker_key_pool_stats()
 
-        if os.path.exists(key_path):
-            with open(key_path, 'rb') as f:
-                private_key = serialization.load_pem_private_key(
-                    f.read(), password=None, backend=default_backend()
-                )
-            logger.info(f"Chaves carregadas de {key_path}")
-            return RSASignature(private_key)
-        else:
-            rsa = RSASignature()
-            os.makedirs(os.path.dirname(cert_path), exist_ok=True)
-            with open(cert_path, 'wb') as f:
-                f.write(rsa.get_public_key_pem())
-            with open(key_path, 'wb') as f:
-                f.write(rsa.get_private_key_pem())
-            logger.info(f"Novas chaves geradas e salvas em {cert_path}, {key_path}")
-            return rsa
+    def _register_metrics(self):
+        metrics = self.metrics
+        metrics.gauge("sessions", "Sessões ativas", lambda: len(self.sessions))
+        metrics.gauge(
+            "outbound_queue_depth", "Frames aguardando escrita em todas as sessões",
+            lambda: sum(s.outbound.depth for s in self.sessions.values())
+        )
+        metrics.gauge(
+            "handshakes_pending", "Handshakes admitidos e ainda não concluídos",
+            lambda: self.handshake_engine.pending
+        )
+        metrics.gauge(
+            "handshakes_inflight", "Handshakes em execução no executor",
+            lambda: self.handshake_engine.inflight
+        )
+        if self.ecdhe_pool_size > 0:
+            metrics.gauge(
+                "ecdhe_pool_available", "Chaves efêmeras prontas no pool",
+                lambda: (self.key_pool_stats() or {}).get("available", 0)
+            )
+        if self.offline_store is not None:
+            metrics.gauge(
+                "offline_pending", "Mensagens offline aguardando entrega",
+                lambda: self.offline_store.pending_messages
+            )
+        metrics.counter("handshakes_full", "Handshakes completos", lambda: self.full_handshakes)
+        metrics.counter("handshakes_resumed", "Sessões retomadas por ticket", lambda: self.resumed_handshakes)
+        metrics.counter(
+            "handshakes_rejected", "Conexões recusadas por excesso de handshakes",
+            lambda: self.handshake_engine.rejected
+        )
+        metrics.counter(
+            "connections_reaped_handshake", "Conexões encerradas por handshake além do handshake_timeout",
+            lambda: self.reaped_handshakes
+        )
+        metrics.counter(
+            "connections_reaped_idle", "Sessões encerradas por ociosidade além do idle_timeout",
+            lambda: self.reaped_idle
+        )
+        metrics.counter("heartbeats_sent", "PINGs enviados a sessões ociosas", lambda: self.heartbeats_sent)
+        metrics.counter("rekeys_sent", "Trocas de chave servidor -> cliente", lambda: self.rekeys_sent)
+        metrics.counter("rekeys_received", "Trocas de chave cliente -> servidor", lambda: self.rekeys_received)
+        metrics.gauge("timers", "Timers agendados na roda", lambda: len(self.timers))
 
     def save_credentials(self, cert_path: str, key_path: str):
         with open(cert_path, 'wb') as f:
@@ -84,154 +404,750 @@ class SecureMessagingServer:
         peer_addr = writer.get_extra_info('peername')
         logger.info(f"Nova conexão de {peer_addr}")
 
-        try:
-            initial_message = await reader.readexactly(49)
-            client_id, client_public_key = self.handshake.process_client_initial_message(
-                initial_message
-            )
+        if self.key_pool is not None:
+            self.key_pool.start()
+        if self.offline_store is not None:
+            self.offline_store.start()
 
-            logger.info(f"Cliente conectado: {client_id.hex()}")
+        client_id = None
+        session = None
+        handshake_timer = None
 
-            handshake_response = self.handshake.generate_handshake_response(
-                client_id, client_public_key
-            )
+        if not self.handshake_engine.admit():
+            logger.warning(f"Limite de handshakes pendentes atingido, recusando {peer_addr}")
+            writer.close()
+            await writer.wait_closed()
+            return
+        admitted = True
 
-            response_data = handshake_response.to_bytes()
-            response_header = len(response_data).to_bytes(4, 'big')
-            writer.write(response_header + response_data)
-            await writer.drain()
+        if self.handshake_timeout > 0:
+            self.timers.start()
+            handshake_timer = self.timers.schedule(self.handshake_timeout, self._reap_handshake, writer, peer_addr)
 
-            key_c2s, key_s2c = self.handshake.derive_session_keys(
-                client_public_key, handshake_response.salt
-            )
+        try:
+            started = time.perf_counter()
+            client_id, key_c2s, key_s2c, _, codec, wire_format, rekey = await self._perform_handshake(reader, writer)
+            if self.metrics is not None:
+                self.metrics.stages["handshake"].observe(time.perf_counter() - started)
+
+            self.handshake_engine.release()
+            admitted = False
+            if handshake_timer is not None:
+                handshake_timer.cancel()
+                handshake_timer = None
+
+            cipher_c2s, cipher_s2c = MessageCrypto.session_ciphers(key_c2s, key_s2c)
 
             session = ClientSession(
                 client_id=client_id,
-                reader=reader,
-                writer=writer,
-                key_c2s=key_c2s,
-                key_s2c=key_s2c,
-                seq_recv=-1,
-                seq_send=0,
-                salt=handshake_response.salt
+                replay=ReplayWindow(self.replay_window_size),
+                cipher_c2s=cipher_c2s,
+                cipher_s2c=cipher_s2c,
+                outbound=OutboundQueue(
+                    writer,
+                    max_frames=self.outbound_queue_size,
+                    policy=self.overflow_policy,
+                    max_batch_bytes=self.write_batch_bytes,
+                    linger=self.write_linger,
+                    metrics=self.metrics
+                ),
+                codec=codec,
+                wire_format=wire_format,
+                last_activity=time.monotonic(),
+                rekey=KeyRatchet(self.rekey_after_messages, self.rekey_after_bytes) if rekey else None
             )
+            decoder = None
+            if wire_format == WIRE_V2:
+                session.outbound.encode = CompactFrameEncoder(server_side=True).encode
+                decoder = CompactFrameDecoder(
+                    client_id, session.recipient_ids, server_side=True, max_frame_size=self.max_frame_size
+                )
+            session.outbound.start()
+            if self.idle_timeout > 0 or self.heartbeat_interval > 0:
+                self.timers.start()
+                self._arm_session_timer(session, session.last_activity)
+            if self.offline_store is not None:
+                await self._deliver_offline(session)
             self.sessions[client_id] = session
+            if self.router is not None:
+                self.router.session_opened(client_id)
 
             logger.info(f"Sessão estabelecida para {client_id.hex()}")
 
+            source = await frame_reader(
+                self.transport_engine, reader, writer,
+                self.metrics.stages["decode"] if self.metrics is not None else None,
+                self.max_frame_size,
+                decoder
+            )
             while True:
-                header = await reader.readexactly(52)
-
                 try:
-                    size_data = await reader.readexactly(4)
-                    ciphertext_size = int.from_bytes(size_data, 'big')
-                    ciphertext_with_tag = await reader.readexactly(ciphertext_size)
-
-                    frame_data = header + size_data + ciphertext_with_tag
-
-                    frame = self._parse_frame_with_size(frame_data)
-
+                    frames = await source.read_frames()
                 except asyncio.IncompleteReadError:
                     logger.warning(f"Conexão fechada por {client_id.hex()}")
                     break
+                except ValueError as e:
+                    logger.warning(f"Frame inválido de {client_id.hex()}: {e}")
+                    break
+                session.last_activity = time.monotonic()
 
-                if frame.seq_no <= session.seq_recv:
-                    logger.warning(f"Ataque de replay detectado de {client_id.hex()}")
-                    continue
-
-                session.seq_recv = frame.seq_no
-
-                plaintext = MessageCrypto.decrypt_message(
-                    session.key_c2s, frame
-                )
-
-                if plaintext is None:
-                    logger.warning(f"Falha na autenticação de mensagem de {client_id.hex()}")
+                if self.crypto_pool is None:
+                    for frame in frames:
+                        await self._process_frame(session, frame)
                     continue
 
-                logger.info(
-                    f"Mensagem de {frame.sender_id.hex()} "
-                    f"para {frame.recipient_id.hex()}: {plaintext[:50]}"
-                )
+                openings = self.crypto_pool.open_frames(partial(self._receive_cipher, session), frames)
+                try:
+                    for frame, opening in zip(frames, openings):
+                        await self._process_frame(session, frame, opening)
+                finally:
+                    await self.crypto_pool.settle(openings)
 
-                await self._route_message(frame, plaintext, session)
+        except asyncio.IncompleteReadError:
+            # Fechada pelo cliente ou pelo handshake_timeout antes do fim do handshake
+            logger.info(f"Conexão de {peer_addr} encerrada durante o handshake")
 
         except Exception as e:
             logger.error(f"Erro ao tratar cliente: {e}")
 
         finally:
-            if client_id in self.sessions:
-                del self.sessions[client_id]
-                logger.info(f"Sessão encerrada: {client_id.hex()}")
+            if admitted:
+                self.handshake_engine.release()
+            if handshake_timer is not None:
+                handshake_timer.cancel()
+
+            if session is not None:
+                if session.timer is not None:
+                    session.timer.cancel()
+                if self.sessions.get(client_id) is session:
+                    del self.sessions[client_id]
+                    if self.router is not None:
+                        self.router.session_closed(client_id)
+                    logger.info(f"Sessão encerrada: {client_id.hex()}")
+
+                await session.outbound.close()
+                self.dropped_frames += session.outbound.dropped
 
             writer.close()
             await writer.wait_closed()
 
-    def _parse_frame_with_size(self, data: bytes) -> MessageFrame:
-        nonce = data[0:12]
-        sender_id = data[12:28]
-        recipient_id = data[28:44]
-        seq_no = int.from_bytes(data[44:52], 'big')
-        ciphertext_with_tag = data[56:]
-
-        return MessageFrame(
-            nonce=nonce,
-            sender_id=sender_id,
-            recipient_id=recipient_id,
-            seq_no=seq_no,
-            ciphertext_with_tag=ciphertext_with_tag
+    async def _perform_handshake(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter
+    ) -> Tuple[bytes, bytes, bytes, bytes, Optional[DeflateCodec], int, bool]:
+        hello, offered = await self._read_hello(reader)
+        offered_extensions = decode_extensions(offered)
+        extensions, codec, wire_format, rekey = self._negotiate_extensions(offered_extensions)
+
+        if hello[16] == HELLO_RESUME:
+            request = hello + await reader.readexactly(RESUME_REQUEST_FIXED_SIZE - HELLO_PREFIX_SIZE)
+            client_id, client_nonce, ticket_len = self.handshake.process_resume_request(request)
+            session_ticket = await reader.readexactly(ticket_len)
+
+            resumed = self.handshake.resume_session(client_id, client_nonce, session_ticket, extensions, offered)
+            if resumed is not None:
+                resume_response, key_c2s, key_s2c = resumed
+                self._write_handshake_message(writer, resume_response.to_bytes())
+                await writer.drain()
+
+                self.resumed_handshakes += 1
+                logger.info(f"Sessão retomada por ticket: {client_id.hex()}")
+                return client_id, key_c2s, key_s2c, resume_response.server_nonce, codec, wire_format, rekey
+
+            # Ticket inválido ou expirado: o cliente refaz o handshake completo na mesma conexão
+            logger.info(f"Ticket recusado para {client_id.hex()}, handshake completo")
+            self._write_handshake_message(writer, ResumeResponse(accepted=False).to_bytes())
+            await writer.drain()
+            hello, offered = await self._read_hello(reader)
+            offered_extensions = decode_extensions(offered)
+            extensions, codec, wire_format, rekey = self._negotiate_extensions(offered_extensions)
+
+        initial_message = hello + await reader.readexactly(49 - HELLO_PREFIX_SIZE)
+        client_id, client_public_key = self.handshake.process_client_initial_message(
+            initial_message
+        )
+
+        logger.info(f"Cliente conectado: {client_id.hex()}")
+
+        # Assinatura RSA e ECDH + HKDF fora do event loop
+        handshake_response, key_c2s, key_s2c, resumption_secret = await self.handshake_engine.respond(
+            client_id, client_public_key, extensions
+        )
+        # Hello original: resposta no layout original, sem ticket
+        handshake_response.extended = bool(offered)
+        if EXT_SESSION_TICKET in offered_extensions:
+            self.handshake.attach_ticket(handshake_response, client_id, resumption_secret)
+
+        self._write_handshake_message(writer, handshake_response.to_bytes())
+        await writer.drain()
+
+        self.full_handshakes += 1
+        return client_id, key_c2s, key_s2c, handshake_response.salt, codec, wire_format, rekey
+
+    async def _read_hello(self, reader: asyncio.StreamReader) -> Tuple[bytes, bytes]:
+        # Extensões oferecidas como vieram no fio: a retomada as prende às chaves
+        hello = await reader.readexactly(HELLO_PREFIX_SIZE)
+        if hello[16] != HELLO_EXTENDED:
+            return hello, b''
+
+        size = int.from_bytes(await reader.readexactly(2), 'big')
+        if size > MAX_EXTENSIONS_SIZE:
+            raise ValueError("Extensões do hello muito longas")
+        offered = await reader.readexactly(size)
+        # Depois das extensões vem o byte de tipo do hello normal
+        return hello[:16] + await reader.readexactly(1), offered
+
+    def _negotiate_extensions(self, offered: Dict[int, bytes]) -> Tuple[bytes, Optional[DeflateCodec], int, bool]:
+        accepted = {}
+        codec = None
+        wire_format = WIRE_V1
+
+        # Compressão: ids de dicionário em ordem de preferência do cliente
+        dictionary_ids = offered.get(EXT_COMPRESSION, b'')
+        for offset in range(0, len(dictionary_ids) - 3, 4):
+            codec = self.compression_codecs.get(dictionary_ids[offset:offset+4])
+            if codec is not None:
+                accepted[EXT_COMPRESSION] = codec.dictionary_id
+                break
+
+        # Formato de frame: um byte por versão, em ordem de preferência do cliente
+        for version in offered.get(EXT_WIRE_FORMAT, b''):
+            if version in self.wire_formats:
+                wire_format = version
+                accepted[EXT_WIRE_FORMAT] = bytes((version,))
+                break
+
+        # Troca de chaves em banda: o servidor sempre entende, basta o cliente oferecer
+        rekey = EXT_REKEY in offered
+        if rekey:
+            accepted[EXT_REKEY] = b''
+
+        # Tickets: só para quem pede, e se a retomada estiver ligada
+        if EXT_SESSION_TICKET in offered and self.handshake.ticket_keys is not None:
+            accepted[EXT_SESSION_TICKET] = b''
+
+        return encode_extensions(accepted), codec, wire_format, rekey
+
+    def _write_handshake_message(self, writer: asyncio.StreamWriter, data: bytes):
+        writer.writelines([len(data).to_bytes(4, 'big'), data])
+
+    def _receive_cipher(self, session: ClientSession, seq_no: int) -> AESGCMCipher:
+        # Chave do sentido cliente -> servidor para o seq: a anterior ainda vale
+        # para frames enviados antes da última troca
+        if session.rekey is None:
+            return session.cipher_c2s
+        return session.rekey.receive_cipher(session.cipher_c2s, seq_no, session.replay)
+
+    async def _process_frame(
+        self,
+        session: ClientSession,
+        frame: MessageFrame,
+        opening: Optional[asyncio.Future] = None
+    ):
+        metrics = self.metrics
+        timed = False
+        if metrics is not None:
+            metrics.frames_in += 1
+            metrics.bytes_in += FRAME_HEADER.size + len(frame.ciphertext_with_tag)
+            timed = metrics.sample_receive()
+
+        # Pedaços de stream e frames de controle compartilham a sequência das mensagens
+        seq_no = frame.seq_no & SEQ_MASK
+        if not session.replay.check(seq_no):
+            self._reject_replay(session)
+            return
+
+        if frame.seq_no & STREAM_CHUNK_FLAG:
+            await self._process_chunk(session, frame, seq_no, opening)
+            return
+        if frame.seq_no & CONTROL_FLAG:
+            await self._process_control(session, frame, seq_no, opening)
+            return
+
+        if timed:
+            started = time.perf_counter()
+        if opening is not None:
+            plaintext = await opening
+        else:
+            plaintext = MessageCrypto.decrypt_message(self._receive_cipher(session, seq_no), frame)
+        if timed:
+            metrics.stages["decrypt"].observe(time.perf_counter() - started)
+
+        if plaintext is None:
+            self.events.event(
+                "auth_failure", logging.WARNING,
+                "Falha na autenticação de mensagem de %s", session.client_id
+            )
+            if metrics is not None:
+                metrics.auth_failures += 1
+            return
+
+        # Só frames autênticos marcam a janela
+        if not session.replay.accept(seq_no):
+            self._reject_replay(session)
+            return
+
+        # Só é recomprimido para o destinatário o que o remetente comprimiu:
+        # quem manda cru (compress_outbound = False ou sem compressão negociada)
+        # não tem o conteúdo exposto a deflate em nenhum trecho
+        compress = False
+        if session.codec is not None:
+            compress = len(plaintext) > 0 and plaintext[0] == MARKER_DEFLATE
+            plaintext = session.codec.unpack(plaintext)
+            if plaintext is None:
+                self.events.event(
+                    "invalid_payload", logging.WARNING,
+                    "Mensagem comprimida inválida de %s", session.client_id
+                )
+                return
+
+        if self.log_plaintext:
+            self.events.event(
+                "message_received", logging.INFO, "Mensagem de %s para %s: %s",
+                frame.sender_id, frame.recipient_id, plaintext[:50].decode('utf-8', errors='replace')
+            )
+        else:
+            self.events.event(
+                "message_received", logging.INFO, "Mensagem de %s para %s (%d bytes)",
+                frame.sender_id, frame.recipient_id, len(plaintext)
+            )
+
+        if timed:
+            started = time.perf_counter()
+            await self._route_message(frame, plaintext, session, compress=compress)
+            metrics.stages["route"].observe(time.perf_counter() - started)
+        else:
+            await self._route_message(frame, plaintext, session, compress=compress)
+
+    def _reject_replay(self, session: ClientSession):
+        self.events.event("replay", logging.WARNING, "Ataque de replay detectado de %s", session.client_id)
+        if self.metrics is not None:
+            self.metrics.replays_rejected += 1
+
+    async def _process_control(
+        self,
+        session: ClientSession,
+        frame: MessageFrame,
+        seq_no: int,
+        opening: Optional[asyncio.Future] = None
+    ):
+        if opening is not None:
+            payload = await opening
+        else:
+            payload = MessageCrypto.decrypt_message(self._receive_cipher(session, seq_no), frame)
+        if payload is None:
+            self.events.event(
+                "auth_failure", logging.WARNING,
+                "Falha na autenticação de frame de controle de %s", session.client_id
+            )
+            if self.metrics is not None:
+                self.metrics.auth_failures += 1
+            return
+
+        if not session.replay.accept(seq_no):
+            self._reject_replay(session)
+            return
+
+        control_type = payload[:1]
+        if control_type == bytes((CONTROL_PING,)):
+            await self._send_to_session(session, NO_ID, bytes((CONTROL_PONG,)) + payload[1:], control=True)
+        elif control_type == bytes((CONTROL_REKEY,)) and session.rekey is not None:
+            cipher = session.rekey.ratchet_receive(session.cipher_c2s, payload, seq_no)
+            if cipher is None:
+                self.events.event(
+                    "invalid_payload", logging.WARNING,
+                    "Troca de chave fora de ordem de %s", session.client_id
+                )
+                return
+            session.cipher_c2s = cipher
+            self.rekeys_received += 1
+        elif control_type != bytes((CONTROL_PONG,)):
+            # PONG não tem o que fazer: o frame em si já contou como atividade
+            self.events.event(
+                "invalid_payload", logging.WARNING,
+                "Frame de controle desconhecido de %s", session.client_id
+            )
+
+    def _reap_handshake(self, writer: asyncio.StreamWriter, peer_addr):
+        self.reaped_handshakes += 1
+        self.events.event(
+            "connection_reaped", logging.WARNING,
+            "Handshake de %s não concluído em %.1f s, encerrando", peer_addr, self.handshake_timeout
         )
+        writer.transport.abort()
+
+    def _arm_session_timer(self, session: ClientSession, now: float):
+        # Próximo prazo: o PING (se ainda não mandado neste período ocioso) ou o corte
+        last = session.last_activity
+        deadline = None
+        if self.idle_timeout > 0:
+            deadline = last + self.idle_timeout
+        if self.heartbeat_interval > 0 and session.pinged_at != last:
+            ping_at = last + self.heartbeat_interval
+            deadline = ping_at if deadline is None else min(deadline, ping_at)
+        if deadline is not None:
+            session.timer = self.timers.schedule(deadline - now, self._check_session, session)
+
+    def _check_session(self, session: ClientSession):
+        # Chamado pela roda: nada por frame além de last_activity
+        session.timer = None
+        if session.outbound.closed:
+            return
+        now = time.monotonic()
+        last = session.last_activity
+        idle = now - last
+
+        if 0 < self.idle_timeout <= idle:
+            self.reaped_idle += 1
+            self.events.event(
+                "connection_reaped", logging.WARNING,
+                "Sessão %s ociosa há %.1f s, encerrando", session.client_id, idle
+            )
+            session.outbound.abort()
+            return
+
+        if 0 < self.heartbeat_interval <= idle and session.pinged_at != last:
+            session.pinged_at = last
+            self.heartbeats_sent += 1
+            ping = bytes((CONTROL_PING,)) + int(now * 1e6).to_bytes(8, 'big')
+            asyncio.ensure_future(self._send_to_session(session, NO_ID, ping, control=True))
+
+        self._arm_session_timer(session, now)
+
+    async def _assign_handle(self, session: ClientSession, recipient_id: bytes):
+        # Formato v2: handle curto para um destinatário novo deste cliente; até
+        # o controle chegar, o cliente continua mandando o id completo
+        handles = session.recipient_handles
+        if len(handles) >= MAX_HANDLES:
+            return
+        handle = len(handles) + 1
+        handles[recipient_id] = handle
+        session.recipient_ids[handle] = recipient_id
+        await self._send_to_session(
+            session, NO_ID, bytes((CONTROL_HANDLE,)) + encode_varint(handle) + recipient_id, control=True
+        )
+
+    async def _process_chunk(
+        self,
+        session: ClientSession,
+        frame: MessageFrame,
+        seq_no: int,
+        opening: Optional[asyncio.Future] = None
+    ):
+        if opening is not None:
+            opened = await opening
+        else:
+            opened = MessageCrypto.decrypt_chunk(self._receive_cipher(session, seq_no), frame)
+        if opened is None:
+            self.events.event(
+                "auth_failure", logging.WARNING,
+                "Falha na autenticação de pedaço de stream de %s", session.client_id
+            )
+            if self.metrics is not None:
+                self.metrics.auth_failures += 1
+            return
+
+        if not session.replay.accept(seq_no):
+            self._reject_replay(session)
+            return
+
+        chunk_header, plaintext = opened
+        stream_id, index, flags = CHUNK_HEADER.unpack(chunk_header)
+        recipient_id = frame.recipient_id
+        streams = session.streams
+
+        now = time.monotonic()
+
+        # Índice 0 abre o stream; os seguintes vêm em ordem e para o mesmo destinatário
+        if index == 0 and stream_id not in streams:
+            if len(streams) >= self.max_open_streams:
+                # Streams abandonados (ex.: send_stream que falhou no meio) não
+                # mandam o pedaço final: os ociosos liberam a vaga
+                for idle_id in [s for s, entry in streams.items() if now - entry[2] > self.stream_idle_timeout]:
+                    del streams[idle_id]
+            if len(streams) >= self.max_open_streams:
+                self.events.event(
+                    "stream_error", logging.WARNING, "Limite de streams abertos atingido por %s", session.client_id
+                )
+                return
+            streams[stream_id] = (recipient_id, 0, now)
+
+        entry = streams.get(stream_id)
+        if entry is None or entry[0] != recipient_id or entry[1] != index:
+            streams.pop(stream_id, None)
+            self.events.event(
+                "stream_error", logging.WARNING, "Pedaço de stream fora de ordem de %s", session.client_id
+            )
+            return
+
+        if flags & CHUNK_FINAL:
+            del streams[stream_id]
+        else:
+            streams[stream_id] = (recipient_id, index + 1, now)
+
+        # Sem remontar: cada pedaço segue para o destinatário assim que chega
+        await self._route_message(frame, plaintext, session, chunk_header)
 
     async def _route_message(
         self,
         frame: MessageFrame,
         plaintext: bytes,
-        sender_session: ClientSession
+        sender_session: ClientSession,
+        chunk_header: bytes = b'',
+        compress: bool = False
     ):
         recipient_id = frame.recipient_id
+        if sender_session.wire_format == WIRE_V2 and recipient_id not in sender_session.recipient_handles:
+            await self._assign_handle(sender_session, recipient_id)
 
-        if recipient_id not in self.sessions:
-            logger.warning(f"Destinatário {recipient_id.hex()} não encontrado")
+        if await self.deliver_local(frame.sender_id, recipient_id, plaintext, chunk_header, compress):
             return
 
-        recipient_session = self.sessions[recipient_id]
+        # Destinatário fora deste processo: tenta o roteador (outro worker/nó)
+        if self.router is not None and await self.router.forward(
+            frame.sender_id, recipient_id, plaintext, chunk_header, compress
+        ):
+            self.events.event("message_forwarded", logging.INFO, "Mensagem encaminhada para %s", recipient_id)
+            if self.metrics is not None:
+                self.metrics.forwarded += 1
+            return
 
-        new_frame = MessageCrypto.encrypt_message(
-            key=recipient_session.key_s2c,
-            sender_id=frame.sender_id,
-            recipient_id=frame.recipient_id,
-            seq_no=recipient_session.seq_send,
-            plaintext=plaintext
-        )
+        # Pedaços de stream não vão para o armazenamento offline
+        if self.offline_store is not None and not chunk_header:
+            await self.offline_store.append_async(recipient_id, frame.sender_id, plaintext, compress)
+            self.events.event(
+                "message_stored", logging.INFO, "Destinatário %s offline, mensagem armazenada", recipient_id
+            )
+            if self.metrics is not None:
+                self.metrics.offline_stored += 1
+            return
+
+        self.events.event("unknown_recipient", logging.WARNING, "Destinatário %s não encontrado", recipient_id)
+        if self.metrics is not None:
+            self.metrics.unknown_recipients += 1
+
+    async def _deliver_offline(self, session: ClientSession):
+        # Roda antes de a sessão entrar em self.sessions: mensagens novas continuam
+        # indo para o armazenamento, e a checagem final (has_messages também vê
+        # appends ainda na fila da thread) e o registro da sessão acontecem sem
+        # await entre eles, então nada se perde nem chega fora de ordem
+        store = self.offline_store
+        client_id = session.client_id
+        outbound = session.outbound
+        delivered = 0
+        while not outbound.closed and store.has_messages(client_id):
+            batch, last_seq = await store.take_async(client_id, self.offline_drain_batch)
+            # (posição na fila de saída, seq no armazenamento) de cada mensagem
+            marks = []
+            for seq, sender_id, plaintext, compress in batch:
+                await outbound.wait_not_full()
+                await self._send_to_session(session, sender_id, plaintext, compress=compress)
+                marks.append((outbound.enqueued, seq))
+
+            # ACK só depois de o lote sair pelo socket. Nada mais entra nesta fila
+            # durante a entrega, então os frames saem na ordem em que entraram e
+            # `sent` aponta o último escrito; o resto continua indexado e vai de
+            # novo no próximo connect
+            if not await outbound.flushed():
+                written = [seq for position, seq in marks if position <= outbound.sent]
+                if written:
+                    await store.ack_async(client_id, written[-1], len(written))
+                    delivered += len(written)
+                break
+            if last_seq:
+                await store.ack_async(client_id, last_seq, len(batch))
+            delivered += len(batch)
+
+        if delivered:
+            logger.info(f"{delivered} mensagens offline entregues a {session.client_id.hex()}")
+
+    async def deliver_local(
+        self,
+        sender_id: bytes,
+        recipient_id: bytes,
+        plaintext: bytes,
+        chunk_header: bytes = b'',
+        compress: bool = False
+    ) -> bool:
+        recipient_session = self.sessions.get(recipient_id)
+        if recipient_session is None:
+            return False
+
+        if chunk_header:
+            # Perder um pedaço quebra o stream: espera vaga em vez de descartar,
+            # o que segura a leitura do remetente. O limite é em bytes, não só em
+            # frames: pedaços de até max_frame_size numa fila de milhares de frames
+            # deixariam um destinatário lento segurar GiBs
+            await recipient_session.outbound.wait_not_full(self.max_stream_queue_bytes)
+        await self._send_to_session(recipient_session, sender_id, plaintext, chunk_header, compress=compress)
+        return True
+
+    async def _send_to_session(
+        self,
+        recipient_session: ClientSession,
+        sender_id: bytes,
+        plaintext: bytes,
+        chunk_header: bytes = b'',
+        control: bool = False,
+        compress: bool = False
+    ):
+        metrics = self.metrics
+        # None = este envio não é cronometrado
+        sampled = metrics if metrics is not None and metrics.sample_send() else None
+        started = time.perf_counter() if sampled is not None else 0.0
 
+        seal_args = (
+            recipient_session.cipher_s2c, recipient_session.codec, sender_id,
+            recipient_session.client_id, recipient_session.seq_send, plaintext, chunk_header, control, compress,
+            recipient_session.wire_format == WIRE_V2
+        )
         recipient_session.seq_send += 1
+        if recipient_session.rekey is not None and recipient_session.rekey.count(len(plaintext)):
+            self._send_rekey(recipient_session)
+
+        pool = self.crypto_pool
+        offload = pool is not None and pool.offload(len(plaintext))
+        previous = recipient_session.send_tail
+        if not offload and previous is None:
+            await self._enqueue_frame(recipient_session, seal_frame(*seal_args), sampled, started)
+            return
 
+        # Payload grande vai para o pool; um envio atrás de outro que ainda está
+        # lá espera por ele, para entrar na fila de saída na ordem do seq
+        done = asyncio.get_running_loop().create_future()
+        recipient_session.send_tail = done
         try:
-            message_bytes = (
-                new_frame.nonce +
-                new_frame.sender_id +
-                new_frame.recipient_id +
-                int.to_bytes(new_frame.seq_no, 8, 'big') +
-                int.to_bytes(len(new_frame.ciphertext_with_tag), 4, 'big') +
-                new_frame.ciphertext_with_tag
-            )
+            if offload:
+                new_frame = await pool.submit(seal_frame, *seal_args)
+            else:
+                new_frame = seal_frame(*seal_args)
+            if previous is not None:
+                await previous
+            await self._enqueue_frame(recipient_session, new_frame, sampled, started)
+        finally:
+            done.set_result(None)
+            if recipient_session.send_tail is done:
+                recipient_session.send_tail = None
 
-            recipient_session.writer.write(message_bytes)
-            await recipient_session.writer.drain()
+    def _send_rekey(self, session: ClientSession):
+        # Síncrono, logo depois de reservar o seq do frame que fechou a cota: o
+        # REKEY entra na fila antes de qualquer frame cifrado com a chave nova.
+        # Frames anteriores ainda cifrando ou esperando vaga saem depois dele, com
+        # seq menor, e o cliente os abre com a chave anterior
+        payload, cipher = session.rekey.ratchet_send(session.cipher_s2c)
+        frame = MessageCrypto.encrypt_control(
+            session.cipher_s2c, session.seq_send, payload, session.wire_format == WIRE_V2
+        )
+        session.seq_send += 1
+        session.cipher_s2c = cipher
+        outbound = session.outbound
+        if outbound.encode is not None:
+            outbound.put_control(frame, compact_frame_size(frame))
+        else:
+            outbound.put_control(frame.to_wire_parts())
+        self.rekeys_sent += 1
 
-            logger.info(f"Mensagem roteada para {recipient_id.hex()}")
+    async def _enqueue_frame(
+        self,
+        recipient_session: ClientSession,
+        new_frame: MessageFrame,
+        metrics: Optional[ServerMetrics],
+        started: float
+    ):
+        recipient_id = recipient_session.client_id
+        if metrics is not None:
+            encrypted = time.perf_counter()
+            metrics.stages["encrypt"].observe(encrypted - started)
+
+        outbound = recipient_session.outbound
+        try:
+            # Formato v2: o frame é codificado ao sair da fila (handles na ordem do fio)
+            if outbound.encode is not None:
+                queued = await outbound.put(new_frame, compact_frame_size(new_frame))
+            else:
+                queued = await outbound.put(new_frame.to_wire_parts())
+            if queued:
+                self.events.event("message_routed", logging.INFO, "Mensagem roteada para %s", recipient_id)
+            else:
+                self.events.event(
+                    "message_dropped", logging.WARNING,
+                    "Mensagem descartada para %s (fila de saída)", recipient_id
+                )
         except Exception as e:
             logger.error(f"Erro ao rotear mensagem: {e}")
 
-    async def start(self):
+        if metrics is not None:
+            # Inclui a espera por vaga quando a política é backpressure
+            metrics.stages["enqueue"].observe(time.perf_counter() - encrypted)
+
+    def outbound_stats(self) -> Dict[str, Dict[str, int]]:
+        per_session = {
+            client_id.hex(): session.outbound.stats()
+            for client_id, session in self.sessions.items()
+        }
+        return {
+            "sessions": per_session,
+            "total_depth": sum(s["depth"] for s in per_session.values()),
+            "total_dropped": self.dropped_frames + sum(s["dropped"] for s in per_session.values()),
+        }
+
+    def dump_recent_events(self, path: Optional[str] = None):
+        # Eventos recentes do anel, inclusive os omitidos pela amostragem (SIGUSR1)
+        lines = self.events.recent()
+        if path:
+            with open(path, 'w') as f:
+                f.write("\n".join(lines) + "\n")
+            logger.info(f"{len(lines)} eventos recentes gravados em {path}")
+            return
+        logger.info(f"{len(lines)} eventos recentes:\n" + "\n".join(lines))
+
+    async def listen(self, reuse_port: bool = False) -> asyncio.AbstractServer:
+        # reuse_port: vários processos escutando a mesma porta (SO_REUSEPORT)
         server = await asyncio.start_server(
-            self.handle_client, self.host, self.port
+            self.handle_client, self.host, self.port, reuse_port=reuse_port or None
         )
 
+        if self.metrics is not None:
+            if self.metrics_port is not None and self._metrics_server is None:
+                self._metrics_server = await start_metrics_server(
+                    self.metrics, self.metrics_host, self.metrics_port
+                )
+            if self.metrics_dump_path and self._metrics_dump_task is None:
+                self._metrics_dump_task = asyncio.create_task(
+                    dump_metrics(self.metrics, self.metrics_dump_path, self.metrics_dump_interval)
+                )
+
         logger.info(f"Servidor aguardando conexões em {self.host}:{self.port}")
+        return server
+
+    async def shutdown(self):
+        if self._metrics_dump_task is not None:
+            self._metrics_dump_task.cancel()
+            self._metrics_dump_task = None
+        if self._metrics_server is not None:
+            self._metrics_server.close()
+            await self._metrics_server.wait_closed()
+            self._metrics_server = None
+        if self.key_pool is not None:
+            await self.key_pool.close()
+        await self.timers.close()
+        self.handshake_engine.shutdown()
+        if self.crypto_pool is not None:
+            self.crypto_pool.shutdown()
+        if self.offline_store is not None:
+            await self.offline_store.close()
+
+    async def start(self):
+        server = await self.listen()
+        if hasattr(signal, "SIGUSR1"):
+            asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1, self.dump_recent_events)
 
-        async with server:
-            await server.serve_forever()
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.shutdown()
 
 
 def main():
@@ -242,10 +1158,13 @@ def main():
         key_path="../certs/server.key"
     )
 
+    start_async_logging()
     try:
         asyncio.run(server.start())
     except KeyboardInterrupt:
         logger.info("Servidor interrompido")
+    finally:
+        stop_async_logging()
 
 
 if __name__ == "__main__":
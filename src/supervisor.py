@@ -0,0 +1,347 @@
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import shutil
+import signal
+import tempfile
+import time
+from typing import Dict, Optional
+
+from forwarding import (
+    ForwardLink, RecipientDispatcher, message_record, parse_message_record, read_records
+)
+from server import SecureMessagingServer, load_or_generate_keys
+
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("Supervisor")
+
+
+class SessionDirectory:
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(path, mode=0o700, exist_ok=True)
+
+    def _entry(self, client_id: bytes) -> str:
+        return os.path.join(self.path, client_id.hex())
+
+    def register(self, client_id: bytes, worker_id: int):
+        # Symlink client_id -> worker: criação + rename atômicos, leitura sem abrir arquivo
+        entry = self._entry(client_id)
+        tmp = f"{entry}.{worker_id}.tmp"
+        try:
+            os.unlink(tmp)
+        except FileNotFoundError:
+            pass
+        os.symlink(str(worker_id), tmp)
+        os.replace(tmp, entry)
+
+    def unregister(self, client_id: bytes, worker_id: int):
+        if self.lookup(client_id) == worker_id:
+            try:
+                os.unlink(self._entry(client_id))
+            except FileNotFoundError:
+                pass
+
+    def lookup(self, client_id: bytes) -> Optional[int]:
+        try:
+            return int(os.readlink(self._entry(client_id)))
+        except (OSError, ValueError):
+            return None
+
+    def purge_worker(self, worker_id: int) -> int:
+        removed = 0
+        for entry in os.scandir(self.path):
+            try:
+                if int(os.readlink(entry.path)) == worker_id:
+                    os.unlink(entry.path)
+                    removed += 1
+            except (OSError, ValueError):
+                continue
+        return removed
+
+
+def worker_socket_path(run_dir: str, worker_id: int) -> str:
+    return os.path.join(run_dir, f"worker-{worker_id}.sock")
+
+
+class WorkerRouter:
+
+    def __init__(
+        self,
+        server: SecureMessagingServer,
+        worker_id: int,
+        run_dir: str,
+        directory: SessionDirectory
+    ):
+        self.server = server
+        self.worker_id = worker_id
+        self.run_dir = run_dir
+        self.directory = directory
+        self.links: Dict[int, ForwardLink] = {}
+        self._listener = None
+        # Um destinatário lento (pedaços de stream esperando vaga) não segura o enlace
+        self.dispatcher = RecipientDispatcher(self._deliver_local)
+
+        self.forwarded = 0
+        self.received = 0
+        self.undeliverable = 0
+
+    async def start(self):
+        path = worker_socket_path(self.run_dir, self.worker_id)
+        if os.path.exists(path):
+            os.unlink(path)
+        self._listener = await asyncio.start_unix_server(self._handle_peer, path=path)
+
+    def session_opened(self, client_id: bytes):
+        self.directory.register(client_id, self.worker_id)
+
+    def session_closed(self, client_id: bytes):
+        self.directory.unregister(client_id, self.worker_id)
+
+    def _link(self, worker_id: int) -> ForwardLink:
+        link = self.links.get(worker_id)
+        if link is None:
+            path = worker_socket_path(self.run_dir, worker_id)
+            link = ForwardLink(lambda: asyncio.open_unix_connection(path))
+            self.links[worker_id] = link
+        return link
+
+    async def forward(
+        self, sender_id: bytes, recipient_id: bytes, plaintext: bytes, chunk_header: bytes = b'', compress: bool = False
+    ) -> bool:
+        worker_id = self.directory.lookup(recipient_id)
+        if worker_id is None or worker_id == self.worker_id:
+            return False
+
+        # Socket Unix local: o texto claro não sai do host (diretório 0700)
+        record_type, payload = message_record(plaintext, chunk_header, compress)
+        if await self._link(worker_id).send(record_type, sender_id, recipient_id, payload):
+            self.forwarded += 1
+            return True
+        return False
+
+    async def _handle_peer(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            await read_records(reader, self._deliver)
+        finally:
+            writer.close()
+
+    async def _deliver(self, record_type: int, sender_id: bytes, recipient_id: bytes, payload: bytes):
+        message = parse_message_record(record_type, payload)
+        if message is None:
+            return
+        self.received += 1
+        await self.dispatcher.dispatch(sender_id, recipient_id, *message)
+
+    async def _deliver_local(
+        self, sender_id: bytes, recipient_id: bytes, plaintext: bytes, chunk_header: bytes, compress: bool
+    ) -> bool:
+        if await self.server.deliver_local(sender_id, recipient_id, plaintext, chunk_header, compress):
+            return True
+        self.undeliverable += 1
+        logger.warning(f"Destinatário {recipient_id.hex()} não está mais neste worker")
+        return False
+
+    async def close(self):
+        if self._listener is not None:
+            self._listener.close()
+        for link in self.links.values():
+            await link.close()
+        await self.dispatcher.close()
+
+
+def run_worker(
+    worker_id: int,
+    host: str,
+    port: int,
+    cert_path: str,
+    key_path: str,
+    run_dir: str,
+    ticket_master_secret: bytes,
+    heartbeat,
+    heartbeat_interval: float,
+    server_options: dict
+):
+    async def serve():
+        # Uma porta/arquivo de métricas por worker: cada processo tem seus próprios contadores
+        options = dict(server_options)
+        if options.get("metrics_port") is not None:
+            options["metrics_port"] += worker_id
+        if options.get("metrics_dump_path"):
+            options["metrics_dump_path"] = f"{options['metrics_dump_path']}.{worker_id}"
+
+        server = SecureMessagingServer(
+            host=host,
+            port=port,
+            cert_path=cert_path,
+            key_path=key_path,
+            ticket_master_secret=ticket_master_secret,
+            **options
+        )
+        router = WorkerRouter(
+            server, worker_id, run_dir, SessionDirectory(os.path.join(run_dir, "sessions"))
+        )
+        await router.start()
+        server.router = router
+
+        listener = await server.listen(reuse_port=True)
+        logger.info(f"Worker {worker_id} (pid {os.getpid()}) pronto")
+
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        loop.add_signal_handler(signal.SIGTERM, stop.set)
+        loop.add_signal_handler(signal.SIGINT, stop.set)
+
+        while not stop.is_set():
+            heartbeat.value = time.time()
+            try:
+                await asyncio.wait_for(stop.wait(), heartbeat_interval)
+            except asyncio.TimeoutError:
+                pass
+
+        listener.close()
+        await router.close()
+        await server.shutdown()
+
+    asyncio.run(serve())
+
+
+class Supervisor:
+
+    def __init__(
+        self,
+        workers: int = 0,
+        host: str = "0.0.0.0",
+        port: int = 9999,
+        cert_path: str = "../certs/server.crt",
+        key_path: str = "../certs/server.key",
+        run_dir: Optional[str] = None,
+        heartbeat_interval: float = 1.0,
+        health_timeout: float = 10.0,
+        restart_backoff: float = 1.0,
+        server_options: Optional[dict] = None
+    ):
+        self.workers = workers or os.cpu_count() or 1
+        self.host = host
+        self.port = port
+        self.cert_path = cert_path
+        self.key_path = key_path
+        self.heartbeat_interval = heartbeat_interval
+        self.health_timeout = health_timeout
+        self.restart_backoff = restart_backoff
+        self.server_options = server_options or {}
+
+        self._owns_run_dir = run_dir is None
+        self.run_dir = run_dir or tempfile.mkdtemp(prefix="mensageria-")
+        os.chmod(self.run_dir, 0o700)
+        self.directory = SessionDirectory(os.path.join(self.run_dir, "sessions"))
+
+        # Tickets de retomada valem em qualquer worker
+        self.ticket_master_secret = os.urandom(32)
+
+        self._ctx = multiprocessing.get_context("fork")
+        self._processes: Dict[int, multiprocessing.Process] = {}
+        self._heartbeats: Dict[int, object] = {}
+        self._next_restart: Dict[int, float] = {}
+        self._stopping = False
+
+        self.restarts = 0
+
+    def _spawn(self, worker_id: int):
+        heartbeat = self._ctx.Value('d', time.time(), lock=False)
+        process = self._ctx.Process(
+            target=run_worker,
+            args=(
+                worker_id, self.host, self.port, self.cert_path, self.key_path,
+                self.run_dir, self.ticket_master_secret, heartbeat,
+                self.heartbeat_interval, self.server_options
+            ),
+            name=f"mensageria-worker-{worker_id}"
+        )
+        process.start()
+        self._processes[worker_id] = process
+        self._heartbeats[worker_id] = heartbeat
+
+    def _check_workers(self):
+        now = time.time()
+        for worker_id, process in list(self._processes.items()):
+            stale = now - self._heartbeats[worker_id].value > self.health_timeout
+            if process.is_alive() and not stale:
+                continue
+
+            if now < self._next_restart.get(worker_id, 0):
+                continue
+
+            if process.is_alive():
+                logger.warning(f"Worker {worker_id} sem heartbeat, reiniciando")
+                process.kill()
+            else:
+                logger.warning(f"Worker {worker_id} terminou (código {process.exitcode}), reiniciando")
+            process.join()
+
+            # Sessões do worker morto deixam de existir
+            removed = self.directory.purge_worker(worker_id)
+            if removed:
+                logger.info(f"{removed} sessões do worker {worker_id} removidas do diretório")
+
+            self._spawn(worker_id)
+            self._next_restart[worker_id] = now + self.restart_backoff
+            self.restarts += 1
+
+    def stop(self, *_):
+        self._stopping = True
+
+    def run(self):
+        # Gera/carrega o par RSA uma vez, antes de criar os workers
+        load_or_generate_keys(self.cert_path, self.key_path)
+
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        for worker_id in range(self.workers):
+            self._spawn(worker_id)
+        logger.info(f"{self.workers} workers escutando em {self.host}:{self.port}")
+
+        try:
+            while True:
+                time.sleep(self.heartbeat_interval)
+                if self._stopping:
+                    break
+                self._check_workers()
+        finally:
+            for process in self._processes.values():
+                process.terminate()
+            for process in self._processes.values():
+                process.join()
+            if self._owns_run_dir:
+                shutil.rmtree(self.run_dir, ignore_errors=True)
+            logger.info("Supervisor encerrado")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor de mensageria com múltiplos workers")
+    parser.add_argument("--workers", type=int, default=0, help="número de workers (0 = núcleos disponíveis)")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=9999)
+    parser.add_argument("--cert", default="../certs/server.crt")
+    parser.add_argument("--key", default="../certs/server.key")
+    args = parser.parse_args()
+
+    Supervisor(
+        workers=args.workers,
+        host=args.host,
+        port=args.port,
+        cert_path=args.cert,
+        key_path=args.key
+    ).run()
+
+
+if __name__ == "__main__":
+    main()
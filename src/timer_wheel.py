@@ -0,0 +1,172 @@
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional, Set
+
+
+logger = logging.getLogger("TimerWheel")
+
+
+class Timer:
+    __slots__ = ('expires', 'callback', 'args', 'bucket')
+
+    def __init__(self, expires: int, callback: Callable, args: tuple):
+        # expires em ticks da roda; bucket = conjunto onde o timer está agora
+        self.expires = expires
+        self.callback = callback
+        self.args = args
+        self.bucket: Optional[Set['Timer']] = None
+
+    def cancel(self):
+        if self.bucket is not None:
+            self.bucket.discard(self)
+            self.bucket = None
+
+    @property
+    def active(self) -> bool:
+        return self.bucket is not None
+
+
+class TimerWheel:
+    # Roda hierárquica (Varghese & Lauck): `levels` rodas de `slots` posições,
+    # o nível n com resolução tick * slots**n. Agendar e cancelar são O(1); um
+    # timer desce de nível no máximo levels - 1 vezes até disparar. Uma única
+    # tarefa avança a roda a cada tick, no lugar de um TimerHandle do asyncio
+    # por conexão (cada um um item no heap do event loop)
+
+    def __init__(self, tick: float = 0.25, slots: int = 256, levels: int = 3, histogram=None):
+        if tick <= 0 or slots < 2 or levels < 1:
+            raise ValueError("Roda de timers inválida")
+        self.tick = tick
+        self.slots = slots
+        self.levels = levels
+        self._span = slots ** levels
+        self._wheels: List[List[Set[Timer]]] = [[set() for _ in range(slots)] for _ in range(levels)]
+        self._now = 0
+        self._origin: Optional[float] = None
+        self._task = None
+        # Histogram opcional (ServerMetrics): custo de cada avanço da roda
+        self.histogram = histogram
+
+        self.scheduled = 0
+        self.fired = 0
+        self.cascaded = 0
+        self.ticks = 0
+        self.last_tick_cost = 0.0
+        self.max_tick_cost = 0.0
+
+    def _clock(self) -> float:
+        return time.monotonic()
+
+    def _ticks_at(self, when: float) -> int:
+        if self._origin is None:
+            self._origin = when
+        return int((when - self._origin) / self.tick)
+
+    def schedule(self, delay: float, callback: Callable, *args: Any) -> Timer:
+        # Dispara callback(*args) depois de `delay` s (arredondado para cima ao tick)
+        now = self._ticks_at(self._clock())
+        if now > self._now:
+            # Roda atrasada em relação ao relógio: o atraso conta a partir do último avanço
+            now = self._now
+        timer = Timer(now + max(1, -int(-delay // self.tick)), callback, args)
+        self._place(timer)
+        self.scheduled += 1
+        return timer
+
+    def _place(self, timer: Timer):
+        delta = timer.expires - self._now
+        if delta <= 0:
+            # Desceu de nível no tick em que vence: entra no slot que este avanço dispara
+            bucket = self._wheels[0][self._now % self.slots]
+        else:
+            # Além do alcance: fica no último nível e é recolocado ao descer
+            target = self._now + min(delta, self._span - 1)
+            level = 0
+            width = self.slots
+            while delta >= width and level < self.levels - 1:
+                level += 1
+                width *= self.slots
+            bucket = self._wheels[level][(target // (width // self.slots)) % self.slots]
+        bucket.add(timer)
+        timer.bucket = bucket
+
+    def advance(self, now: Optional[float] = None) -> int:
+        # Avança até `now` (padrão: relógio) e dispara o que venceu; devolve quantos
+        target = self._ticks_at(self._clock() if now is None else now)
+        fired = 0
+        while self._now < target:
+            self._now += 1
+            tick = self._now
+            slots = self.slots
+
+            # Na volta de um nível, o slot correspondente do nível de cima desce
+            level = 1
+            width = slots
+            while level < self.levels and tick % width == 0:
+                level += 1
+                width *= slots
+            for upper in range(level - 1, 0, -1):
+                index = (tick // slots ** upper) % slots
+                bucket = self._wheels[upper][index]
+                if bucket:
+                    self._wheels[upper][index] = set()
+                    for timer in bucket:
+                        self._place(timer)
+                    self.cascaded += len(bucket)
+
+            index = tick % slots
+            bucket = self._wheels[0][index]
+            if not bucket:
+                continue
+            self._wheels[0][index] = set()
+            for timer in bucket:
+                timer.bucket = None
+                try:
+                    timer.callback(*timer.args)
+                except Exception as e:
+                    logger.error(f"Erro em timer: {e}")
+            fired += len(bucket)
+
+        self.fired += fired
+        return fired
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.tick)
+            started = time.perf_counter()
+            self.advance()
+            cost = time.perf_counter() - started
+            self.ticks += 1
+            self.last_tick_cost = cost
+            if cost > self.max_tick_cost:
+                self.max_tick_cost = cost
+            if self.histogram is not None:
+                self.histogram.observe(cost)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def __len__(self) -> int:
+        return sum(len(bucket) for wheel in self._wheels for bucket in wheel)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "timers": len(self),
+            "scheduled": self.scheduled,
+            "fired": self.fired,
+            "cascaded": self.cascaded,
+            "ticks": self.ticks,
+            "last_tick_cost": self.last_tick_cost,
+            "max_tick_cost": self.max_tick_cost,
+        }
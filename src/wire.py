@@ -0,0 +1,215 @@
+from typing import Dict, List, Optional, Tuple
+
+from protocol import (
+    MessageFrame, STREAM_CHUNK_FLAG, CONTROL_FLAG, SEQ_MASK, NO_ID, counter_nonce
+)
+from framing import FrameDecoder, MAX_FRAME_SIZE
+
+
+# Versões do formato dos frames depois do handshake, negociadas pela extensão
+# EXT_WIRE_FORMAT do hello. v1 = MessageFrame/FRAME_HEADER (56 bytes fixos)
+WIRE_V1 = 1
+WIRE_V2 = 2
+WIRE_FORMATS = (WIRE_V2, WIRE_V1)
+
+# v2: flags (1) + varint(seq) + [varint(handle) + id (16, com COMPACT_PEER_ID)]
+# + varint(tamanho) + corpo. Sem nonce (derivado do seq) e sem o id que o
+# servidor já conhece pela sessão; o outro vai como handle curto da sessão
+COMPACT_CHUNK = 0x01
+COMPACT_CONTROL = 0x02
+COMPACT_PEER_ID = 0x04
+COMPACT_FLAGS = COMPACT_CHUNK | COMPACT_CONTROL | COMPACT_PEER_ID
+PEER_ID_SIZE = 16
+# Handles por sessão e direção; acima disso o id completo segue em cada frame
+MAX_HANDLES = 1024
+
+
+def encode_varint(value: int) -> bytes:
+    if value < 0x80:
+        return bytes((value,))
+    out = bytearray()
+    put_varint(out, value)
+    return bytes(out)
+
+
+def put_varint(out: bytearray, value: int):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def decode_varint(data, offset: int) -> Tuple[int, int]:
+    # IndexError se o varint ainda não chegou inteiro
+    byte = data[offset]
+    if byte < 0x80:
+        return byte, offset + 1
+    value = byte & 0x7F
+    shift = 7
+    while True:
+        offset += 1
+        byte = data[offset]
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset + 1
+        shift += 7
+        if shift > 63:
+            raise ValueError("Varint longo demais")
+
+
+def compact_header(flags: int, seq_no: int, handle: int, peer_id: Optional[bytes], size: int) -> bytearray:
+    # Um bytearray por cabeçalho; writelines aceita bytearray sem cópia extra
+    if peer_id is not None:
+        flags |= COMPACT_PEER_ID
+    header = bytearray((flags,))
+    put_varint(header, seq_no)
+    if not flags & COMPACT_CONTROL:
+        put_varint(header, handle)
+        if peer_id is not None:
+            header += peer_id
+    put_varint(header, size)
+    return header
+
+
+class CompactFrameEncoder:
+    # Um por sessão e direção. server_side: frames servidor -> cliente, o par
+    # é o remetente e o handle é atribuído aqui, no primeiro frame dele (id
+    # completo + handle). No cliente o par é o destinatário e os handles vêm
+    # do servidor (CONTROL_HANDLE); sem handle, o id completo vai no frame.
+    # O frame que liga um handle precisa chegar antes dos que o usam: codificar
+    # na ordem em que os frames vão para o socket (ver OutboundQueue.encode)
+    __slots__ = ('server_side', 'handles', 'max_handles')
+
+    def __init__(self, server_side: bool, handles: Optional[Dict[bytes, int]] = None, max_handles: int = MAX_HANDLES):
+        self.server_side = server_side
+        self.handles: Dict[bytes, int] = {} if handles is None else handles
+        self.max_handles = max_handles
+
+    def encode(self, frame: MessageFrame) -> List[bytes]:
+        seq_no = frame.seq_no
+        body = frame.ciphertext_with_tag
+        flags = 0
+        if seq_no & STREAM_CHUNK_FLAG:
+            flags |= COMPACT_CHUNK
+        if seq_no & CONTROL_FLAG:
+            flags |= COMPACT_CONTROL
+            return [compact_header(flags, seq_no & SEQ_MASK, 0, None, len(body)), body]
+
+        peer_id = frame.sender_id if self.server_side else frame.recipient_id
+        handle = self.handles.get(peer_id)
+        if handle is not None:
+            return [compact_header(flags, seq_no & SEQ_MASK, handle, None, len(body)), body]
+
+        handle = 0
+        if self.server_side and len(self.handles) < self.max_handles:
+            handle = len(self.handles) + 1
+            self.handles[peer_id] = handle
+        return [compact_header(flags, seq_no & SEQ_MASK, handle, peer_id, len(body)), body]
+
+
+class CompactFrameDecoder(FrameDecoder):
+    # Lê frames v2 e entrega MessageFrame como na v1: nonce derivado do seq e
+    # os dois ids resolvidos (o fixo da sessão e o do handle). server_side:
+    # frames cliente -> servidor, remetente fixo; a tabela handle -> destinatário
+    # é preenchida pelo servidor. No cliente o destinatário é fixo e os handles
+    # de remetente chegam ligados nos próprios frames
+    __slots__ = ('fixed_id', 'handles', 'server_side', 'max_handles', 'unknown_handles')
+
+    def __init__(
+        self,
+        fixed_id: bytes,
+        handles: Dict[int, bytes],
+        server_side: bool,
+        buffer_size: int = 64 * 1024,
+        max_frame_size: int = MAX_FRAME_SIZE,
+        max_handles: int = MAX_HANDLES
+    ):
+        super().__init__(buffer_size, max_frame_size)
+        self.fixed_id = fixed_id
+        self.handles = handles
+        self.server_side = server_side
+        self.max_handles = max_handles
+        self._missing = 1
+
+        self.unknown_handles = 0
+
+    def decode(self) -> List[MessageFrame]:
+        frames = []
+        start, end = self._start, self._end
+        # Limitado ao que chegou: índice além de `end` levanta IndexError
+        view = self._view[:end]
+        handles = self.handles
+
+        while start < end:
+            try:
+                # Varints de 1 byte (handles, tamanhos < 128) sem chamada de função
+                flags = view[start]
+                seq_no = view[start + 1]
+                if seq_no < 0x80:
+                    pos = start + 2
+                else:
+                    seq_no, pos = decode_varint(view, start + 1)
+                handle = 0
+                peer_id = None
+                if not flags & COMPACT_CONTROL:
+                    handle = view[pos]
+                    if handle < 0x80:
+                        pos += 1
+                    else:
+                        handle, pos = decode_varint(view, pos)
+                    if flags & COMPACT_PEER_ID:
+                        if end - pos < PEER_ID_SIZE:
+                            raise IndexError
+                        peer_id = bytes(view[pos:pos + PEER_ID_SIZE])
+                        pos += PEER_ID_SIZE
+                size = view[pos]
+                if size < 0x80:
+                    pos += 1
+                else:
+                    size, pos = decode_varint(view, pos)
+            except IndexError:
+                self._missing = 1
+                break
+
+            if flags & ~COMPACT_FLAGS or seq_no > SEQ_MASK:
+                raise ValueError("Cabeçalho de frame v2 inválido")
+            if size > self.max_frame_size:
+                raise ValueError(f"Frame de {size} bytes acima do limite")
+            if end - pos < size:
+                self._missing = size - (end - pos)
+                break
+
+            body = view[pos:pos + size]
+            start = pos + size
+
+            if flags & COMPACT_CONTROL:
+                seq_no |= CONTROL_FLAG
+                frames.append(MessageFrame(counter_nonce(seq_no), NO_ID, NO_ID, seq_no, body))
+                continue
+
+            if peer_id is None:
+                peer_id = handles.get(handle)
+                if peer_id is None:
+                    # Handle que este lado não conhece: frame descartado
+                    self.unknown_handles += 1
+                    continue
+            elif handle and not self.server_side and (handle in handles or len(handles) < self.max_handles):
+                handles[handle] = peer_id
+
+            if flags & COMPACT_CHUNK:
+                seq_no |= STREAM_CHUNK_FLAG
+            if self.server_side:
+                frame = MessageFrame(counter_nonce(seq_no), self.fixed_id, peer_id, seq_no, body)
+            else:
+                frame = MessageFrame(counter_nonce(seq_no), peer_id, self.fixed_id, seq_no, body)
+            frames.append(frame)
+
+        self.frames += len(frames)
+        self._start = start
+        return frames
+
+
+def compact_frame_size(frame: MessageFrame) -> int:
+    # Limite superior do tamanho v2, para a contabilidade da fila de saída
+    # antes de o frame ser codificado
+    return 1 + 9 + 3 + PEER_ID_SIZE + 5 + len(frame.ciphertext_with_tag)
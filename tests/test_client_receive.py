@@ -0,0 +1,85 @@
+import asyncio
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from client import SecureMessagingClient
+from server import SecureMessagingServer
+
+logging.disable(logging.CRITICAL)
+
+
+async def start_server():
+    server = SecureMessagingServer(handshake_executor="inline", ecdhe_pool_size=0)
+    listener = await asyncio.start_server(server.handle_client, "127.0.0.1", 0)
+    return server, listener, listener.sockets[0].getsockname()[1]
+
+
+def make_client(server, port, name):
+    return SecureMessagingClient(
+        name, server_port=port, server_cert_path=None,
+        server_fingerprints=[server.rsa_signature.key_material.fingerprint]
+    )
+
+
+async def wait_for(condition, timeout=5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline
+        await asyncio.sleep(0.01)
+
+
+def test_consumer_survives_reconnect():
+    async def run():
+        server, listener, port = await start_server()
+        sender, receiver = make_client(server, port, "a"), make_client(server, port, "b")
+        assert await sender.connect() and await receiver.connect()
+        received = []
+
+        async def consume():
+            async for message in receiver.messages():
+                received.append(message.payload)
+
+        consumer = asyncio.create_task(consume())
+        await asyncio.sleep(0.05)
+        assert await sender.send_message("b", receiver.client_id, "antes")
+        await wait_for(lambda: received == ["antes"])
+
+        # O mesmo consumidor recebe pela conexão nova, sem entrar de novo em messages()
+        receiver.writer.close()
+        assert await receiver.connect()
+        await asyncio.sleep(0.05)
+        assert await sender.send_message("b", receiver.client_id, "depois")
+        await wait_for(lambda: received == ["antes", "depois"])
+        assert not consumer.done()
+
+        # Conexão fechada pelo servidor: a recepção termina
+        server.sessions[receiver.client_id].outbound.abort()
+        await asyncio.wait_for(consumer, 5.0)
+        sender.writer.close()
+        listener.close()
+
+    asyncio.run(run())
+
+
+def test_failed_reconnect_ends_consumer():
+    async def run():
+        server, listener, port = await start_server()
+        receiver = make_client(server, port, "b")
+        assert await receiver.connect()
+
+        async def consume():
+            return [message async for message in receiver.messages()]
+
+        consumer = asyncio.create_task(consume())
+        await asyncio.sleep(0.05)
+        listener.close()
+        await listener.wait_closed()
+        receiver.writer.close()
+        receiver.server_port = port
+        assert not await receiver.connect()
+        assert await asyncio.wait_for(consumer, 5.0) == []
+
+    asyncio.run(run())
@@ -0,0 +1,76 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from crypto import AESGCMCipher
+from framing import frame_reader, TRANSPORT_ENGINES
+from protocol import MessageCrypto
+
+CIPHER = AESGCMCipher(os.urandom(16))
+SENDER, RECIPIENT = b's' * 16, b'r' * 16
+HELLO = b'h' * 49
+
+
+def frames_bytes(count, size, first=0):
+    parts = []
+    for seq in range(first, first + count):
+        frame = MessageCrypto.encrypt_message(CIPHER, SENDER, RECIPIENT, seq, bytes((seq % 256,)) * size)
+        parts.extend(frame.to_wire_parts())
+    return b''.join(parts)
+
+
+async def exchange(engine, early, late):
+    # `early` chega junto com o hello, antes de o leitor de frames existir;
+    # `late` só depois de ele assumir a conexão
+    received = []
+    attached = asyncio.Event()
+    done = asyncio.get_running_loop().create_future()
+
+    async def handle(reader, writer):
+        assert await reader.readexactly(len(HELLO)) == HELLO
+        # Dá tempo de todo o `early` chegar ao StreamReader
+        await asyncio.sleep(0.1)
+        source = await frame_reader(engine, reader, writer)
+        attached.set()
+        try:
+            while len(received) < total:
+                received.extend(
+                    (f.seq_no, MessageCrypto.decrypt_message(CIPHER, f)) for f in await source.read_frames()
+                )
+        finally:
+            done.set_result(None)
+            writer.close()
+
+    total = 0
+    listener = await asyncio.start_server(handle, "127.0.0.1", 0)
+    _, writer = await asyncio.open_connection("127.0.0.1", listener.sockets[0].getsockname()[1])
+    head = frames_bytes(*early)
+    stream = head + frames_bytes(*late, first=early[0])
+    split = len(head)
+    total = early[0] + late[0]
+    writer.write(HELLO + stream[:split])
+    await attached.wait()
+    writer.write(stream[split:])
+    await asyncio.wait_for(done, 5.0)
+    writer.close()
+    listener.close()
+    return received
+
+
+@pytest.mark.parametrize("engine", TRANSPORT_ENGINES)
+@pytest.mark.parametrize("early, late", [
+    ((0, 10), (5, 10)),
+    ((3, 10), (0, 10)),
+    ((3, 10), (4, 10)),
+    # Mais que o limite do StreamReader: ele pausa a leitura antes da troca
+    ((40, 8000), (10, 8000)),
+])
+def test_bytes_before_attach(engine, early, late):
+    received = asyncio.run(exchange(engine, early, late))
+    count = early[0] + late[0]
+    assert [seq for seq, _ in received] == list(range(count))
+    assert all(plaintext is not None and len(set(plaintext)) == 1 for _, plaintext in received)
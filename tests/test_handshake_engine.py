@@ -0,0 +1,49 @@
+import asyncio
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from client import SecureMessagingClient
+from server import SecureMessagingServer
+
+logging.disable(logging.CRITICAL)
+
+
+def test_process_workers_use_key_pool():
+    async def run():
+        server = SecureMessagingServer(
+            handshake_executor="process", handshake_workers=1, ecdhe_pool_size=8
+        )
+        assert server.key_pool is None
+        listener = await asyncio.start_server(server.handle_client, "127.0.0.1", 0)
+        port = listener.sockets[0].getsockname()[1]
+        fingerprints = [server.rsa_signature.key_material.fingerprint]
+        clients = []
+
+        async def connect(name):
+            client = SecureMessagingClient(
+                name, server_port=port, server_cert_path=None, server_fingerprints=fingerprints
+            )
+            assert await client.connect()
+            clients.append(client)
+
+        await connect("a")
+        # A thread do processo enche o pool entre um handshake e outro
+        await asyncio.sleep(1.0)
+        for i in range(3):
+            await connect(f"c{i}")
+
+        stats = server.key_pool_stats()
+        assert stats["size"] == 8
+        assert stats["hits"] >= 3
+        assert stats["hits"] + stats["misses"] == 4
+        assert f"ecdhe_pool_available {stats['available']}" in server.metrics.render()
+
+        for client in clients:
+            client.writer.close()
+        listener.close()
+        await server.shutdown()
+
+    asyncio.run(run())
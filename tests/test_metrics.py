@@ -0,0 +1,69 @@
+import asyncio
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from metrics import ServerMetrics, dump_metrics
+from outbound import OutboundQueue, OverflowPolicy
+from server import SecureMessagingServer
+
+logging.disable(logging.CRITICAL)
+
+
+class Writer:
+    transport = None
+
+    def writelines(self, buffers):
+        pass
+
+    async def drain(self):
+        await asyncio.Event().wait()
+
+
+def test_outbound_dropped_running_total():
+    async def run():
+        metrics = ServerMetrics()
+        queues = [OutboundQueue(Writer(), max_frames=1, metrics=metrics) for _ in range(3)]
+        for queue in queues:
+            queue.start()
+            await queue.put([b'0'])
+            await asyncio.sleep(0)
+            for i in range(1, 4):
+                await queue.put([b'%d' % i])
+        # Cada fila: um frame no socket, um na fila e dois descartados
+        assert metrics.outbound_dropped == 6
+        # Fechar conta o que estava na fila, uma vez só
+        for queue in queues:
+            await queue.close()
+            await queue.close()
+        assert metrics.outbound_dropped == 9 == sum(queue.dropped for queue in queues)
+        assert "mensageria_outbound_dropped_total 9" in metrics.render()
+
+    asyncio.run(run())
+
+
+def test_server_exports_dropped_without_sessions_scan():
+    server = SecureMessagingServer(handshake_executor="inline", ecdhe_pool_size=0)
+    server.outbound_stats = None
+    server.metrics.outbound_dropped = 5
+    assert "mensageria_outbound_dropped_total 5" in server.metrics.render()
+
+
+def test_dump_metrics_writes_file(tmp_path):
+    async def run():
+        metrics = ServerMetrics()
+        metrics.frames_in = 42
+        path = str(tmp_path / "metrics.prom")
+        task = asyncio.create_task(dump_metrics(metrics, path, 0.01))
+        for _ in range(100):
+            if os.path.exists(path):
+                break
+            await asyncio.sleep(0.01)
+        task.cancel()
+        with open(path) as f:
+            assert "mensageria_frames_in_total 42" in f.read()
+        assert not os.path.exists(path + ".tmp")
+
+    asyncio.run(run())
@@ -0,0 +1,208 @@
+import asyncio
+import logging
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import offline_store
+from offline_store import OfflineStore, RECORD_HEADER, RECORD_MESSAGE
+from outbound import OutboundQueue
+from server import SecureMessagingServer
+
+logging.disable(logging.CRITICAL)
+
+ALICE, BOB, SENDER = b'a' * 16, b'b' * 16, b's' * 16
+# Cabeçalho + nonce + 10 bytes + tag: dois registros por segmento de 256 bytes
+SEGMENT_BYTES = 256
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = SimpleNamespace(value=1_000_000.0)
+    monkeypatch.setattr(offline_store, "time", SimpleNamespace(time=lambda: now.value))
+    return now
+
+
+def open_store(path, **kwargs):
+    return OfflineStore(str(path), segment_bytes=SEGMENT_BYTES, flush_interval=0, **kwargs)
+
+
+def payload(i):
+    return b'mensagem%02d' % i
+
+
+def reopen(store):
+    store._close()
+    return open_store(store.path)
+
+
+def test_recovers_segments(tmp_path):
+    store = open_store(tmp_path)
+    for i in range(10):
+        store.append(ALICE, SENDER, payload(i), compress=i % 2 == 0)
+    for i in range(3):
+        store.append(BOB, SENDER, payload(i))
+    store.ack(ALICE, 4, 4)
+    assert store.stats()["segments"] > 1
+
+    store = reopen(store)
+    assert store.pending_messages == 9
+    messages, last_seq = store.take(ALICE)
+    assert [(seq, plaintext, compress) for seq, _, plaintext, compress in messages] == [
+        (i + 1, payload(i), i % 2 == 0) for i in range(4, 10)
+    ]
+    assert last_seq == 10
+    assert [plaintext for _, _, plaintext, _ in store.take(BOB)[0]] == [payload(i) for i in range(3)]
+    # A numeração continua depois da maior seq em disco
+    assert store.append(BOB, SENDER, payload(3)) == 14
+    store._close()
+
+
+def test_truncates_partial_record(tmp_path):
+    store = open_store(tmp_path)
+    store.append(ALICE, SENDER, payload(0))
+    store._close()
+
+    # Queda no meio da escrita: cabeçalho completo, corpo pela metade
+    segment = store._segment_path(store._active_id)
+    size = os.path.getsize(segment)
+    with open(segment, 'ab') as f:
+        f.write(RECORD_HEADER.pack(RECORD_MESSAGE, 2, ALICE, SENDER, 0, 100) + b'x' * 10)
+
+    store = open_store(tmp_path)
+    assert os.path.getsize(segment) == size
+    assert [seq for seq, _, _, _ in store.take(ALICE)[0]] == [1]
+    assert store.append(ALICE, SENDER, payload(1)) == 2
+    store = reopen(store)
+    assert [seq for seq, _, _, _ in store.take(ALICE)[0]] == [1, 2]
+    store._close()
+
+
+def test_compaction_moves_live_records(tmp_path):
+    store = open_store(tmp_path, compact_ratio=0.75)
+    # Primeiro segmento: uma de Alice e uma de Bob; depois só Alice
+    store.append(ALICE, SENDER, payload(0))
+    store.append(BOB, SENDER, payload(0))
+    for i in range(1, 6):
+        store.append(ALICE, SENDER, payload(i))
+    first = min(store._sizes)
+
+    store.ack(ALICE, store.take(ALICE)[1], 6)
+    # Só Bob vivo no segmento antigo: reescrito no ativo e apagado
+    assert first not in store._sizes
+    assert store.compactions >= 1
+    assert len(store._sizes) == 1
+    store = reopen(store)
+    assert store.pending_messages == 1
+    assert [plaintext for _, _, plaintext, _ in store.take(BOB)[0]] == [payload(0)]
+    store._close()
+
+
+def test_expired_counted_once(tmp_path, clock):
+    store = open_store(tmp_path, ttl=60)
+    for i in range(3):
+        store.append(ALICE, SENDER, payload(i))
+    clock.value += 61
+    store.append(ALICE, SENDER, payload(3))
+
+    for _ in range(3):
+        messages, last_seq = store.take(ALICE)
+        assert [seq for seq, _, _, _ in messages] == [4] and last_seq == 4
+        assert store.expired == 3
+    store.ack(ALICE, last_seq, 1)
+    assert store.pending_messages == 0
+    assert store.stats()["expired"] == 3 and store.delivered == 1
+    store._close()
+
+
+def test_expired_batch_without_fresh_messages(tmp_path, clock):
+    store = open_store(tmp_path, ttl=60)
+    for i in range(5):
+        store.append(ALICE, SENDER, payload(i))
+    clock.value += 61
+
+    # Só expiradas: nada a entregar, o seq ainda cobre o lote para o ACK
+    assert store.take(ALICE) == ([], 5)
+    assert not store.has_messages(ALICE)
+    assert store.take(ALICE) == ([], 0)
+    store.ack(ALICE, 5, 0)
+    assert store.expired == 5
+    store._close()
+
+
+def test_expired_segment_compacted_once(tmp_path, clock):
+    store = open_store(tmp_path, ttl=60)
+    for i in range(4):
+        store.append(ALICE, SENDER, payload(i))
+    clock.value += 61
+    store.append(BOB, SENDER, payload(0))
+    store.append(BOB, SENDER, payload(1))
+
+    # Segmentos expirados descartados pela compactação: Alice não volta a contar
+    store.compact()
+    assert store.expired == 4
+    assert store.take(ALICE) == ([], 0)
+    assert store.expired == 4
+
+    # Lidas (e contadas) antes: a compactação só apaga o segmento
+    clock.value += 61
+    assert store.take(BOB) == ([], 6)
+    assert store.expired == 6
+    segment = store._active_id
+    store.append(BOB, SENDER, payload(2))
+    store.compact()
+    assert segment not in store._sizes
+    assert store.expired == 6
+    assert [seq for seq, _, _, _ in store.take(BOB)[0]] == [7]
+    store._close()
+
+
+class FailingWriter:
+    # Escreve `limit` lotes e depois a conexão cai
+    transport = None
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.written = []
+
+    def writelines(self, buffers):
+        self.written.append(b''.join(buffers))
+
+    async def drain(self):
+        if len(self.written) > self.limit:
+            raise ConnectionResetError()
+
+
+@pytest.mark.parametrize("limit, acked", [(10, 5), (2, 2), (0, 0)])
+def test_ack_only_after_flush(tmp_path, limit, acked):
+    async def run():
+        server = SecureMessagingServer(
+            handshake_executor="inline", ecdhe_pool_size=0, enable_metrics=False,
+            offline_store_path=str(tmp_path), offline_segment_bytes=SEGMENT_BYTES
+        )
+        for i in range(5):
+            server.offline_store.append(ALICE, SENDER, payload(i))
+
+        # Um frame por lote: cada drain confirma exatamente uma mensagem
+        writer = FailingWriter(limit)
+        session = SimpleNamespace(client_id=ALICE, outbound=OutboundQueue(writer, max_batch_bytes=1))
+        session.outbound.start()
+
+        async def send(target, sender_id, plaintext, compress=False):
+            await target.outbound.put([plaintext])
+
+        server._send_to_session = send
+        await server._deliver_offline(session)
+        assert writer.written[:acked] == [payload(i) for i in range(acked)]
+        await server.offline_store.close()
+
+        # O ACK persistiu: só o que não saiu pelo socket volta no próximo connect
+        store = open_store(tmp_path)
+        assert [seq for seq, _, _, _ in store.take(ALICE)[0]] == list(range(acked + 1, 6))
+        store._close()
+
+    asyncio.run(run())
@@ -0,0 +1,187 @@
+import asyncio
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from outbound import OutboundQueue, OverflowPolicy
+
+logging.disable(logging.CRITICAL)
+
+
+class Transport:
+    def __init__(self):
+        self.aborted = False
+
+    def abort(self):
+        self.aborted = True
+
+
+class Writer:
+    # Socket lento: drain() só volta quando o teste libera
+    def __init__(self):
+        self.transport = Transport()
+        self.written = []
+        self.open = asyncio.Event()
+
+    def writelines(self, buffers):
+        self.written.extend(bytes(buffer) for buffer in buffers)
+
+    async def drain(self):
+        await self.open.wait()
+
+
+def make_queue(policy, max_frames=3):
+    writer = Writer()
+    # Um frame por lote: o escritor tira da fila um de cada vez
+    queue = OutboundQueue(writer, max_frames=max_frames, policy=policy, max_batch_bytes=1)
+    queue.start()
+    return queue, writer
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_drop_oldest_skips_control_frames():
+    async def run():
+        queue, writer = make_queue(OverflowPolicy.DROP_OLDEST)
+        # O primeiro sai para o socket e o escritor fica preso no drain
+        assert await queue.put([b'm0'])
+        await settle()
+        assert queue.put_control([b'c1'])
+        assert await queue.put([b'm1'])
+        assert await queue.put([b'm2'])
+        assert queue.depth == 3
+
+        # Cheia: sai a mais antiga que não é controle
+        assert await queue.put([b'm3'])
+        assert queue.dropped == 1
+        # Controle entra mesmo acima do limite
+        assert queue.put_control([b'c2'])
+        assert queue.depth == 4
+
+        writer.open.set()
+        assert await queue.flushed()
+        assert writer.written == [b'm0', b'c1', b'm2', b'm3', b'c2']
+
+    asyncio.run(run())
+
+
+def test_drop_oldest_with_only_control_frames():
+    async def run():
+        queue, writer = make_queue(OverflowPolicy.DROP_OLDEST, max_frames=2)
+        assert await queue.put([b'm0'])
+        await settle()
+        assert queue.put_control([b'c1']) and queue.put_control([b'c2'])
+        # Nada descartável: o frame entra e a fila passa do limite
+        assert await queue.put([b'm1'])
+        assert queue.dropped == 0 and queue.depth == 3
+        writer.open.set()
+        assert await queue.flushed()
+        assert writer.written == [b'm0', b'c1', b'c2', b'm1']
+
+    asyncio.run(run())
+
+
+def test_disconnect_aborts():
+    async def run():
+        queue, writer = make_queue(OverflowPolicy.DISCONNECT)
+        assert await queue.put([b'm0'])
+        await settle()
+        for i in range(1, 4):
+            assert await queue.put([b'm%d' % i])
+
+        assert not await queue.put([b'm4'])
+        assert queue.closed and writer.transport.aborted
+        # Os 3 na fila e o recusado
+        assert queue.dropped == 4
+        assert not await queue.put([b'm5']) and not queue.put_control([b'c'])
+        assert queue.dropped == 6
+
+    asyncio.run(run())
+
+
+def test_backpressure_blocks_sender():
+    async def run():
+        queue, writer = make_queue(OverflowPolicy.BACKPRESSURE)
+        assert await queue.put([b'm0'])
+        await settle()
+        for i in range(1, 4):
+            assert await queue.put([b'm%d' % i])
+
+        blocked = asyncio.create_task(queue.put([b'm4']))
+        await settle()
+        assert not blocked.done() and queue.depth == 3
+
+        # O socket esvazia: o remetente volta e nada foi descartado
+        writer.open.set()
+        assert await asyncio.wait_for(blocked, 1.0)
+        assert await queue.flushed()
+        assert writer.written == [b'm%d' % i for i in range(5)] and queue.dropped == 0
+
+    asyncio.run(run())
+
+
+def test_backpressure_released_on_close():
+    async def run():
+        queue, writer = make_queue(OverflowPolicy.BACKPRESSURE, max_frames=1)
+        assert await queue.put([b'm0'])
+        await settle()
+        assert await queue.put([b'm1'])
+        blocked = asyncio.create_task(queue.put([b'm2']))
+        await settle()
+        queue.abort()
+        assert await asyncio.wait_for(blocked, 1.0) is False
+
+    asyncio.run(run())
+
+
+def test_flushed_false_on_close():
+    async def run():
+        queue, writer = make_queue(OverflowPolicy.DROP_OLDEST)
+        assert await queue.put([b'm0'])
+        assert await queue.put([b'm1'])
+        waiter = asyncio.create_task(queue.flushed())
+        await settle()
+        assert not waiter.done()
+
+        await queue.close()
+        assert await asyncio.wait_for(waiter, 1.0) is False
+        assert await queue.flushed() is False
+        assert queue.sent == 0
+
+    asyncio.run(run())
+
+
+def test_flushed_false_when_write_fails():
+    async def run():
+        queue, writer = make_queue(OverflowPolicy.DROP_OLDEST)
+
+        async def broken():
+            raise ConnectionResetError()
+
+        writer.drain = broken
+        assert await queue.put([b'm0'])
+        assert await queue.flushed() is False
+        assert queue.closed
+
+    asyncio.run(run())
+
+
+def test_flushed_true_once_written():
+    async def run():
+        queue, writer = make_queue(OverflowPolicy.DROP_OLDEST)
+        assert await queue.flushed()
+        for i in range(3):
+            assert await queue.put([b'm%d' % i])
+        waiter = asyncio.create_task(queue.flushed())
+        await settle()
+        assert not waiter.done()
+        writer.open.set()
+        assert await asyncio.wait_for(waiter, 1.0)
+        assert queue.sent == 3
+
+    asyncio.run(run())
@@ -0,0 +1,272 @@
+import asyncio
+import logging
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from client import SecureMessagingClient
+from crypto import AESGCMCipher, RSASignature
+from protocol import (
+    ServerHandshake, MessageCrypto, EXT_REKEY, CONTROL_REKEY, SEQ_MASK, decode_extensions
+)
+from rekey import KeyRatchet, MAX_PREVIOUS_KEYS
+from replay import ReplayWindow
+from server import SecureMessagingServer
+
+logging.disable(logging.CRITICAL)
+
+SENDER_ID, RECIPIENT_ID = bytes(16), bytes(range(16))
+
+
+class Sender:
+    # Lado que cifra: frames de mensagem numerados e o REKEY quando a cota fecha
+    def __init__(self, cipher, max_messages=0, max_bytes=0):
+        self.ratchet = KeyRatchet(max_messages, max_bytes)
+        self.cipher = cipher
+        self.seq = 0
+
+    def message(self, payload=b'x'):
+        frame = MessageCrypto.encrypt_message(self.cipher, SENDER_ID, RECIPIENT_ID, self.seq, payload)
+        self.seq += 1
+        return frame
+
+    def rekey(self):
+        payload, cipher = self.ratchet.ratchet_send(self.cipher)
+        frame = MessageCrypto.encrypt_control(self.cipher, self.seq, payload)
+        self.seq += 1
+        self.cipher = cipher
+        return frame
+
+
+class Receiver:
+    # Como o servidor e o cliente abrem: chave escolhida pelo seq, REKEY troca a atual
+    def __init__(self, cipher, window=1024):
+        self.ratchet = KeyRatchet(0, 0)
+        self.cipher = cipher
+        self.replay = ReplayWindow(window)
+
+    def open(self, frame):
+        seq_no = frame.seq_no & SEQ_MASK
+        if not self.replay.check(seq_no):
+            return None
+        plaintext = MessageCrypto.decrypt_message(self.ratchet.receive_cipher(self.cipher, seq_no, self.replay), frame)
+        if plaintext is None:
+            return None
+        self.replay.accept(seq_no)
+        if plaintext[:1] == bytes((CONTROL_REKEY,)):
+            cipher = self.ratchet.ratchet_receive(self.cipher, plaintext, seq_no)
+            assert cipher is not None
+            self.cipher = cipher
+        return plaintext
+
+
+def pair(window=1024):
+    cipher = AESGCMCipher(os.urandom(16))
+    return Sender(cipher), Receiver(cipher, window)
+
+
+def test_rekey_derives_same_key():
+    sender, receiver = pair()
+    for _ in range(3):
+        assert receiver.open(sender.rekey()) is not None
+        assert receiver.cipher.key == sender.cipher.key
+    assert receiver.open(sender.message(b'nova')) == b'nova'
+    assert sender.ratchet.rekeys_sent == receiver.ratchet.rekeys_received == 3
+
+
+def test_rekey_ahead_of_queued_frames():
+    # Como o servidor enfileira: frames já cifrados com a chave antiga esperam
+    # na fila (ou no pool) e o REKEY passa à frente deles (put_control)
+    sender, receiver = pair()
+    queued = [sender.message(b'antiga %d' % i) for i in range(3)]
+    rekey = sender.rekey()
+    fresh = [sender.message(b'nova %d' % i) for i in range(3)]
+
+    assert receiver.open(rekey) is not None
+    assert [receiver.open(frame) for frame in queued] == [b'antiga %d' % i for i in range(3)]
+    assert [receiver.open(frame) for frame in fresh] == [b'nova %d' % i for i in range(3)]
+
+
+def test_frames_from_many_pending_epochs():
+    # Trocas seguidas com um frame de cada época ainda em trânsito
+    sender, receiver = pair()
+    pending = []
+    for epoch in range(MAX_PREVIOUS_KEYS):
+        pending.append((epoch, sender.message(b'%d' % epoch)))
+        assert receiver.open(sender.rekey()) is not None
+    assert len(receiver.ratchet.previous) == MAX_PREVIOUS_KEYS
+    for epoch, frame in reversed(pending):
+        assert receiver.open(frame) == b'%d' % epoch
+
+
+def test_previous_keys_capped():
+    sender, receiver = pair()
+    oldest = sender.message(b'velha')
+    for _ in range(MAX_PREVIOUS_KEYS + 1):
+        assert receiver.open(sender.rekey()) is not None
+    # A chave da primeira época saiu da lista
+    assert len(receiver.ratchet.previous) == MAX_PREVIOUS_KEYS
+    assert receiver.open(oldest) is None
+
+
+def test_previous_key_dropped_after_window():
+    sender, receiver = pair(window=8)
+    late = sender.message(b'atrasada')
+    assert receiver.open(sender.rekey()) is not None
+    assert len(receiver.ratchet.previous) == 1
+    for _ in range(8):
+        assert receiver.open(sender.message()) is not None
+    # A janela passou da troca: o seq não é mais aceito, e o próximo frame que
+    # escolhe chave tira a anterior da memória
+    assert receiver.open(late) is None
+    assert len(receiver.ratchet.previous) == 1
+    assert receiver.open(sender.message()) is not None
+    assert receiver.ratchet.previous == []
+
+
+def test_rejects_rekey_out_of_order():
+    ratchet = KeyRatchet(0, 0)
+    cipher = AESGCMCipher(os.urandom(16))
+
+    def rekey(epoch):
+        return bytes((CONTROL_REKEY,)) + epoch.to_bytes(4, 'big')
+
+    # Época pulada
+    assert ratchet.ratchet_receive(cipher, rekey(2), 5) is None
+    assert ratchet.ratchet_receive(cipher, rekey(1), 5) is not None
+    # Época repetida e REKEY com seq anterior à última troca
+    assert ratchet.ratchet_receive(cipher, rekey(1), 7) is None
+    assert ratchet.ratchet_receive(cipher, rekey(2), 3) is None
+    # Payload truncado
+    assert ratchet.ratchet_receive(cipher, rekey(2)[:3], 9) is None
+    assert ratchet.ratchet_receive(cipher, rekey(2), 9) is not None
+    assert ratchet.rekeys_received == 2
+
+
+@pytest.mark.parametrize("max_messages, max_bytes, sizes, fires_at", [
+    (3, 0, [10, 10, 10, 10], 2),
+    (0, 100, [40, 40, 40, 40], 2),
+    (5, 100, [60, 60, 1, 1], 1),
+    (2, 1000, [1, 1, 1, 1], 1),
+])
+def test_limits(max_messages, max_bytes, sizes, fires_at):
+    ratchet = KeyRatchet(max_messages, max_bytes)
+    fired = [ratchet.count(size) for size in sizes]
+    assert fired.index(True) == fires_at
+    # A troca zera os contadores
+    ratchet.ratchet_send(AESGCMCipher(os.urandom(16)))
+    assert not ratchet.count(1)
+
+
+def test_limits_disabled():
+    ratchet = KeyRatchet(0, 0)
+    assert not any(ratchet.count(1 << 30) for _ in range(1000))
+
+
+def test_offered_only_with_a_limit():
+    default = SecureMessagingClient("a", server_cert_path=None)
+    assert default._offered_extensions() == b''
+    for kwargs in ({"rekey_after_messages": 10}, {"rekey_after_bytes": 1 << 20}):
+        client = SecureMessagingClient("a", server_cert_path=None, **kwargs)
+        assert EXT_REKEY in decode_extensions(client._offered_extensions())
+
+
+async def start_server(**kwargs):
+    server = SecureMessagingServer(handshake_executor="inline", ecdhe_pool_size=0, **kwargs)
+    listener = await asyncio.start_server(server.handle_client, "127.0.0.1", 0)
+    return server, listener, listener.sockets[0].getsockname()[1]
+
+
+def make_client(server, port, name="c", **kwargs):
+    return SecureMessagingClient(
+        name, server_port=port, server_cert_path=None,
+        server_fingerprints=[server.rsa_signature.key_material.fingerprint], **kwargs
+    )
+
+
+def test_negotiation():
+    async def run():
+        server, listener, port = await start_server()
+        plain = make_client(server, port, "plain")
+        rekeying = make_client(server, port, "rekeying", rekey_after_messages=10)
+        assert await plain.connect() and await rekeying.connect()
+        await asyncio.sleep(0.05)
+        assert plain.rekey is None and server.sessions[plain.client_id].rekey is None
+        assert rekeying.rekey is not None and server.sessions[rekeying.client_id].rekey is not None
+        for client in (plain, rekeying):
+            client.writer.close()
+        listener.close()
+
+    asyncio.run(run())
+
+
+def test_connect_fails_without_extension_echo():
+    # Servidor que só conhece o hello original: lê 49 bytes como client_id + pk_C
+    # e responde no layout original, sem o bloco de extensões
+    rsa = RSASignature()
+    handshake = ServerHandshake(rsa)
+
+    async def legacy(reader, writer):
+        hello = await reader.readexactly(49)
+        response = handshake.generate_handshake_response(hello[:16], hello[16:], handshake.new_key_exchange())
+        data = response.to_bytes()
+        writer.write(len(data).to_bytes(4, 'big') + data)
+        await writer.drain()
+
+    async def run():
+        listener = await asyncio.start_server(legacy, "127.0.0.1", 0)
+        port = listener.sockets[0].getsockname()[1]
+        fingerprints = [rsa.key_material.fingerprint]
+        plain = SecureMessagingClient("a", server_port=port, server_cert_path=None, server_fingerprints=fingerprints)
+        extended = SecureMessagingClient(
+            "b", server_port=port, server_cert_path=None, server_fingerprints=fingerprints, rekey_after_messages=10
+        )
+        assert await plain.connect()
+        assert not await extended.connect()
+        listener.close()
+
+    asyncio.run(run())
+
+
+def test_rekey_with_frames_in_crypto_pool():
+    # Vários remetentes com payloads cifrados no pool e troca a cada frame: frames
+    # de épocas diferentes ficam em voo ao mesmo tempo
+    async def run():
+        server, listener, port = await start_server(
+            crypto_workers=4, crypto_offload_threshold=1024, rekey_after_messages=1,
+            overflow_policy="backpressure"
+        )
+        senders = [make_client(server, port, f"s{i}", rekey_after_messages=1) for i in range(4)]
+        receiver = make_client(server, port, "r", rekey_after_messages=1)
+        for client in (*senders, receiver):
+            assert await client.connect()
+        received = []
+
+        async def collect():
+            async for message in receiver.messages(raw=True):
+                received.append(message.payload)
+
+        task = asyncio.create_task(collect())
+        await asyncio.sleep(0.05)
+        payload = os.urandom(100_000).hex()
+
+        async def send(client):
+            for _ in range(10):
+                assert await client.send_message("r", receiver.client_id, payload)
+
+        await asyncio.gather(*(send(client) for client in senders))
+        for _ in range(200):
+            if len(received) == 40:
+                break
+            await asyncio.sleep(0.05)
+        task.cancel()
+        assert received == [payload.encode()] * 40
+        assert receiver.rekey.rekeys_received >= 40
+        for client in (*senders, receiver):
+            client.writer.close()
+        listener.close()
+
+    asyncio.run(run())
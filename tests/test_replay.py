@@ -0,0 +1,126 @@
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from replay import ReplayWindow
+
+
+class ModelWindow:
+    # Referência: conjunto de seqs aceitos; passa o que não foi visto e está a
+    # menos de `size` do maior aceito
+    def __init__(self, size):
+        self.size = size
+        self.seen = set()
+        self.highest = -1
+
+    def check(self, seq_no):
+        return seq_no not in self.seen and seq_no > self.highest - self.size
+
+    def accept(self, seq_no):
+        if not self.check(seq_no):
+            return False
+        self.seen.add(seq_no)
+        self.highest = max(self.highest, seq_no)
+        return True
+
+
+def next_seq(rng, highest, size):
+    choice = rng.random()
+    if choice < 0.45:
+        return highest + 1 + rng.randrange(4)
+    if choice < 0.75:
+        return max(0, highest - rng.randrange(size + 8))
+    if choice < 0.9:
+        return max(0, highest - rng.randrange(4 * size + 8))
+    if choice < 0.97:
+        return highest + rng.randrange(2 * size + 8)
+    # Saltos muito maiores que a janela
+    return highest + rng.randrange(1, 1 << 40)
+
+
+@pytest.mark.parametrize("size", [1, 2, 63, 64, 65, 1024])
+@pytest.mark.parametrize("seed", range(5))
+def test_matches_model(size, seed):
+    rng = random.Random(seed * 7919 + size)
+    window, model = ReplayWindow(size), ModelWindow(size)
+    for _ in range(5000):
+        seq_no = next_seq(rng, model.highest, size)
+        assert window.check(seq_no) == model.check(seq_no), seq_no
+        # check() só consulta: repetir não muda nada
+        assert window.check(seq_no) == model.check(seq_no), seq_no
+        assert window.accept(seq_no) == model.accept(seq_no), seq_no
+        assert window.highest == model.highest
+
+
+def test_replay_rejected():
+    window = ReplayWindow(64)
+    for seq_no in (0, 5, 3, 10):
+        assert window.accept(seq_no)
+    for seq_no in (0, 5, 3, 10):
+        assert not window.check(seq_no)
+        assert not window.accept(seq_no)
+
+
+def test_out_of_window_rejected():
+    window = ReplayWindow(64)
+    assert window.accept(100)
+    # 100 - 63 ainda cabe; 100 - 64 já saiu da janela
+    assert window.accept(37)
+    assert not window.check(36)
+    assert not window.accept(36)
+    assert not window.accept(0)
+
+
+def test_size_one_is_strict_order():
+    window = ReplayWindow(1)
+    assert window.accept(0)
+    assert window.accept(1)
+    assert not window.accept(1)
+    assert not window.accept(0)
+    assert window.accept(5)
+    assert not window.accept(4)
+    assert window.bitmap == 1
+
+
+def test_large_jump_clears_window():
+    window = ReplayWindow(64)
+    for seq_no in range(10):
+        assert window.accept(seq_no)
+    jump = 10 + (1 << 50)
+    assert window.accept(jump)
+    assert window.bitmap == 1
+    assert not window.accept(9)
+    assert not window.accept(jump)
+    # Recém-passados pelo salto (nunca vistos) ainda entram, dentro da janela
+    assert window.accept(jump - 1)
+    assert window.accept(jump - 63)
+    assert not window.accept(jump - 64)
+
+
+def test_jump_within_window_keeps_history():
+    window = ReplayWindow(64)
+    assert window.accept(0)
+    assert window.accept(63)
+    assert not window.accept(0)
+    assert window.accept(1)
+    assert window.accept(64)
+    # 0 saiu da janela; 1 continua marcado
+    assert not window.accept(1)
+    assert window.bitmap.bit_length() <= 64
+
+
+def test_reset():
+    window = ReplayWindow(16)
+    assert window.accept(1000)
+    window.reset()
+    assert window.accept(0)
+    assert window.accept(1000)
+
+
+def test_invalid_size():
+    with pytest.raises(ValueError):
+        ReplayWindow(0)
@@ -0,0 +1,211 @@
+import asyncio
+import logging
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import protocol
+from client import SecureMessagingClient
+from crypto import RSASignature
+from protocol import (
+    ClientHandshake, ServerHandshake, HandshakeResponse, ResumeResponse, SessionTicketKeys,
+    EXT_COMPRESSION, EXT_SESSION_TICKET, encode_extensions, resume_salt
+)
+from server import SecureMessagingServer
+
+logging.disable(logging.CRITICAL)
+
+RSA = RSASignature()
+CLIENT_ID = bytes(range(16))
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # Relógio só do protocol: emissão, rotação e validade dos tickets
+    now = SimpleNamespace(value=1_000_000.0)
+    monkeypatch.setattr(protocol, "time", SimpleNamespace(time=lambda: now.value))
+    return now
+
+
+def full_handshake(server, offered=b''):
+    client = ClientHandshake(CLIENT_ID, offered)
+    pk = client.get_initial_message()[-33:]
+    ecdhe = server.new_key_exchange()
+    response = server.generate_handshake_response(CLIENT_ID, pk, ecdhe)
+    _, _, secret = server.derive_session_secrets(pk, response.salt, ecdhe)
+    # Como o servidor responde a um hello estendido com EXT_SESSION_TICKET
+    response.extended = True
+    server.attach_ticket(response, CLIENT_ID, secret)
+    client.process_handshake_response(HandshakeResponse.from_bytes(response.to_bytes()), RSA.get_public_key_pem())
+    return client, response
+
+
+def resume(server, ticket, secret, offered=b'', accepted=b''):
+    client = ClientHandshake(CLIENT_ID, offered)
+    client.get_resume_message(ticket)
+    resumed = server.resume_session(CLIENT_ID, client.client_nonce, ticket, accepted, offered)
+    if resumed is None:
+        return None
+    response, key_c2s, key_s2c = resumed
+    keys = client.process_resume_response(ResumeResponse.from_bytes(response.to_bytes()), secret)
+    assert keys == (key_c2s, key_s2c)
+    return client, response
+
+
+def test_ticket_round_trip(clock):
+    server = ServerHandshake(RSA, SessionTicketKeys(ticket_lifetime=600))
+    client, response = full_handshake(server)
+    assert response.session_ticket and response.ticket_lifetime == 600
+
+    # Cada retomada devolve um ticket novo, com segredo novo, que também retoma
+    ticket, secret = response.session_ticket, client.resumption_secret
+    for _ in range(3):
+        client, resumed = resume(server, ticket, secret)
+        assert resumed.session_ticket != ticket and client.resumption_secret != secret
+        ticket, secret = resumed.session_ticket, client.resumption_secret
+
+
+def test_ticket_bound_to_client_id(clock):
+    keys = SessionTicketKeys()
+    ticket = keys.issue(CLIENT_ID, b's' * 32)
+    assert keys.open(CLIENT_ID, ticket) == b's' * 32
+    assert keys.open(bytes(16), ticket) is None
+    assert keys.open(CLIENT_ID, ticket[:-1] + bytes((ticket[-1] ^ 1,))) is None
+
+
+def test_expired_ticket(clock):
+    server = ServerHandshake(RSA, SessionTicketKeys(ticket_lifetime=60, rotation_interval=3600))
+    client, response = full_handshake(server)
+    clock.value += 59
+    assert resume(server, response.session_ticket, client.resumption_secret) is not None
+    clock.value += 2
+    assert resume(server, response.session_ticket, client.resumption_secret) is None
+
+
+def test_rotated_ticket_key(clock):
+    keys = SessionTicketKeys(ticket_lifetime=100, rotation_interval=50)
+    ticket = keys.issue(CLIENT_ID, b's' * 32)
+
+    # Depois da rotação o ticket antigo ainda abre com a chave anterior
+    clock.value += 60
+    fresh = keys.issue(CLIENT_ID, b't' * 32)
+    assert fresh[:4] != ticket[:4]
+    assert keys.open(CLIENT_ID, ticket) == b's' * 32
+
+    # A chave antiga sai quando nenhum ticket dela pode estar válido
+    clock.value += 100
+    keys.rotate()
+    assert keys.open(CLIENT_ID, ticket) is None
+
+
+def test_rotated_ticket_key_shared_secret(clock):
+    # Com segredo mestre, outro processo aceita o ticket até o fim da validade
+    issuer = SessionTicketKeys(ticket_lifetime=100, rotation_interval=50, master_secret=b'm' * 32)
+    ticket = issuer.issue(CLIENT_ID, b's' * 32)
+    clock.value += 75
+    other = SessionTicketKeys(ticket_lifetime=100, rotation_interval=50, master_secret=b'm' * 32)
+    assert other._current_id != ticket[:4]
+    assert other.open(CLIENT_ID, ticket) == b's' * 32
+    assert SessionTicketKeys(master_secret=b'x' * 32).open(CLIENT_ID, ticket) is None
+
+
+def test_extensions_bound_into_resume_salt():
+    nonces = os.urandom(32), os.urandom(32)
+    offered = encode_extensions({EXT_COMPRESSION: b'abcd', EXT_SESSION_TICKET: b''})
+    accepted = encode_extensions({EXT_COMPRESSION: b'abcd'})
+    # Sem extensões o salt é o original
+    assert resume_salt(*nonces, b'', b'') == nonces[0] + nonces[1]
+    salts = {
+        resume_salt(*nonces, offered, accepted),
+        resume_salt(*nonces, offered, b''),
+        resume_salt(*nonces, b'', accepted),
+        resume_salt(*nonces, b'', b''),
+    }
+    assert len(salts) == 4
+
+
+def test_tampered_extensions_diverge_keys(clock):
+    server = ServerHandshake(RSA, SessionTicketKeys())
+    client, response = full_handshake(server)
+    offered = encode_extensions({EXT_COMPRESSION: b'abcd'})
+
+    handshake = ClientHandshake(CLIENT_ID, offered)
+    handshake.get_resume_message(response.session_ticket)
+    # O servidor viu outra oferta (alterada no caminho): as chaves não batem
+    resumed, key_c2s, key_s2c = server.resume_session(
+        CLIENT_ID, handshake.client_nonce, response.session_ticket, b'', b''
+    )
+    keys = handshake.process_resume_response(
+        ResumeResponse.from_bytes(resumed.to_bytes()), client.resumption_secret
+    )
+    assert keys != (key_c2s, key_s2c)
+
+
+def test_plain_response_keeps_legacy_layout():
+    response = HandshakeResponse(b'p' * 33, b'cert', b'sig', b's' * 32, 3600, b'ticket', b'')
+    data = response.to_bytes()
+    # Layout original: o salt termina a resposta
+    assert data.endswith(b's' * 32)
+    parsed = HandshakeResponse.from_bytes(data)
+    assert not parsed.extended and parsed.session_ticket == b''
+
+    response.extended = True
+    parsed = HandshakeResponse.from_bytes(response.to_bytes())
+    assert parsed.extended and parsed.session_ticket == b'ticket' and parsed.salt == b's' * 32
+
+
+async def start_server(**kwargs):
+    server = SecureMessagingServer(handshake_executor="inline", ecdhe_pool_size=0, **kwargs)
+    listener = await asyncio.start_server(server.handle_client, "127.0.0.1", 0)
+    return server, listener, listener.sockets[0].getsockname()[1]
+
+
+def make_client(server, port, **kwargs):
+    return SecureMessagingClient(
+        "c", server_port=port, server_cert_path=None,
+        server_fingerprints=[server.rsa_signature.key_material.fingerprint], **kwargs
+    )
+
+
+def test_ticket_only_when_requested():
+    async def run():
+        server, listener, port = await start_server()
+        plain, tickets = make_client(server, port), make_client(server, port, session_tickets=True)
+        assert await plain.connect() and await tickets.connect()
+        assert plain.session_ticket is None
+        assert tickets.session_ticket is not None
+        for client in (plain, tickets):
+            client.writer.close()
+        listener.close()
+
+    asyncio.run(run())
+
+
+def test_resume_and_fallback_to_full_handshake():
+    async def run():
+        server, listener, port = await start_server()
+        client = make_client(server, port, session_tickets=True)
+        assert await client.connect()
+        client.writer.close()
+        assert await client.connect()
+        assert (server.full_handshakes, server.resumed_handshakes) == (1, 1)
+
+        # Chaves de ticket trocadas no servidor: ticket recusado, handshake
+        # completo na mesma conexão e um ticket novo para a próxima
+        client.writer.close()
+        server.handshake.ticket_keys._keys.clear()
+        server.handshake.ticket_keys.rotate()
+        assert await client.connect()
+        assert (server.full_handshakes, server.resumed_handshakes) == (2, 1)
+        assert client.session_ticket is not None
+        client.writer.close()
+        assert await client.connect()
+        assert server.resumed_handshakes == 2
+        client.writer.close()
+        listener.close()
+
+    asyncio.run(run())
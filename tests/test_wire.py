@@ -0,0 +1,161 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from crypto import AESGCMCipher
+from framing import FrameDecoder
+from protocol import MessageCrypto, CHUNK_HEADER, CONTROL_FLAG, STREAM_CHUNK_FLAG, SEQ_MASK, counter_nonce
+from wire import (
+    CompactFrameEncoder, CompactFrameDecoder, MAX_HANDLES, COMPACT_CONTROL,
+    encode_varint, decode_varint, compact_header, compact_frame_size
+)
+
+CLIENT = b'c' * 16
+PEERS = [bytes((i,)) * 16 for i in range(1, 8)]
+CIPHER = AESGCMCipher(os.urandom(16))
+
+
+def wire(encoder, frames):
+    return b''.join(b''.join(encoder.encode(frame)) for frame in frames)
+
+
+def decode_bytewise(decoder, data):
+    # Um byte por vez: todo ponto de corte de cada campo
+    frames = []
+    for i in range(len(data)):
+        frames.extend(decoder.feed(data[i:i + 1]))
+    return frames
+
+
+@pytest.mark.parametrize("value", [0, 1, 127, 128, 300, 16383, 16384, 2 ** 32, SEQ_MASK, 2 ** 63 - 1])
+def test_varint_round_trip(value):
+    data = encode_varint(value)
+    assert decode_varint(data + b'\xff', 0) == (value, len(data))
+    with pytest.raises(IndexError):
+        decode_varint(data[:-1], 0)
+
+
+def test_varint_too_long():
+    with pytest.raises(ValueError):
+        decode_varint(b'\xff' * 10 + b'\x01', 0)
+
+
+def test_server_to_client_round_trip():
+    # Servidor: o par de cada frame é o remetente, o handle nasce no primeiro frame dele
+    encoder = CompactFrameEncoder(server_side=True)
+    decoder = CompactFrameDecoder(CLIENT, {}, server_side=False)
+    frames = []
+    for seq, sender in enumerate([PEERS[0], PEERS[1], PEERS[0], PEERS[1]]):
+        frames.append(MessageCrypto.encrypt_message(CIPHER, sender, CLIENT, seq, b'msg %d' % seq, counter=True))
+    frames.append(MessageCrypto.encrypt_chunk(
+        CIPHER, PEERS[0], CLIENT, 4, CHUNK_HEADER.pack(9, 0, 0), b'pedaco', counter=True
+    ))
+    frames.append(MessageCrypto.encrypt_control(CIPHER, 5, b'\x02ping', counter=True))
+    frames.append(MessageCrypto.encrypt_message(CIPHER, PEERS[2], CLIENT, 6000, b'x' * 300, counter=True))
+
+    sizes = [len(b''.join(encoder.encode(frame))) for frame in frames]
+    assert encoder.handles == {PEERS[0]: 1, PEERS[1]: 2, PEERS[2]: 3}
+    # Com o handle ligado o id completo não vai mais no frame
+    assert sizes[2] == sizes[0] - 16
+
+    encoder = CompactFrameEncoder(server_side=True)
+    decoded = decode_bytewise(decoder, wire(encoder, frames))
+    assert decoder.handles == {1: PEERS[0], 2: PEERS[1], 3: PEERS[2]}
+    assert [(f.sender_id, f.recipient_id, f.seq_no) for f in decoded] == [
+        (f.sender_id, f.recipient_id, f.seq_no) for f in frames
+    ]
+    assert decoded[4].seq_no & STREAM_CHUNK_FLAG and decoded[5].seq_no & CONTROL_FLAG
+    assert MessageCrypto.decrypt_message(CIPHER, decoded[0]) == b'msg 0'
+    assert MessageCrypto.decrypt_chunk(CIPHER, decoded[4]) is not None
+    assert MessageCrypto.decrypt_message(CIPHER, decoded[5]) == b'\x02ping'
+    assert MessageCrypto.decrypt_message(CIPHER, decoded[6]) == b'x' * 300
+    assert all(len(b''.join(CompactFrameEncoder(True).encode(f))) <= compact_frame_size(f) for f in frames)
+
+
+def test_client_to_server_handles():
+    # Cliente: id completo até o servidor anunciar o handle (CONTROL_HANDLE)
+    client_handles = {}
+    server_handles = {}
+    encoder = CompactFrameEncoder(server_side=False, handles=client_handles)
+    decoder = CompactFrameDecoder(CLIENT, server_handles, server_side=True)
+
+    first = MessageCrypto.encrypt_message(CIPHER, CLIENT, PEERS[0], 0, b'um', counter=True)
+    [frame] = decoder.feed(wire(encoder, [first]))
+    assert frame.recipient_id == PEERS[0] and frame.sender_id == CLIENT
+    # O decodificador do servidor não aprende handles dos frames do cliente
+    assert server_handles == {}
+
+    server_handles[7] = PEERS[0]
+    client_handles[PEERS[0]] = 7
+    second = MessageCrypto.encrypt_message(CIPHER, CLIENT, PEERS[0], 1, b'dois', counter=True)
+    data = wire(encoder, [second])
+    assert len(data) == len(wire(CompactFrameEncoder(False), [second])) - 16
+    [frame] = decoder.feed(data)
+    assert frame.recipient_id == PEERS[0]
+    assert MessageCrypto.decrypt_message(CIPHER, frame) == b'dois'
+
+
+def test_unknown_handle_dropped():
+    decoder = CompactFrameDecoder(CLIENT, {}, server_side=True)
+    body = b'z' * 20
+    data = bytes(compact_header(0, 3, 5, None, len(body))) + body
+    control = MessageCrypto.encrypt_control(CIPHER, 4, b'\x02', counter=True)
+    data += wire(CompactFrameEncoder(True), [control])
+    frames = decoder.feed(data)
+    assert decoder.unknown_handles == 1
+    assert [frame.seq_no for frame in frames] == [4 | CONTROL_FLAG]
+
+
+def test_max_handles():
+    encoder = CompactFrameEncoder(server_side=True, max_handles=2)
+    decoder = CompactFrameDecoder(CLIENT, {}, server_side=False, max_handles=2)
+    frames = [
+        MessageCrypto.encrypt_message(CIPHER, PEERS[i % 3], CLIENT, i, b'%d' % i, counter=True)
+        for i in range(6)
+    ]
+    decoded = decoder.feed(wire(encoder, frames))
+    # Acima do limite o terceiro par segue com o id completo (handle 0) em todo frame
+    assert encoder.handles == {PEERS[0]: 1, PEERS[1]: 2}
+    assert decoder.handles == {1: PEERS[0], 2: PEERS[1]}
+    assert [frame.sender_id for frame in decoded] == [PEERS[i % 3] for i in range(6)]
+    assert MAX_HANDLES == CompactFrameEncoder(True).max_handles
+
+
+@pytest.mark.parametrize("data", [
+    # Flag desconhecida
+    bytes((0x80, 1, 0, 0)),
+    # seq acima de SEQ_MASK
+    bytes((COMPACT_CONTROL,)) + encode_varint(SEQ_MASK + 1) + b'\x00',
+    # Tamanho acima do limite
+    bytes((COMPACT_CONTROL, 1)) + encode_varint(1 << 20),
+    # Varint do seq longo demais
+    bytes((COMPACT_CONTROL,)) + b'\xff' * 10 + b'\x01\x00',
+])
+def test_malformed_header(data):
+    decoder = CompactFrameDecoder(CLIENT, {}, server_side=False, max_frame_size=1 << 16)
+    with pytest.raises(ValueError):
+        decoder.feed(data)
+
+
+def test_partial_frame_waits():
+    decoder = CompactFrameDecoder(CLIENT, {}, server_side=False)
+    frame = MessageCrypto.encrypt_message(CIPHER, PEERS[0], CLIENT, 200, b'y' * 200, counter=True)
+    data = wire(CompactFrameEncoder(True), [frame])
+    assert decoder.feed(data[:-1]) == []
+    [decoded] = decoder.feed(data[-1:])
+    assert MessageCrypto.decrypt_message(CIPHER, decoded) == b'y' * 200
+
+
+def test_v1_nonce_stays_random():
+    # v1 leva o nonce no fio: continua aleatório; só o v2 o deriva do seq
+    first = MessageCrypto.encrypt_message(CIPHER, PEERS[0], CLIENT, 1, b'a')
+    second = MessageCrypto.encrypt_message(CIPHER, PEERS[0], CLIENT, 1, b'a')
+    assert first.nonce != second.nonce and counter_nonce(1) not in (first.nonce, second.nonce)
+    assert MessageCrypto.encrypt_message(CIPHER, PEERS[0], CLIENT, 1, b'a', counter=True).nonce == counter_nonce(1)
+
+    [decoded] = FrameDecoder().feed(b''.join(first.to_wire_parts()))
+    assert decoded.nonce == first.nonce
+    assert MessageCrypto.decrypt_message(CIPHER, decoded) == b'a'